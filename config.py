@@ -6,19 +6,55 @@ LOG_STDOUT = False
 # ============================= ADS ============================================ #
 ADS_API_TOKEN = "<secret>"
 ADS_API_URL = "https://dev.adsabs.harvard.edu/v1"
+# Timeouts (in seconds) for connecting to and reading from the ADS API
+ADS_API_CONNECT_TIMEOUT = 10
+ADS_API_READ_TIMEOUT = 300
+# Maximum number of (keep-alive) connections to the ADS API
+ADS_API_POOL_SIZE = 10
+# Maximum rate (requests per second) and burst size of requests to the ADS API
+ADS_API_RATE = 5
+ADS_API_BURST = 10
+# Number of ADS API queries executed concurrently
+ADS_API_WORKERS = 5
+# The ledger of all API calls in a run is written to this directory, and the slowest calls are listed
+LEDGER_DIRECTORY = '/tmp/reports/ledger'
+LEDGER_TOP_N = 10
+# Manifests with the fingerprint of the inputs of each report are written to this directory;
+# a report is not created again (nor uploaded) as long as its inputs do not change. Reports
+# are always created if empty
+MANIFEST_DIRECTORY = ""
+# Run the API queries for the summary and missing publications reports from an event loop
+ADS_API_ASYNC = False
+# Number of result pages of large queries retrieved in parallel (by start offset);
+# with 1, pages are retrieved one after the other using Solr cursors
+ADS_API_PAGE_WORKERS = 1
+# Directory for caching ADS API responses on disk (no caching if empty), the time-to-live
+# (in seconds) of cached responses and the maximum size (in MB) of the cache
+ADS_API_CACHE = ""
+ADS_API_CACHE_TTL = 86400
+ADS_API_CACHE_SIZE = 500
 CLASSIC_FULLTEXT_INDEX = "/tmp/all.links"
 CLASSIC_USAGE_INDEX = {
     'reads':'/tmp/reads.links',
     'downloads':'/tmp/downloads.links'
 }
+# Directory for persisted aggregates of the Classic index files (empty: next to the index files)
+CLASSIC_INDEX_CACHE = ""
 ADS_STATS_DATA = "/stats"
 ADS_RECORD_STATS_YEAR = "records_agg_year.tsv"
 ADS_RECORD_STATS_VOLUME = "records_agg_volume.tsv"
+# Directory for binary sidecar files of the stats data (empty: next to the stats files)
+ADS_STATS_CACHE = ""
+# Maximum number of statistics cubes (one per set of journals and aggregation) kept in memory
+STATS_CUBE_CACHE_SIZE = 32
 ADS_PUBLISHER_DATA = "/config/publisher_bibstem.dat"
 ADS_COMPLETENESS_DATA = "/config/completeness_export.json"
 ADS_BIBSTEMS = "bibstems.dat"
 # The root of the output location
 OUTPUT_DIRECTORY = '/tmp/reports'
+# Local address on which the report service (run.py --serve) accepts requests
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
 # ============================= APPLICATION ==================================== #
 # 
 # Core collections we are reporting on
@@ -107,6 +143,9 @@ SUMMARY_ROWS = {
 # For these collections we need to skip the calculation of usage
 # (because it would involve retrieving all bibcodes)
 SKIP_USAGE = ['HP_AST', 'PS_AST']
+# Get all record counts (total, full text, Open Access, data links, refereed) for the summary report
+# from a single facet query per collection, instead of one facet query per count
+SUMMARY_FACET_QUERIES = True
 # For reports by publication year, this is the default start year
 DEFAULT_START_YEAR = 1997
 # For these publications (bibstem) the volume is treated as volume. This dictionary lists the start year
@@ -3,8 +3,12 @@ import argparse
 import datetime
 import sys
 import os
+import atexit
 
 from xreport import tasks
+from xreport import service
+from xreport.client import query_memo
+from xreport.ledger import query_ledger
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -21,6 +25,21 @@ logger = setup_logging('run.py', proj_home=proj_home,
 
 # =============================== FUNCTIONS ======================================= #
 
+def save_ledger():
+    """
+    Write the ledger of API calls made during this run and list the slowest calls
+    """
+    if not query_ledger.entries:
+        return
+    name = 'api_calls_{0}'.format(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    try:
+        json_file, csv_file = query_ledger.save(config.get('LEDGER_DIRECTORY'), name)
+    except Exception as err:
+        logger.error('Unable to write ledger of API calls: {0}'.format(err))
+    else:
+        print('Ledger of API calls written to {0} and {1}'.format(json_file, csv_file))
+    print(query_ledger.summary(config.get('LEDGER_TOP_N', 10)))
+
 collmap = {
     'AST':'Astrophysics',
     'PS': 'Planetary Science',
@@ -48,6 +67,20 @@ if __name__ == '__main__':
                         help='List of all collections')
     parser.add_argument('-n', '--no-drive', action='store_true', dest='no_drive',
                         help='Skip uploading reports to Google Drive')
+    parser.add_argument('-r', '--refresh', action='store_true',
+                        help='Ignore cached API responses (new responses are cached)')
+    parser.add_argument('-nc', '--no-cache', action='store_true', dest='no_cache',
+                        help='Do not use the API response cache')
+    parser.add_argument('-F', '--force', action='store_true',
+                        help='Create reports even if their inputs did not change since they were last created')
+    parser.add_argument('-j', '--jobs', default=1, type=int, dest='jobs',
+                        help='Number of worker processes for creating all reports (with --all or --topics)')
+    parser.add_argument('-d', '--dag', action='store_true',
+                        help='Create all reports (with --all or --topics) as a graph of shared stages, run by --jobs worker threads, and print the critical path')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a service creating reports on request, with all input data kept in memory')
+    parser.add_argument('-p', '--port', default=None, type=int, dest='port',
+                        help='Port for the report service (default: SERVICE_PORT)')
     args = parser.parse_args()
 
     # Determine the type of reporting: by volume or by year. If by year, set the start year
@@ -62,6 +95,10 @@ if __name__ == '__main__':
         for coll, name in config.get('TOPIC_SETS').items():
             print('{0}\t{1}'.format(coll, name))
         sys.exit()
+    if args.serve:
+        # Every request gets current API results: the query memo is not used in service mode
+        service.serve(config, port=args.port)
+        sys.exit()
     if args.collection not in config.get('COLLECTIONS') and not args.all and not args.topics:
         sys.exit('Please specify one of the following values for the collection parameter: {}'.format(config.get('COLLECTIONS')))
     if args.topics and not args.subject:
@@ -72,32 +109,40 @@ if __name__ == '__main__':
         sys.exit('Please specify one of the following values for the subject parameter: {}'.format(config.get('SUBJECTS')))
     if args.format.lower() == 'curators' and args.subject.lower() != 'fulltext':
         sys.exit('The "curators" format only supports the "fulltext" report')
-    if args.all:
-        for coll in config.get('COLLECTIONS'):
-            for subject in ['FULLTEXT', 'REFERENCES', 'METADATA', 'REFCOVERAGE']:
-                try:
-                    report = tasks.create_report(collection=coll, format=args.format, subject=subject, use_year=use_year, no_drive=args.no_drive)
-                except:
-                    logger.error('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(subject, args.format, coll, error))
-                    sys.exit('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(subject, args.format, coll, error))
-    elif args.topics:
-        for coll, name in config.get('TOPIC_SETS').items():
-            if args.format.lower() != 'curators':
-                try:
-                    report = tasks.create_report(collection=coll, format="general", subject=args.subject, use_year=use_year, no_drive=args.no_drive)
-                except Exception as error:
-                    logger.error('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(args.subject, "general", coll, error))
-                    sys.exit('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(args.subject, "general", coll, error))
-            else:
-                 try:
-                     report = tasks.create_report(collection=coll, format="CURATORS", subject="FULLTEXT", use_year=use_year, no_drive=args.no_drive)
-                 except:
-                     logger.error('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(subject, "CURATORS", coll, error))
-                     sys.exit('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(subject, "CURATORS", coll, error))
+    # Within this run, identical API queries are sent only once
+    query_memo.start()
+    # Keep track of all API calls, and report on them at the end of the run
+    query_ledger.start()
+    atexit.register(save_ledger)
+    if args.all or args.topics:
+        # Compile the list of reports to create
+        report_args = {'use_year':use_year, 'no_drive':args.no_drive, 'refresh':args.refresh, 'no_cache':args.no_cache, 'force':args.force}
+        jobs = []
+        if args.all:
+            for coll in config.get('COLLECTIONS'):
+                for subject in ['FULLTEXT', 'REFERENCES', 'METADATA', 'REFCOVERAGE']:
+                    jobs.append(dict(collection=coll, format=args.format, subject=subject, **report_args))
+        else:
+            for coll, name in config.get('TOPIC_SETS').items():
+                if args.format.lower() != 'curators':
+                    jobs.append(dict(collection=coll, format="general", subject=args.subject, **report_args))
+                else:
+                    jobs.append(dict(collection=coll, format="CURATORS", subject="FULLTEXT", **report_args))
+        # Create the reports (in parallel, if requested) and report on all failures at the end
+        if args.dag:
+            failures, graph = tasks.sweep_reports(jobs, workers=args.jobs)
+            print(graph.summary())
+        else:
+            failures = tasks.create_reports(jobs, processes=args.jobs)
+        for job, error in failures:
+            logger.error('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(job['subject'], job['format'], job['collection'], error))
+            print('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(job['subject'], job['format'], job['collection'], error))
+        if failures:
+            sys.exit('{0} out of {1} reports failed'.format(len(failures), len(jobs)))
     else:
         try:
             coll = collmap.get(args.collection, args.collection)
-            report = tasks.create_report(collection=coll, format=args.format, subject=args.subject, use_year=use_year, no_drive=args.no_drive)
+            report = tasks.create_report(collection=coll, format=args.format, subject=args.subject, use_year=use_year, no_drive=args.no_drive, refresh=args.refresh, no_cache=args.no_cache, force=args.force)
         except Exception as error:
             logger.error('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(args.subject, args.format, args.collection, error))
             sys.exit('Creating "{0}" report for "{1}" on collection "{2}" failed: {3}'.format(args.subject, args.format, args.collection, error))
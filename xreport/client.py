@@ -0,0 +1,294 @@
+import os
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# =============================== RATE LIMITER ==================================== #
+class RateLimiter(object):
+    """
+    Token bucket limiting the rate of requests: tokens are added at a fixed rate
+    (requests per second), up to a maximum (the burst size), and every request
+    takes one token. Shared by all threads using the same API client.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        Initializes the token bucket (full)
+
+        param: rate: number of requests per second (no limit if zero or None)
+        param: burst: maximum number of requests sent without waiting
+        """
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        # Rate (requests per second) that keeps us within the quota reported by the API
+        self.quota_rate = None
+        # Until when (monotonic clock) all requests are on hold
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token from the bucket, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate = min(r for r in [self.rate, self.quota_rate, float('inf')] if r)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif rate == float('inf'):
+                    return
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Put all requests on hold for a number of seconds (e.g. when the API asks us to back off)
+
+        param: seconds: number of seconds to wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            # No burst of requests when the pause is over
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.paused_until)
+
+    def set_quota(self, remaining, reset):
+        """
+        Update the rate limit with the API quota. When the quota is almost used up, the remaining
+        requests are spread over the time until the quota is reset; when it has been used up,
+        all requests are put on hold until then
+
+        param: remaining: number of requests remaining in the quota
+        param: reset: number of seconds until the quota is reset
+        """
+        reset = max(reset, 1)
+        if remaining <= 0:
+            self.pause(reset)
+        with self._lock:
+            if remaining < self.capacity:
+                self.quota_rate = max(remaining, 1) / reset
+            else:
+                self.quota_rate = None
+# =============================== HELPER FUNCTIONS ================================ #
+def _retry_after(headers):
+    """
+    Get the number of seconds to wait from a Retry-After header (in seconds or as HTTP date).
+    Returns None if there is no (valid) header
+
+    param: headers: response headers
+    """
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def _rate_limit(headers):
+    """
+    Get the remaining number of requests and the number of seconds until the quota
+    is reset from the X-RateLimit headers. Returns None if there are no (valid) headers
+
+    param: headers: response headers
+    """
+    try:
+        remaining = int(headers['X-RateLimit-Remaining'])
+        # The reset time is given in epoch seconds
+        reset = float(headers['X-RateLimit-Reset']) - time.time()
+    except (KeyError, TypeError, ValueError):
+        return None
+    return remaining, reset
+# =============================== QUERY MEMO ====================================== #
+class QueryMemo(object):
+    """
+    Memo of API responses for the duration of a run. Identical queries that are
+    issued concurrently are sent just once (single-flight) and repeated queries
+    are served from memory. The memo is only used between start() and stop()
+    """
+    def __init__(self):
+        self.enabled = False
+        # Responses, keyed on query
+        self._results = {}
+        # Futures for queries in flight, keyed on query
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start using the memo (with an empty memo)
+        """
+        with self._lock:
+            self.enabled = True
+            self._results = {}
+
+    def stop(self):
+        """
+        Stop using the memo and remove all responses
+        """
+        with self._lock:
+            self.enabled = False
+            self._results = {}
+
+    def get(self, key, func):
+        """
+        Return the response for a query: from memory, from the identical query in flight,
+        or by sending the query
+
+        param: key: string identifying the query
+        param: func: function (without arguments) that sends the query
+        """
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+            future = self._pending.get(key)
+            sender = future is None
+            if sender:
+                future = Future()
+                self._pending[key] = future
+        if not sender:
+            return future.result()
+        try:
+            result = func()
+        except Exception as err:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            if self.enabled:
+                self._results[key] = result
+            del self._pending[key]
+        future.set_result(result)
+        return result
+
+# The memo shared by all queries in this process
+query_memo = QueryMemo()
+# =============================== API CLIENT ====================================== #
+class APIClient(object):
+    """
+    Client for the ADS API (essentially, any API defined by config values) that
+    keeps a pool of keep-alive connections, so that consecutive queries do not
+    each need a new TCP connection and TLS handshake
+    """
+    def __init__(self, conf):
+        """
+        Initializes the client
+
+        param: conf: dictionary with configuration values
+        """
+        self.base_url = conf['ADS_API_URL']
+        # Timeouts (in seconds) for establishing a connection and for reading the response
+        self.timeout = (conf.get('ADS_API_CONNECT_TIMEOUT', 10), conf.get('ADS_API_READ_TIMEOUT', 300))
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": "Bearer {}".format(conf['ADS_API_TOKEN']),
+            "Accept": "application/json"
+        })
+        # The maximum number of connections kept open per host
+        pool_size = conf.get('ADS_API_POOL_SIZE', 10)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Requests are limited to stay within the ADS API quota (shared with other processes, if any)
+        rate = conf.get('ADS_API_RATE', 5)
+        if rate:
+            rate = float(rate) / _rate_share
+        self.limiter = RateLimiter(rate, max(conf.get('ADS_API_BURST', 10) // _rate_share, 1))
+
+    def get(self, url):
+        """
+        Send a GET request using the connection pool
+
+        param: url: the full URL of the request
+        """
+        self.limiter.acquire()
+        r = self.session.get(url, timeout=self.timeout)
+        # Let all requests in this process slow down together, based on what the API tells us
+        rate_limit = _rate_limit(r.headers)
+        if rate_limit:
+            self.limiter.set_quota(*rate_limit)
+        if r.status_code in (429, 503):
+            retry_after = _retry_after(r.headers)
+            if retry_after:
+                self.limiter.pause(retry_after)
+        return r
+
+    def close(self):
+        """
+        Close all connections in the pool
+        """
+        self.session.close()
+
+# API clients, keyed on process and API settings
+_clients = {}
+_clients_lock = threading.Lock()
+# Number of processes sharing the API rate limit
+_rate_share = 1
+
+def set_rate_share(processes):
+    """
+    Share the API rate limit with other processes: the API clients created in this
+    process get an equal share of the configured rate and burst size
+
+    param: processes: number of processes sending API requests
+    """
+    global _rate_share
+    _rate_share = max(int(processes), 1)
+
+def get_client(conf):
+    """
+    Return the API client shared by all queries in this process
+    (for the API and settings defined by the config values)
+
+    param: conf: dictionary with configuration values
+    """
+    # Connections cannot be shared with child processes, hence the process id in the key
+    key = (os.getpid(), conf['ADS_API_URL'], conf['ADS_API_TOKEN'],
+           conf.get('ADS_API_CONNECT_TIMEOUT', 10), conf.get('ADS_API_READ_TIMEOUT', 300),
+           conf.get('ADS_API_POOL_SIZE', 10), conf.get('ADS_API_RATE', 5), conf.get('ADS_API_BURST', 10), _rate_share)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = APIClient(conf)
+        return _clients[key]
+
+# Thread pools for running blocking API calls from an event loop, keyed on process and pool size
+_executors = {}
+
+def get_executor(conf):
+    """
+    Return the thread pool that runs the API calls of async callers in this process.
+    It has one worker per connection in the connection pool of the API client
+
+    param: conf: dictionary with configuration values
+    """
+    key = (os.getpid(), conf.get('ADS_API_POOL_SIZE', 10))
+    with _clients_lock:
+        if key not in _executors:
+            _executors[key] = ThreadPoolExecutor(max_workers=key[1], thread_name_prefix='xreport-api')
+        return _executors[key]
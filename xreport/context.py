@@ -0,0 +1,157 @@
+import os
+import json
+import threading
+from xreport.utils import _file_signature
+from xreport.stats import stats_store
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# ============================= REPORT CONTEXT ==================================== #
+class ReportContext(object):
+    """
+    The input data shared by all reports: bibstems, publishers, metadata completeness
+    data and the ADS statistics. Each input is loaded when it is first needed, and only
+    reloaded when its file has changed (modification time or size), so that creating
+    many reports just filters data already in memory
+    """
+    def __init__(self, conf):
+        """
+        Initializes the context
+
+        param: conf: dictionary with configuration values
+        """
+        self.conf = conf
+        # Loaded data and the file signature (mtime, size) it was loaded from, keyed on config variable
+        self._data = {}
+        self._signatures = {}
+        self._lock = threading.Lock()
+
+    def _load(self, config_key, loader):
+        """
+        Return the data from the file specified by a config variable, (re)loading it if needed
+
+        param: config_key: config variable holding the full path of the data file
+        param: loader: function reading the data file
+        """
+        data_file = self.conf[config_key]
+        signature = _file_signature(data_file)
+        with self._lock:
+            if self._signatures.get(config_key) != signature:
+                logger.info('Loading {0}'.format(data_file))
+                self._data[config_key] = loader(data_file)
+                self._signatures[config_key] = signature
+            return self._data[config_key]
+
+    def get_bibstems(self):
+        """
+        Return the set of bibstems (without periods) of all journals currently in the system
+        """
+        return self._load('ADS_BIBSTEMS', _read_bibstems)
+
+    def get_publishers(self):
+        """
+        Return the map from bibstem (without periods) to publisher
+        """
+        return self._load('ADS_PUBLISHER_DATA', _read_publishers)
+
+    def get_completeness(self):
+        """
+        Return the metadata completeness data from the Journals Database, keyed on bibstem
+        """
+        return self._load('ADS_COMPLETENESS_DATA', _read_completeness)
+
+    def get_cube(self, field, journals):
+        """
+        Return the statistics cube for a set of journals, aggregated by year or volume
+
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        return stats_store.get_cube(self.conf, field, journals)
+
+    def get_stats_checksum(self, field, journals):
+        """
+        Return a checksum of the statistics for a set of journals, aggregated by year or volume
+
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        return stats_store.checksum(self.conf, field, journals)
+
+    def clear(self):
+        """
+        Remove all loaded data
+        """
+        with self._lock:
+            self._data = {}
+            self._signatures = {}
+
+# Contexts, keyed on the input files
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+def get_context(conf):
+    """
+    Return the report context shared by all reports in this process
+    (for the input files defined by the config values)
+
+    param: conf: dictionary with configuration values
+    """
+    key = (conf.get('ADS_BIBSTEMS'), conf.get('ADS_PUBLISHER_DATA'), conf.get('ADS_COMPLETENESS_DATA'),
+           conf.get('ADS_STATS_DATA'), conf.get('ADS_RECORD_STATS_YEAR'), conf.get('ADS_RECORD_STATS_VOLUME'))
+    with _contexts_lock:
+        if key not in _contexts:
+            _contexts[key] = ReportContext(conf)
+        return _contexts[key]
+# =============================== HELPER FUNCTIONS ================================ #
+def _read_bibstems(data_file):
+    """
+    Read the bibstems of all journals (type 'R' or 'J') from the bibstems file
+
+    param: data_file: full path of the bibstems file
+    """
+    bibstems = set()
+    with open(data_file) as stems_file:
+        for line in stems_file:
+            fields = line.strip().split('\t')
+            if len(fields) == 3 and fields[1] in ['R','J']:
+                bibstems.add(fields[0].replace('.',''))
+    # Add ApJ Letters to bibstems
+    bibstems.add('ApJL')
+    return bibstems
+
+def _read_publishers(data_file):
+    """
+    Read the map from bibstem to publisher
+
+    param: data_file: full path of the publisher data file
+    """
+    stem2publisher = {}
+    with open(data_file) as fh:
+        for line in fh:
+            try:
+                bibstem, pname = line.strip().split('\t')
+            except:
+                continue
+            stem2publisher[bibstem.replace('.','')] = pname
+    return stem2publisher
+
+def _read_completeness(data_file):
+    """
+    Read the metadata completeness data, keyed on bibstem (the first entry is used
+    if a bibstem occurs more than once)
+
+    param: data_file: full path of the completeness data file (JSON)
+    """
+    with open(data_file) as json_file:
+        completeness_data = json.load(json_file)
+    index = {}
+    for entry in completeness_data:
+        index.setdefault(entry['bibstem'], entry)
+    return index
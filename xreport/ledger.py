@@ -0,0 +1,114 @@
+import os
+import csv
+import json
+import threading
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# The fields recorded for every API call
+LEDGER_FIELDS = ['time', 'endpoint', 'fingerprint', 'query', 'source', 'latency', 'qtime',
+                 'num_found', 'bytes', 'retries', 'report', 'collection', 'error']
+# =============================== QUERY LEDGER ==================================== #
+class QueryLedger(object):
+    """
+    Ledger of all API calls during a run: what was queried, by which report, and how
+    long it took (wall time and Solr query time). Calls are only recorded between
+    start() and stop()
+    """
+    def __init__(self):
+        self.enabled = False
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start recording API calls (with an empty ledger)
+        """
+        with self._lock:
+            self.enabled = True
+            self.entries = []
+
+    def stop(self):
+        """
+        Stop recording API calls
+        """
+        with self._lock:
+            self.enabled = False
+
+    def record(self, entry):
+        """
+        Add an API call to the ledger
+
+        param: entry: dictionary with (a subset of) the ledger fields
+        """
+        with self._lock:
+            if self.enabled:
+                self.entries.append({field: entry.get(field) for field in LEDGER_FIELDS})
+
+    def extend(self, entries):
+        """
+        Add API calls recorded elsewhere (e.g. in a worker process) to the ledger
+
+        param: entries: list of ledger entries
+        """
+        with self._lock:
+            if self.enabled:
+                self.entries.extend(entries)
+
+    def slowest(self, n=10):
+        """
+        Return the n API calls with the largest latency
+
+        param: n: number of calls to return
+        """
+        with self._lock:
+            entries = list(self.entries)
+        return sorted(entries, key=lambda e: e['latency'] or 0, reverse=True)[:n]
+
+    def save(self, outdir, name):
+        """
+        Write the ledger to a JSON file and a CSV file. Returns the paths of both files
+
+        param: outdir: directory to write the files to
+        param: name: name of the files (without extension)
+        """
+        with self._lock:
+            entries = list(self.entries)
+        os.makedirs(outdir, exist_ok=True)
+        json_file = "{0}/{1}.json".format(outdir, name)
+        with open(json_file, 'w') as fh:
+            json.dump(entries, fh, indent=1)
+        csv_file = "{0}/{1}.csv".format(outdir, name)
+        with open(csv_file, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=LEDGER_FIELDS)
+            writer.writeheader()
+            writer.writerows(entries)
+        return json_file, csv_file
+
+    def summary(self, n=10):
+        """
+        Return a printable overview of the ledger, with the n slowest API calls
+
+        param: n: number of calls to list
+        """
+        with self._lock:
+            entries = list(self.entries)
+        sent = [e for e in entries if e['source'] == 'api']
+        lines = ['API calls: {0} ({1} sent, {2} from cache, {3} from memo), total latency {4:.1f}s'.format(
+            len(entries), len(sent), len([e for e in entries if e['source'] == 'cache']),
+            len([e for e in entries if e['source'] == 'memo']), sum(e['latency'] or 0 for e in sent))]
+        lines.append('Slowest {0} API calls:'.format(n))
+        lines.append('latency\tqtime\tnumFound\tretries\treport\tcollection\tquery')
+        for e in self.slowest(n):
+            lines.append('{0:.2f}s\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}'.format(
+                e['latency'] or 0, e['qtime'], e['num_found'], e['retries'], e['report'], e['collection'], e['query']))
+        return '\n'.join(lines)
+
+# The ledger shared by all queries in this process
+query_ledger = QueryLedger()
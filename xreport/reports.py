@@ -4,17 +4,35 @@ import os
 import sys
 import glob
 import json
+import itertools
+import asyncio
+import hashlib
+import openpyxl
 from xreport.utils import _get_facet_data
 from xreport.utils import _get_citations
-from xreport.utils import _get_usage
+from xreport.utils import _get_query_counts
+from xreport.utils import _get_usage_totals
+from xreport.utils import _sum_usage
 from xreport.utils import _get_records
+from xreport.utils import _get_fulltext_counts
+from xreport.utils import _run_async
+from xreport.utils import _get_facet_data_async
+from xreport.utils import _get_records_async
 #from xreport.utils import _get_journal_coverage
 from xreport.utils import _string2list
 from xreport.utils import _upload_to_teamdrive
 from xreport.utils import _add_hyperlinks
+from xreport.utils import _file_signature
+from xreport.utils import _code_version
+from xreport.context import get_context
 from datetime import datetime
 from datetime import date
 from operator import itemgetter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# The fields retrieved for publications without full text
+MISSING_FIELDS = 'bibcode,doi,title,first_author_norm,volume,issue'
 
 class JournalsDatabaseException(Exception):
     pass
@@ -23,9 +41,13 @@ class Report(object):
     """
 
     """
-    def __init__(self, config={}):
+    def __init__(self, config={}, context=None):
         """
         Initializes the class
+
+        param: config: dictionary with configuration values (overriding the default ones)
+        param: context: the input data shared by reports (ReportContext); by default the
+                        context shared by all reports in this process
         """
         # ============================= INITIALIZATION ==================================== #
         from xreport.compat import setup_logging, load_config
@@ -33,6 +55,7 @@ class Report(object):
         self.config = load_config(proj_home=proj_home)
         if config:
             self.config = {**self.config, **config}
+        self.context = context or get_context(self.config)
         self.logger = setup_logging(__name__, proj_home=proj_home,
                                 level=self.config.get('LOGGING_LEVEL', 'INFO'),
                                 attach_stdout=self.config.get('LOG_STDOUT', False))
@@ -40,6 +63,17 @@ class Report(object):
         self.dstring = datetime.today().strftime('%Y%m%d')
         now = datetime.now()
         self.current_year = now.year
+        # All files written by save_report and save_missing
+        self.output_files = []
+        # Reports written by save_report, waiting to be uploaded to Google Drive: (collection, folder, file)
+        self.uploads = []
+        # Fingerprint of the report inputs and the manifest (file name and contents) recording it
+        self.fingerprint = None
+        self.manifest = None
+        # Fingerprint of the inputs of the report being made (it becomes the fingerprint when complete)
+        self._input_fingerprint = None
+        # The journals the statistics cubes are built for (set by make_report)
+        self.cube_journals = []
     # ============================= MAIN FUNCTIONALITY ================================ #
     def make_report(self, collection, report_type):
         """
@@ -48,27 +82,33 @@ class Report(object):
         param: collection: collection of publications to create report for
         param: report_type: specification of report type
         """
-        # Get all bibstems currently in system
-        self.bibstems = []
-        with open(self.config['ADS_BIBSTEMS']) as stems_file:
-            for line in stems_file:
-                fields = line.strip().split('\t')
-                if len(fields) == 3 and fields[1] in ['R','J']:
-                    self.bibstems.append(fields[0].replace('.',''))
-        # Add ApJ Letters to bibstems
-        self.bibstems.append('ApJL')
+        # API queries are recorded in the query ledger with the report and collection
+        self.config['LEDGER_REPORT'] = self.__class__.__name__
+        self.config['LEDGER_COLLECTION'] = collection
+        # The fingerprint of the inputs is recorded in the manifest written by save_report (if manifests
+        # are used), but only once all report data have been gathered (see _complete_report)
+        self.fingerprint = None
+        self._input_fingerprint = None
+        if self.config.get('MANIFEST_DIRECTORY'):
+            self._input_fingerprint = self._get_fingerprint(collection, report_type)
+        # Get all bibstems currently in system (including ApJ Letters)
+        self.bibstems = self.context.get_bibstems()
         # Which journals (i.e. bibstems) make up the collection under consideration
         try:
-            self.journals = self.config['JOURNALS'][collection]
+            journals = list(self.config['JOURNALS'][collection])
         except Exception as err:
             msg = "Unable to find journals for collection: {} (Exception: {})".format(collection, err)
             self.logger.error(msg)
             raise
-        # Remove all journals not in current bibstem list
-        for j in self.journals:
+        # Remove all journals not in current bibstem list. The journals list is a copy: the lists in
+        # the config are shared by all reports (also those made at the same time, in other threads)
+        for j in journals:
             if j not in self.bibstems:
                 self.logger.info("Removing {0} from journals list: not in bibstems".format(j))
-                self.journals.remove(j)
+        self.journals = [j for j in journals if j in self.bibstems]
+        # The statistics cubes are built for this set of journals (also after journals without records
+        # have been removed), so that all reports for the collection share the same cubes
+        self.cube_journals = list(self.journals)
         # Get a map from bibstem to publisher
         self._get_publishers()
         # Initialize statistics and publisher data structure
@@ -129,10 +169,9 @@ class Report(object):
             # We have journals without records: remove them from the journals list
             for j in empty_journals:
                 self.logger.info("Removing {0} from journals list: no records found".format(j))
-                self.journals.remove(j)
-        # Store metadata completeness data
-        with open(self.config['ADS_COMPLETENESS_DATA']) as json_file:
-            self.completeness_data = json.load(json_file)
+            self.journals = [j for j in self.journals if j not in empty_journals]
+        # Store metadata completeness data (keyed on bibstem)
+        self.completeness_data = self.context.get_completeness()
         # Record all journals/volumes for which full text, references or metadata coverage
         # needs to be skipped
         self._get_skip_volumes()
@@ -151,7 +190,7 @@ class Report(object):
         outdir = "{0}/{1}/{2}/{3}".format(self.config['OUTPUT_DIRECTORY'], report_type, collection, output_folder)
         # Make sure the directory exists
         if not os.path.exists(outdir):
-            os.makedirs(outdir)
+            os.makedirs(outdir, exist_ok=True)
         # See if we can get a WoS subject for collection (if the collection is a "topic")
         # We will keep the collection name if no such mapping is found
         ## fname = config.get('ASJC2WOS').get(collection, collection)
@@ -220,6 +259,8 @@ class Report(object):
                 if outputdata:
                     output_frame = pd.DataFrame(outputdata)
                     output_frame.style.applymap(self._highlight_cells).to_excel(output_file, engine='openpyxl', index=False, header=False, freeze_panes=(1,1))
+        if output_file and os.path.exists(output_file):
+            self.output_files.append(output_file)
         if output_file and os.path.exists(output_file) and collection != 'ES':
             if subject.lower() == 'fulltext':
                 try:
@@ -231,11 +272,159 @@ class Report(object):
                     res = _add_hyperlinks(output_file, query_modifier='-has:reference')
                 except Exception as err:
                     self.logger.error("Failed to add hyperlinks to refcoverage report {0}: {1}".format(output_file, err))
+            # The report is uploaded right away, unless Google Drive upload is skipped (or left to the caller)
+            self.uploads.append((collection, output_folder.lower(), output_file))
             if not self.config.get('NO_DRIVE', False):
-                try:
-                    res = _upload_to_teamdrive(collection,output_folder.lower(),output_file)
-                except Exception as err:
-                    self.logger.error("Failed to upload report {0} to Team Drive: {1}".format(os.path.basename(output_file), err))
+                self.upload_reports()
+        self._save_manifest(collection, report_type, subject)
+
+    def upload_reports(self):
+        """
+        Upload the reports written by save_report, that have not been uploaded yet, to Google Drive.
+        Reports that fail to upload stay in the list of reports waiting to be uploaded
+        """
+        failed = []
+        while self.uploads:
+            collection, folder, output_file = self.uploads.pop(0)
+            try:
+                res = _upload_to_teamdrive(collection, folder, output_file)
+            except Exception as err:
+                self.logger.error("Failed to upload report {0} to Team Drive: {1}".format(os.path.basename(output_file), err))
+                failed.append((collection, folder, output_file))
+        self.uploads = failed
+        # Record the uploads in the manifest, if it was written already
+        if self.manifest:
+            manifest_file, manifest = self.manifest
+            manifest['uploads'] = self.uploads
+            self._write_manifest(manifest_file, manifest)
+
+    def is_unchanged(self, collection, report_type, subject):
+        """
+        Check whether the report was created before from the same inputs, according to its manifest
+        (and its files still exist). If so, the report does not need to be created again: the files
+        are listed in output_files, and the files not uploaded yet in uploads
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        param: subject: specification of type data to create report for
+        """
+        if not self.config.get('MANIFEST_DIRECTORY'):
+            return False
+        fingerprint = self._get_fingerprint(collection, report_type)
+        if not fingerprint:
+            return False
+        manifest_file = self._manifest_file(collection, report_type, subject)
+        try:
+            with open(manifest_file) as fh:
+                manifest = json.load(fh)
+        except (IOError, ValueError):
+            return False
+        if manifest.get('fingerprint') != fingerprint:
+            return False
+        if not manifest['output_files'] or not all(os.path.exists(f) for f in manifest['output_files']):
+            return False
+        self.fingerprint = fingerprint
+        self.output_files = manifest['output_files']
+        self.uploads = [tuple(upload) for upload in manifest['uploads']]
+        self.manifest = (manifest_file, manifest)
+        return True
+
+    def _complete_report(self):
+        """
+        Mark the report data as complete: as last step of make_report, so that a report that failed
+        to be made does not get a manifest (and is not skipped on the next run)
+        """
+        self.fingerprint = self._input_fingerprint
+
+    def _get_fingerprint(self, collection, report_type):
+        """
+        Return the fingerprint (checksum) of the inputs of the report, or None if the report
+        cannot be fingerprinted (e.g. because it is based on API queries)
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        """
+        try:
+            inputs = self._fingerprint_inputs(collection, report_type)
+        except Exception as err:
+            self.logger.warning("Unable to determine the inputs of the report for collection {0}: {1}".format(collection, err))
+            return None
+        if inputs is None:
+            return None
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _fingerprint_inputs(self, collection, report_type):
+        """
+        Return the inputs determining the contents of the report: the statistics for the journals
+        of the collection, the publishers and bibstems of these journals, the relevant config values
+        and the code version. Returns None if the report cannot be fingerprinted
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        """
+        journals = list(self.config['JOURNALS'][collection])
+        bibstems = self.context.get_bibstems()
+        publishers = self.context.get_publishers()
+        return {
+            'report': self.__class__.__name__,
+            'collection': collection,
+            'use_year': self.use_year,
+            'current_year': self.current_year,
+            'journals': journals,
+            'bibstems': [j for j in journals if j in bibstems],
+            'publishers': [publishers.get(j, 'NA') for j in journals],
+            'config': {key: self.config.get(key) for key in ['NO_FULLTEXT', 'NO_REFERENCES', 'NO_METADATA', 'YEAR_IS_VOL', 'SOURCES']},
+            'stats_year': self.context.get_stats_checksum('year', journals),
+            'stats_volume': self.context.get_stats_checksum('volume', journals),
+            'code_version': _code_version(),
+        }
+
+    def _manifest_file(self, collection, report_type, subject):
+        """
+        Return the full path of the manifest of the report
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        param: subject: specification of type data to create report for
+        """
+        aggregation = 'year' if self.use_year else 'volume'
+        return "{0}/{1}_{2}_{3}_{4}.{5}.json".format(self.config['MANIFEST_DIRECTORY'], self.__class__.__name__,
+            report_type, subject, collection.replace(' ','_'), aggregation)
+
+    def _save_manifest(self, collection, report_type, subject):
+        """
+        Write the manifest of the report: the fingerprint of its inputs, the files written
+        and the files not uploaded yet
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        param: subject: specification of type data to create report for
+        """
+        if not self.fingerprint or not self.output_files or not self.config.get('MANIFEST_DIRECTORY'):
+            return
+        manifest_file = self._manifest_file(collection, report_type, subject)
+        manifest = {
+            'fingerprint': self.fingerprint,
+            'created': datetime.now().isoformat(),
+            'output_files': self.output_files,
+            'uploads': self.uploads
+        }
+        self.manifest = (manifest_file, manifest)
+        self._write_manifest(manifest_file, manifest)
+
+    def _write_manifest(self, manifest_file, manifest):
+        """
+        Write a manifest to file
+
+        param: manifest_file: full path of the manifest
+        param: manifest: the contents of the manifest
+        """
+        try:
+            os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+            with open(manifest_file, 'w') as fh:
+                json.dump(manifest, fh, indent=1)
+        except Exception as err:
+            self.logger.error("Failed to write manifest {0}: {1}".format(manifest_file, err))
     #
     def save_missing(self, collection, report_type, subject):
         """
@@ -250,23 +439,24 @@ class Report(object):
         # Make sure the directory exists
         if not os.path.exists(outdir):
             os.makedirs(outdir, exist_ok=True)
-        # Transform the data generated in the make_report method:
-        # generate a data structure so that we can create a Pandas frame
+        # The spreadsheet rows for the data generated in the make_report method
         header = []
         # Add header rows
         header.append(['bibcode','DOI','volume','issue','first author','title'])
         for journal in self.journals:
-            if len((self.missing[journal])) == 0:
+            # The missing publications are consumed as they are retrieved
+            entries = iter(self.missing[journal])
+            first_entry = next(entries, None)
+            if first_entry is None:
                 continue
             # Generate the name of the output file, including full path
             output_file = "{0}/{1}_{2}_{3}.xlsx".format(outdir, subject.lower(), journal.replace('.','').strip(), self.dstring)
-            outputdata = []
-            outputdata += header
-            try:
-                entries = sorted(self.missing[journal], key=lambda x: int(itemgetter('volume')(x)))
-            except:
-                entries = self.missing[journal]
-            for entry in entries:
+            # Rows are written to the spreadsheet one by one, so that not all data needs to be kept in memory
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet('Sheet1')
+            for row in header:
+                ws.append(row)
+            for entry in itertools.chain([first_entry], entries):
                 row = []
                 row.append(entry.get('bibcode','NA'))
                 row.append(entry.get('doi',['NA'])[0])
@@ -274,76 +464,44 @@ class Report(object):
                 row.append(entry.get('issue','NA'))
                 row.append(entry.get('first_author_norm','NA'))
                 row.append(entry.get('title',['NA'])[0])
-                outputdata.append(row)
-            if outputdata:
-                output_frame = pd.DataFrame(outputdata)
-                output_frame.to_excel(output_file, engine='openpyxl', index=False, header=False)
+                ws.append(row)
+            wb.save(output_file)
+            self.output_files.append(output_file)
+
+    def _get_cube(self, field):
+        """
+        Get the statistics cube for the journals of the collection (or, if make_report did not set
+        them, for the journals list). The cube may contain journals that are no longer in the journals
+        list (because they have no records): the data are always selected for the journals in the list
+
+        param: field: aggregation of the statistics ('year' or 'volume')
+        """
+        return self.context.get_cube(field, self.cube_journals or self.journals)
 
     def _get_publishers(self):
         """
         For a set of publishers, get their associated publisher
         """
-        self.stem2publisher = {}
-        with open(self.config['ADS_PUBLISHER_DATA']) as fh:
-            for line in fh:
-                try:
-                    bibstem, pname = line.strip().split('\t')
-                except:
-                    continue
-                self.stem2publisher[bibstem.replace('.','')] = pname
+        self.stem2publisher = self.context.get_publishers()
 
     def _get_publication_data(self):
         """
         For a set of journals, get some basic publication data
         
         """
-        ## Dataframe with data by volume
-        # Location of publication data aggregated by volume
-        data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_VOLUME'])
-        # Read in volume data and filter on current journals
-        vol_df = pd.read_csv(data_file, sep='\t')
-#        # Remove all entries where the volume contains a letter
-#        pattern = r'[a-zA-Z]'
-#        mask = vol_df['volume'].str.contains(pattern, na=False)
-#        vol_df = vol_df[~mask]
-        # Remove periods from bibstems
-        first_col = vol_df.columns[0]
-        vol_df[first_col] = vol_df[first_col].astype(str).str.replace('.', '', regex=False)
-        # Remove periods from volume entries
-        second_col = vol_df.columns[1]
-        vol_df[second_col] = vol_df[second_col].astype(str).str.replace('.', '', regex=False)
-        # Now filter by journals
-        vol_df = vol_df[vol_df['bibstem'].isin(self.journals)]
-#        # Remove all entries where the volume contains a letter
-#        pattern = r'[a-zA-Z]'
-#        mask = vol_df['volume'].str.contains(pattern, na=False)
-#        vol_df = vol_df[~mask]
-        # Make sure the volumes are integers
-        vol_df['volume'] = vol_df['volume'].astype(int)
-        ## Dataframe with data by year
-        # Location of publication data aggregated by year
-        data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_YEAR'])
-        # Read in year data and filter on current journals
-        year_df = pd.read_csv(data_file, sep='\t')
-        # Remove periods from bibstems
-        first_col = year_df.columns[0]
-        year_df[first_col] = year_df[first_col].astype(str).str.replace('.', '', regex=False)
-        # Filter by journals
-        year_df = year_df[year_df['bibstem'].isin(self.journals)]
-        # Compile required data dictionaries for all journals
-        results = {}
+        # Publication data aggregated by volume and by year, for all current journals at once
+        vol_cube = self._get_cube('volume')
+        year_cube = self._get_cube('year')
+        year_ranges = year_cube.ranges()
+        vol_ranges = vol_cube.ranges()
+        if self.use_year:
+            pubdata = year_cube.values('record_count')
+        else:
+            pubdata = vol_cube.values('record_count')
         for journal in self.journals:
-            self.statsdata[journal]['startyear'] = year_df[year_df['bibstem'] == journal]['year'].min()
-            self.statsdata[journal]['lastyear'] = year_df[year_df['bibstem'] == journal]['year'].max()
-            self.statsdata[journal]['startvol'] = vol_df[vol_df['bibstem'] == journal]['volume'].min()
-            self.statsdata[journal]['lastvol'] = vol_df[vol_df['bibstem'] == journal]['volume'].max()
-            if self.use_year:
-                jdata = year_df[year_df['bibstem'] == journal]
-                res = dict(zip(jdata['year'], jdata['record_count']))
-            else:
-                jdata = vol_df[vol_df['bibstem'] == journal]
-                res = dict(zip(jdata['volume'], jdata['record_count']))
-            self.statsdata[journal]['pubdata'] = res
+            self.statsdata[journal]['startyear'], self.statsdata[journal]['lastyear'] = year_ranges.get(journal, (np.nan, np.nan))
+            self.statsdata[journal]['startvol'], self.statsdata[journal]['lastvol'] = vol_ranges.get(journal, (np.nan, np.nan))
+            self.statsdata[journal]['pubdata'] = pubdata.get(journal, {})
     #
     def _get_publication_data_api(self):
         """
@@ -357,25 +515,46 @@ class Report(object):
             art_dict = _get_facet_data(self.config, query, 'volume')
             # Also, get the number of records per year
             year_dict = _get_facet_data(self.config, query, 'year')
-            # Update journal statistics
-            # The first and most recent publication years
-            try:
-                self.statsdata[journal]['lastyear'] = max(year_dict.keys())
-                self.statsdata[journal]['startyear'] = min(year_dict.keys())
-            except:
-                continue
-            # The first and most recent volumes
-            try:
-                self.statsdata[journal]['lastvol'] = max(art_dict.keys())
-                self.statsdata[journal]['startvol'] = min(art_dict.keys())
-            except:
-                continue
-            # The number of publications per volume or year, to be used later
-            # for normalization
-            if self.use_year:
-                self.statsdata[journal]['pubdata'] = year_dict
-            else:
-                self.statsdata[journal]['pubdata'] = art_dict
+            self._store_publication_data(journal, art_dict, year_dict)
+
+    async def _get_publication_data_api_async(self):
+        """
+        Async variant of _get_publication_data_api: the queries for all journals are executed concurrently
+        
+        """
+        queries = ['bibstem:"{0}" doctype:(article OR inproceedings)'.format(journal) for journal in self.journals]
+        results = await asyncio.gather(*[asyncio.gather(_get_facet_data_async(self.config, query, 'volume'),
+                                                        _get_facet_data_async(self.config, query, 'year')) for query in queries])
+        for journal, (art_dict, year_dict) in zip(self.journals, results):
+            self._store_publication_data(journal, art_dict, year_dict)
+
+    def _store_publication_data(self, journal, art_dict, year_dict):
+        """
+        Store the publication data for a journal
+
+        param: journal: the journal (bibstem)
+        param: art_dict: dictionary with the number of records per volume
+        param: year_dict: dictionary with the number of records per year
+        """
+        # Update journal statistics
+        # The first and most recent publication years
+        try:
+            self.statsdata[journal]['lastyear'] = max(year_dict.keys())
+            self.statsdata[journal]['startyear'] = min(year_dict.keys())
+        except:
+            return
+        # The first and most recent volumes
+        try:
+            self.statsdata[journal]['lastvol'] = max(art_dict.keys())
+            self.statsdata[journal]['startvol'] = min(art_dict.keys())
+        except:
+            return
+        # The number of publications per volume or year, to be used later
+        # for normalization
+        if self.use_year:
+            self.statsdata[journal]['pubdata'] = year_dict
+        else:
+            self.statsdata[journal]['pubdata'] = art_dict
 
     def _get_skip_volumes(self):
         """
@@ -432,11 +611,11 @@ class FullTextReport(Report):
     Main engine for gathering and processing data to create
     the full text coverage report 
     """
-    def __init__(self, config={}):
+    def __init__(self, config={}, context=None):
         """
         Initializes the class
         """
-        super(FullTextReport, self).__init__(config=config)
+        super(FullTextReport, self).__init__(config=config, context=context)
 
     def make_report(self, collection, report_type):
         """
@@ -452,10 +631,12 @@ class FullTextReport(Report):
         elif report_type == "curators":
             # First generate a full tex index
             self._get_fulltext_index()
-            self._get_fulltext_data_classic('publisher')
-            self._get_fulltext_data_classic('arxiv')
+            self._get_fulltext_data_classic()
+        elif self.config.get('ADS_API_ASYNC', False):
+            asyncio.run(self._get_missing_publications_async())
         else:
             self._get_missing_publications()
+        self._complete_report()
 
     def save_report(self, collection, report_type, subject):
         """
@@ -467,143 +648,129 @@ class FullTextReport(Report):
         """
         super(FullTextReport, self).save_report(collection, report_type, subject)
 
+    def _fingerprint_inputs(self, collection, report_type):
+        """
+        Add the report type and, for curators reports, the Classic full text index to the inputs
+        of the report. Reports with missing publications are based on API queries
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        """
+        if report_type not in ['general', 'curators']:
+            return None
+        inputs = super(FullTextReport, self)._fingerprint_inputs(collection, report_type)
+        inputs['report_type'] = report_type
+        if report_type == 'curators':
+            inputs['fulltext_index'] = _file_signature(self.config['CLASSIC_FULLTEXT_INDEX'])
+        return inputs
+
     def _get_fulltext_index(self):
         """
         Initializes the class and prepares a (temporary) lookup facility for
         curators reporting. This lookup facility will be replaced by an API
         query eventually
         """
-        fulltext_links = self.config.get("CLASSIC_FULLTEXT_INDEX")
-        # Compile a list of journals to generate the lookup facility for
-        include = [element for sublist in self.config.get("JOURNALS").values() for element in sublist]
-        # This variable will hold the data to generate the Pandas frame
-        data = []
-        # Name of the coumn in the Pandas data frame that stores the "key"
-        if self.use_year:
-            key_column = 'year'
-        else:
-            key_column = 'volume'
-        # Gather all required data. The Pandas data frame will allow the following query:
-        # provide all full text sources for a given journal and volume combination, from which will
-        # follow how many records have full text from arXiv and how many from the publisher (which
-        # are the numbers we are after)
-        with open(fulltext_links) as fh:
-            for line in fh:
-                bibcode, ftfile, source = line.strip().split('\t')
-                bibstem = bibcode[4:9]
-                if bibstem not in include:
-                    continue
-                # If we report per journal volume, we do not want tmp bibcodes
-                if bibcode[9:13].replace('.','') == 'tmp' and not self.use_year:
-                    continue
-                # Whether we report by year or volume, we use the same variable
-                try:
-                    if self.use_year:
-                        data_key = int(bibcode[0:4])
-                    else:
-                        data_key  = int(bibcode[9:13].replace('.',''))
-                except:
-                    self.logger.info("Processing Classic fulltext index. Cannot get year or volume for: {0}. Skipping...".format(bibcode))
-                    continue
-                if bibstem in self.config.get("YEAR_IS_VOL") and not self.use_year:
-                    data_key = int(bibcode[0:4])
-                letter  = bibcode[13]
-                if bibstem == 'ApJ..' and letter == 'L':
-                    bibstem = 'ApJL'
-                data.append([bibstem, data_key, source.lower()])
-        # The lookup facility is a Pandas dataframe
-        self.ft_index = pd.DataFrame(data, columns=['bibstem',key_column,'source'])
+        # Compile the set of journals to generate the lookup facility for
+        include = set(element for sublist in self.config.get("JOURNALS").values() for element in sublist)
+        # The lookup facility is a count index, keyed on journal, volume (or year) and source
+        # class ('arxiv' or 'publisher'), which will provide the number of records with full
+        # text from arXiv and from the publisher (which are the numbers we are after)
+        self.ft_index = _get_fulltext_counts(self.config, include, use_year=self.use_year)
 
     def _get_fulltext_data_general(self):
         """
         For a set of journals get the fraction of records with fulltext by volume or year
         """
-        # Establish where the data is located
+        # Establish which aggregation of the data to use
         if self.use_year:
-            data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_YEAR'])
             field = 'year'
         else:
-            data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_VOLUME'])
             field = 'volume'
-        # Read the data into a dataframe
-        df = pd.read_csv(data_file, sep='\t')
-        # Remove the periods in the bibstem column
-        first_col = df.columns[0]
-        df[first_col] = df[first_col].astype(str).str.replace('.', '', regex=False)
-        # Keep just those entries with the bibstems of the journals being processed
-        df = df[df['bibstem'].isin(self.journals)]
-        # Dictionary keys (volume or year) are integers, formatted as strings
-        df[field] = df[field].astype(int)
-        df[field] = df[field].astype(str)
-        # Now get the data for each journal
+        # Get the data for the journals being processed
+        cube = self._get_cube(field)
+        # Calculate the fraction of records with fulltext for all journals at once
+        coverage = cube.coverage('records_with_fulltext')
         for journal in self.journals:
-            # Initialize the coverage with 0.0
-            cov_dict = {}
-            for kk in sorted(self.statsdata[journal]['pubdata'].keys()):
-                cov_dict[str(kk)] = 0.0
-            try:
-                jdata = df[df['bibstem'] == journal]
-                # Calculate the fraction of records with fulltext
-                fractions = jdata['records_with_fulltext']/jdata['record_count']
-                # Just in case there were cases with zero records,
-                # replace the "inf" entries by 0
-                fractions = np.where(np.isinf(fractions), 0, fractions)
-                # Store the results as a dictionary
-                cov_dict = dict(zip(jdata[field], fractions))
-            except:
-                pass
-            self.statsdata[journal]['general'] = cov_dict
+            self.statsdata[journal]['general'] = coverage.get(journal, {})
 
     def _get_fulltext_data_general_api(self):
         """
         For a set of journals, get full text data (the number of records with full text per volume)
 
         """
-        # Determine if certain volumes need to be skipped:
         for journal in self.journals:
-            # The ADS query to retrieve all records with full text for a given journal
-            # Filters:
-            # has:body --> get all records with full text indexed
-            # doctype:(article OR inproceedings) --> remove all records indexed as non-articles
-            # author_count:[1 TO *] --> not a good idea (because some historical publications don't have an author)
-            # entdate:[* TO NOW-40DAYS] --> not a good idea in case records get re-indexed
-            query = 'bibstem:"{0}" has:body doctype:(article OR inproceedings)'.format(journal)
             # The query populates a dictionary keyed on volume number, listing the number of records per volume
-            if self.use_year:
-                full_dict = _get_facet_data(self.config, query, 'year')
-            else:
-                full_dict = _get_facet_data(self.config, query, 'volume')
-            # Coverage data is stored in a dictionary
-            cov_dict = {}
-            # Collect volumes to be skipped, if any
+            full_dict = _get_facet_data(self.config, self._fulltext_query(journal), self._fulltext_facet())
+            self._store_fulltext_coverage(journal, full_dict)
+
+    async def _get_fulltext_data_general_api_async(self):
+        """
+        Async variant of _get_fulltext_data_general_api: the queries for all journals are executed concurrently
+
+        """
+        results = await asyncio.gather(*[_get_facet_data_async(self.config, self._fulltext_query(journal), self._fulltext_facet())
+                                         for journal in self.journals])
+        for journal, full_dict in zip(self.journals, results):
+            self._store_fulltext_coverage(journal, full_dict)
+
+    def _fulltext_query(self, journal):
+        """
+        The ADS query to retrieve all records with full text for a given journal
+        Filters:
+        has:body --> get all records with full text indexed
+        doctype:(article OR inproceedings) --> remove all records indexed as non-articles
+        author_count:[1 TO *] --> not a good idea (because some historical publications don't have an author)
+        entdate:[* TO NOW-40DAYS] --> not a good idea in case records get re-indexed
+
+        param: journal: the journal (bibstem)
+        """
+        return 'bibstem:"{0}" has:body doctype:(article OR inproceedings)'.format(journal)
+
+    def _fulltext_facet(self):
+        """
+        The facet for full text data: by year or by volume
+        """
+        if self.use_year:
+            return 'year'
+        return 'volume'
+
+    def _store_fulltext_coverage(self, journal, full_dict):
+        """
+        Store the full text coverage for a journal
+
+        param: journal: the journal (bibstem)
+        param: full_dict: dictionary with the number of records with full text per volume or year
+        """
+        # Coverage data is stored in a dictionary
+        cov_dict = {}
+        # Collect volumes to be skipped, if any
+        try:
+            skip = self.skip_fulltext[journal]
+        except:
+            skip = []
+        for data_key in sorted(self.statsdata[journal]['pubdata'].keys()):
+            if data_key in skip:
+                continue
             try:
-                skip = self.skip_fulltext[journal]
+                frac = float(full_dict[data_key])/float(self.statsdata[journal]['pubdata'][data_key])
             except:
-                skip = []
-            for data_key in sorted(self.statsdata[journal]['pubdata'].keys()):
-                if data_key in skip:
-                    continue
-                try:
-                    frac = float(full_dict[data_key])/float(self.statsdata[journal]['pubdata'][data_key])
-                except:
-                    frac = 0.0
-                if journal in self.config.get("YEAR_IS_VOL") and not self.use_year:
-                    data_key = data_key - self.config.get("YEAR_IS_VOL")[journal] + 1
-                cov_dict[str(data_key)] = frac
-            # Update the global statistics data structure
-            self.statsdata[journal]['general'] = cov_dict
+                frac = 0.0
+            if journal in self.config.get("YEAR_IS_VOL") and not self.use_year:
+                data_key = data_key - self.config.get("YEAR_IS_VOL")[journal] + 1
+            cov_dict[str(data_key)] = frac
+        # Update the global statistics data structure
+        self.statsdata[journal]['general'] = cov_dict
 
-    def _get_fulltext_data_classic(self, ft_source):
+    def _get_fulltext_data_classic(self):
         """
-        For a set of journals, get full text data from Classic
+        For a set of journals, get full text data from Classic, for all sources of full text
         Note: this method will be replaced by API calls once Solr has been updated
-        
-        param: source: source of fulltext
         """
+        ft_sources = self.config['SOURCES']['FULLTEXT']
         self.journals = ['ApJ','A&A','MNRAS']
         for journal in self.journals:
-            # Coverage data is stored in a dictionary
-            cov_dict = {}
+            # Coverage data is stored in a dictionary per source
+            cov_dicts = {ft_source:{} for ft_source in ft_sources}
             # Collect volumes to be skipped, if any
             try:
                 skip = self.skip_fulltext[journal]
@@ -612,42 +779,49 @@ class FullTextReport(Report):
             for data_key in sorted(self.statsdata[journal]['pubdata'].keys()):
                 if data_key in skip:
                     continue
-                # For each volume of the journals in the collection we query the Pandas dataframe to retrieve the sources of full text
-                if ft_source == 'arxiv':
-                    # How many records are there with full text from arXiv?
-                    if self.use_year:
-                        data = self.ft_index.query("bibstem=='{0}' and year=={1} and source=='arxiv'".format(journal, data_key))
-                    else:
-                        data = self.ft_index.query("bibstem=='{0}' and volume=={1} and source=='arxiv'".format(journal, data_key))
-                else:
-                    if self.use_year:
-                        data = self.ft_index.query("bibstem=='{0}' and year=={1} and source!='arxiv'".format(journal, data_key))
-                    else:
-                        data = self.ft_index.query("bibstem=='{0}' and volume=={1} and source!='arxiv'".format(journal, data_key))
-                try:
-                    sources = data['source'].tolist()
-                except Exception as err:
-                    self.logger.error('Source lookup in Classic index blew up for journal {0}, year/volume {1}: {2}'.format(journal, data_key, err))
-                    sources = []
-                try:
-                    frac = float(len(sources))/float(self.statsdata[journal]['pubdata'][data_key])
-                except:
-                    frac = 0.0
+                report_key = data_key
                 if journal in self.config.get("YEAR_IS_VOL") and not self.use_year:
-                    data_key = data_key - self.config.get("YEAR_IS_VOL")[journal] + 1
-                cov_dict[str(data_key)] = round(100*frac,1)
-            self.statsdata[journal][ft_source] = cov_dict
+                    report_key = data_key - self.config.get("YEAR_IS_VOL")[journal] + 1
+                for ft_source in ft_sources:
+                    # For each volume of the journals in the collection we look up the number of
+                    # records with full text from this source in the count index
+                    nrecs = self.ft_index[(journal, data_key, ft_source)]
+                    try:
+                        frac = float(nrecs)/float(self.statsdata[journal]['pubdata'][data_key])
+                    except:
+                        frac = 0.0
+                    cov_dicts[ft_source][str(report_key)] = round(100*frac,1)
+            for ft_source in ft_sources:
+                self.statsdata[journal][ft_source] = cov_dicts[ft_source]
 
     def _get_missing_publications(self):
         """
         For a set of journals, find the publications without fulltext
         """
         for journal in self.journals:
-            # The ADS query to retrieve all records without full text for a given journal
-            query = 'bibstem:"{0}"  -has:body doctype:(article OR inproceedings)'.format(journal)
-            missing_pubs = _get_records(self.config, query, 'bibcode,doi,title,first_author_norm,volume,issue')
+            # The records are retrieved lazily (when the report is saved), sorted by bibcode, which
+            # effectively sorts them by year and volume
+            self.missing[journal] = _get_records(self.config, self._missing_query(journal), MISSING_FIELDS, sort='bibcode asc,id asc')
+
+    async def _get_missing_publications_async(self):
+        """
+        Async variant of _get_missing_publications: the records for all journals are retrieved
+        concurrently (and, unlike with the blocking variant, kept in memory)
+        """
+        async def get_missing(journal):
+            return [doc async for doc in _get_records_async(self.config, self._missing_query(journal), MISSING_FIELDS, sort='bibcode asc,id asc')]
+        results = await asyncio.gather(*[get_missing(journal) for journal in self.journals])
+        for journal, missing_pubs in zip(self.journals, results):
             self.missing[journal] = missing_pubs
 
+    def _missing_query(self, journal):
+        """
+        The ADS query to retrieve all records without full text for a given journal
+
+        param: journal: the journal (bibstem)
+        """
+        return 'bibstem:"{0}"  -has:body doctype:(article OR inproceedings)'.format(journal)
+
 class ReferenceMatchingReport(Report):
     """
     Main engine for gathering and processing data to create
@@ -657,11 +831,11 @@ class ReferenceMatchingReport(Report):
 	containing all the raw reference data; then the time has come
 	to revisit this reporting module.
     """
-    def __init__(self, config={}):
+    def __init__(self, config={}, context=None):
         """
         Initializes the class
         """
-        super(ReferenceMatchingReport, self).__init__(config=config)
+        super(ReferenceMatchingReport, self).__init__(config=config, context=context)
         self._file_prefix = 'refmatches'
         #
     def make_report(self, collection, report_type):
@@ -675,6 +849,7 @@ class ReferenceMatchingReport(Report):
         self._get_reference_data()
         # Generate the matching statistics
         self._get_reference_stats()
+        self._complete_report()
 
     def save_report(self, collection, report_type, subject):
         """
@@ -692,38 +867,29 @@ class ReferenceMatchingReport(Report):
         """
         if self.use_year:
             # We are reporting by year, so retrieve reference data aggregated by year
-            reference_data_file = "{0}/{1}".format(self.config["ADS_STATS_DATA"], self.config["ADS_RECORD_STATS_YEAR"])
+            field = 'year'
         else:
             # We are reporting by volume, so retrieve reference data aggregated by volume
-            reference_data_file = "{0}/{1}".format(self.config["ADS_STATS_DATA"], self.config["ADS_RECORD_STATS_VOLUME"])
-        # Read reference data into a Pandas data frame
-        self.reference_stats = pd.read_csv(reference_data_file, sep='\t')
-        # Remove periods from bibstems
-        self.reference_stats['bibstem'] = self.reference_stats['bibstem'].str.replace('.', '', regex=False)
+            field = 'volume'
+        # Reference data (statistics cube) for the journals being processed
+        self.reference_stats = self._get_cube(field)
 
     def _get_reference_stats(self):
         """
         For a set of journals, get reference matching statistics
         """
-        if self.use_year:
-            key_column = 'year'
-        else:
-            key_column = 'volume'
+        # Only consider rows where there are references to match
+        coverage = self.reference_stats.coverage('matched_reference_count', 'reference_count', skip_empty=True)
         for journal in self.journals:
-            results = self.reference_stats[self.reference_stats['bibstem'] == journal].copy()
-            # Only consider rows where there are references to match
-            results = results[results['reference_count'] > 0]
-            fractions = results['matched_reference_count'] / results['reference_count']
-            res_dict = dict(zip(results[key_column], fractions))
-            self.statsdata[journal]['general'] = {str(key): value for key, value in res_dict.items()}
+            self.statsdata[journal]['general'] = coverage.get(journal, {})
 
 class ReferenceCoverageReport(Report):
     """
     Report showing the percentage of records for which references are available
     from the publisher or Crossref
     """
-    def __init__(self, config={}):
-        super(ReferenceCoverageReport, self).__init__(config=config)
+    def __init__(self, config={}, context=None):
+        super(ReferenceCoverageReport, self).__init__(config=config, context=context)
         self._output_folder = 'REFERENCES'
 
     def make_report(self, collection, report_type):
@@ -733,6 +899,7 @@ class ReferenceCoverageReport(Report):
         """
         super(ReferenceCoverageReport, self).make_report(collection, report_type)
         self._get_refcoverage_data()
+        self._complete_report()
 
     def save_report(self, collection, report_type, subject):
         """
@@ -750,40 +917,24 @@ class ReferenceCoverageReport(Report):
         (from publisher or Crossref) by volume or year
         """
         if self.use_year:
-            data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_YEAR'])
             field = 'year'
         else:
-            data_file = "{0}/{1}".format(self.config['ADS_STATS_DATA'], self.config['ADS_RECORD_STATS_VOLUME'])
             field = 'volume'
-        df = pd.read_csv(data_file, sep='\t')
-        first_col = df.columns[0]
-        df[first_col] = df[first_col].astype(str).str.replace('.', '', regex=False)
-        df = df[df['bibstem'].isin(self.journals)]
-        df[field] = df[field].astype(int)
-        df[field] = df[field].astype(str)
+        cube = self._get_cube(field)
+        coverage = cube.coverage('records_with_references')
         for journal in self.journals:
-            cov_dict = {}
-            for kk in sorted(self.statsdata[journal]['pubdata'].keys()):
-                cov_dict[str(kk)] = 0.0
-            try:
-                jdata = df[df['bibstem'] == journal]
-                fractions = jdata['records_with_references'] / jdata['record_count']
-                fractions = np.where(np.isinf(fractions), 0, fractions)
-                cov_dict = dict(zip(jdata[field], fractions))
-            except Exception:
-                pass
-            self.statsdata[journal]['general'] = cov_dict
+            self.statsdata[journal]['general'] = coverage.get(journal, {})
 
 
 class MetaDataReport(Report):
     """
     Create metadata completeness report 
     """
-    def __init__(self, config={}):
+    def __init__(self, config={}, context=None):
         """
         Initializes the class
         """
-        super(MetaDataReport, self).__init__(config=config)
+        super(MetaDataReport, self).__init__(config=config, context=context)
 
     def make_report(self, collection, report_type):
         """
@@ -793,6 +944,21 @@ class MetaDataReport(Report):
         super(MetaDataReport, self).make_report(collection, report_type)
         # ============================= AUGMENTATION of parent method ================================ #
         self._get_metadata_data()
+        self._complete_report()
+
+    def _fingerprint_inputs(self, collection, report_type):
+        """
+        Add the metadata completeness data for the journals of the collection to the inputs of the report
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        """
+        inputs = super(MetaDataReport, self)._fingerprint_inputs(collection, report_type)
+        completeness_data = self.context.get_completeness()
+        # ApJ Letters are reported from the ApJ entry
+        inputs['completeness'] = [completeness_data.get('ApJ' if j == 'ApJL' else j) for j in inputs['journals']]
+        inputs['start_year'] = self.config['DEFAULT_START_YEAR']
+        return inputs
 
     def save_report(self, collection, report_type, subject):
         """
@@ -819,10 +985,10 @@ class MetaDataReport(Report):
             try:
                 if journal == 'ApJL':
 #                    cov_data = _get_journal_coverage(self.config, 'ApJ')
-                    cov_data  = [e for e in self.completeness_data if e['bibstem'] == 'ApJ'][0]['completeness_details']
+                    cov_data  = self.completeness_data['ApJ']['completeness_details']
                     letter = True
                 else:
-                    cov_data  = [e for e in self.completeness_data if e['bibstem'] == journal][0]['completeness_details']
+                    cov_data  = self.completeness_data[journal]['completeness_details']
 #                    cov_data = _get_journal_coverage(self.config, journal)
             except:
                 self.logger.error('No JournalsDB entry found for {0}'.format(journal))
@@ -871,11 +1037,11 @@ class SummaryReport(Report):
     """
     Create summary report for a specific target audience
     """
-    def __init__(self, config={}):
+    def __init__(self, config={}, context=None):
         """
         Initializes the class
         """
-        super(SummaryReport, self).__init__(config=config)
+        super(SummaryReport, self).__init__(config=config, context=context)
 
     def make_report(self, collection, report_type):
         """
@@ -885,7 +1051,20 @@ class SummaryReport(Report):
         """
         super(SummaryReport, self).make_report(collection, report_type)
         # ============================= AUGMENTATION of parent method ================================ #
-        self._get_summary_stats(report_type)
+        if self.config.get('ADS_API_ASYNC', False):
+            asyncio.run(self._get_summary_stats_async(report_type))
+        else:
+            self._get_summary_stats(report_type)
+        self._complete_report()
+
+    def _fingerprint_inputs(self, collection, report_type):
+        """
+        The summary report is based on API queries, so it cannot be fingerprinted
+
+        param: collection: collection of publications to create report for
+        param: report_type: specification of report type
+        """
+        return None
 
     def save_report(self, collection, report_type, subject):
         """
@@ -928,14 +1107,55 @@ class SummaryReport(Report):
             output_frame = pd.DataFrame(outputdata)
             # Results are written to an Excel file with conditional formatting and first row and column frozen
             output_frame.style.to_excel(output_file, engine='openpyxl', index=False, header=False, freeze_panes=(1,1))
+            self.output_files.append(output_file)
 
     def _get_summary_stats(self, report_type):
         """
         For a set of journals, get some basic publication data
         
+        param: report_type: specification of report type
+        """
+        queries = self._get_summary_queries(report_type)
+        # Execute the queries with a bounded number of workers (the API client limits the request rate)
+        with ThreadPoolExecutor(max_workers=self.config.get('ADS_API_WORKERS', 5)) as executor:
+            futures = [executor.submit(func, self.config, query) for label, stat, func, query in queries]
+            self._store_summary_stats(queries, [future.result() for future in futures])
+
+    async def _get_summary_stats_async(self, report_type):
+        """
+        Async variant of _get_summary_stats: all queries are executed from the event loop
+        
+        param: report_type: specification of report type
+        """
+        queries = self._get_summary_queries(report_type)
+        results = await asyncio.gather(*[_run_async(self.config, func, self.config, query) for label, stat, func, query in queries])
+        self._store_summary_stats(queries, results)
+
+    def _store_summary_stats(self, queries, results):
+        """
+        Store the results of the summary queries
+
+        param: queries: list of (label, statistic, function, query) tuples
+        param: results: list with the result of each query
+        """
+        for (label, stat, func, query), result in zip(queries, results):
+            if stat:
+                self.summarydata[label][stat] = result
+            else:
+                self.summarydata[label].update(result)
+
+    def _get_summary_queries(self, report_type):
+        """
+        Get the API queries for the summary data, as (label, statistic, function, query) tuples,
+        where the function takes the config and query as arguments. Summary data that do not
+        require API queries (i.e. usage data) are stored right away
+        
         param: report_type: specification of report type
         """
         today = date.today()
+        queries = []
+        # Usage totals per journal, compiled from a single pass through each Classic usage index file
+        usage = {}
         for collection in self.config['COLLECTIONS']:
             if collection == 'CORE':
                 continue
@@ -948,47 +1168,47 @@ class SummaryReport(Report):
             if cfilter:
                 query += " {0}".format(cfilter)
             # Get the total number of citations (via pivot query)
-            citnum = _get_citations(self.config, query)
-            self.summarydata[collection]['citnum'] = citnum
+            queries.append((collection, 'citnum', _get_citations, query))
             # Get the number of recent citations (i.e. current year) via facet query
             q = 'citations({0}) year:{1}'.format(query, today.year)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[collection]['recent_citnum'] = results.get(today.year,0)
+            queries.append((collection, 'recent_citnum', partial(self._count_recent_citations, year=today.year), q))
             # Get usage numbers (via Classic index files), first reads, then downloads
             if collection not in self.config['SKIP_USAGE']:
-                reads, recent_reads = _get_usage(self.config, jrnls=journals)
+                if not usage:
+                    usage = {udata:_get_usage_totals(self.config, udata=udata) for udata in ['reads','downloads']}
+                reads, recent_reads = _sum_usage(usage['reads'], journals)
                 self.summarydata[collection]['reads'] = reads
                 self.summarydata[collection]['recent_reads'] = recent_reads
-                downl, recent_downl = _get_usage(self.config, jrnls=journals, udata='downloads')
+                downl, recent_downl = _sum_usage(usage['downloads'], journals)
                 self.summarydata[collection]['downloads'] = downl
                 self.summarydata[collection]['recent_downloads'] = recent_downl
+            # Get the total number of records and the number of records with full text, Open Access,
+            # data links and refereed records, either via a single facet query or one query per count
+            if self.config.get('SUMMARY_FACET_QUERIES', False):
+                queries.append((collection, None, self._count_records_by_property, query))
+                continue
             # Get the total number of records via facet query on publication year
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[collection]['nrecs'] = sum(results.values())
+            queries.append((collection, 'nrecs', self._count_records, query))
             # How many of these records have full text associated with them
             query = 'bibstem:({0}) fulltext_mtime:["1000-01-01t00:00:00.000Z" TO *] doctype:(article OR inproceedings)'.format(" OR ".join(journals))
             if cfilter:
                 query += " {0}".format(cfilter)
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[collection]['ftrecs'] = sum(results.values())
+            queries.append((collection, 'ftrecs', self._count_records, query))
             # How many of these records are Open Access
             query = 'bibstem:({0}) property:openaccess doctype:(article OR inproceedings)'.format(" OR ".join(journals))
             if cfilter:
                 query += " {0}".format(cfilter)
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[collection]['oarecs'] = sum(results.values())
+            queries.append((collection, 'oarecs', self._count_records, query))
             # How many of these records have at least one data link
             query = 'bibstem:({0}) property:data doctype:(article OR inproceedings)'.format(" OR ".join(journals))
             if cfilter:
                 query += " {0}".format(cfilter)
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[collection]['dlrecs'] = sum(results.values())
+            queries.append((collection, 'dlrecs', self._count_records, query))
             # How many of these records are refereed
             query = 'bibstem:({0}) property:refereed doctype:(article OR inproceedings)'.format(" OR ".join(journals))
             if cfilter:
                 query += " {0}".format(cfilter)
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[collection]['refrecs'] = sum(results.values())
+            queries.append((collection, 'refrecs', self._count_records, query))
         for collection in self.config['CONTENT_QUERIES'].keys():
             # Do the same as above for "content queries". These queries are supposed to retrieve
             # sets of recent records representative for each collection, but going beyond just the
@@ -1003,11 +1223,9 @@ class SummaryReport(Report):
             cq = "({0} OR references({1}) OR citations({2}))".format(jq, jq, jq)
             query = self.config['CONTENT_QUERIES'][collection].format(cq)
             # Get the citation numbers
-            citnum = _get_citations(self.config, query)
-            self.summarydata[label]['citnum'] = citnum
+            queries.append((label, 'citnum', _get_citations, query))
             q = "citations({0}) year:{1}".format(query, today.year)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[label]['recent_citnum'] = results.get(today.year,0)
+            queries.append((label, 'recent_citnum', partial(self._count_recent_citations, year=today.year), q))
             # Get usage numbers
             # Currently there is no efficient way to retrieve usage data for large sets
             # of individual records
@@ -1015,22 +1233,64 @@ class SummaryReport(Report):
             self.summarydata[label]['recent_reads'] = "NA"
             self.summarydata[label]['downloads'] = "NA"
             self.summarydata[label]['recent_downloads'] = "NA"
+            if self.config.get('SUMMARY_FACET_QUERIES', False):
+                queries.append((label, None, partial(self._count_records_by_property, doctype=True), query))
+                continue
             # Get the total number of records via facet query on publication year
-            results = _get_facet_data(self.config, query, 'year')
-            self.summarydata[label]['nrecs'] = sum(results.values())
+            queries.append((label, 'nrecs', self._count_records, query))
             # How many of these records have full text associated with them
             q = '{0} fulltext_mtime:["1000-01-01t00:00:00.000Z" TO *] doctype:(article OR inproceedings)'.format(query)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[label]['ftrecs'] = sum(results.values())
+            queries.append((label, 'ftrecs', self._count_records, q))
             # How many of these records are Open Access
             q = '{0} property:openaccess doctype:(article OR inproceedings)'.format(query)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[label]['oarecs'] = sum(results.values())
+            queries.append((label, 'oarecs', self._count_records, q))
             # How many of these records have at least one data link
             q = '{0} property:data doctype:(article OR inproceedings)'.format(query)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[label]['dlrecs'] = sum(results.values())
+            queries.append((label, 'dlrecs', self._count_records, q))
             # How many of these records are refereed
             q = '{0} property:refereed doctype:(article OR inproceedings)'.format(query)
-            results = _get_facet_data(self.config, q, 'year')
-            self.summarydata[label]['refrecs'] = sum(results.values())
+            queries.append((label, 'refrecs', self._count_records, q))
+        return queries
+
+    def _count_records(self, conf, query):
+        """
+        Get the number of records for a query, via facet query on publication year
+
+        param: conf: dictionary with configuration values
+        param: query: the query to count records for
+        """
+        results = _get_facet_data(conf, query, 'year')
+        return sum(results.values())
+
+    def _count_records_by_property(self, conf, query, doctype=False):
+        """
+        Get the total number of records for a query, together with the number of records
+        with full text, Open Access, data links and refereed records, via a single facet query
+
+        param: conf: dictionary with configuration values
+        param: query: the query to count records for
+        param: doctype: only count articles and proceedings papers for the properties if true
+        """
+        # Facet queries are parsed by the standard query parser, so any operators need to be explicit
+        facet_queries = {
+            'ftrecs': 'fulltext_mtime:["1000-01-01T00:00:00.000Z" TO *]',
+            'oarecs': 'property:openaccess',
+            'dlrecs': 'property:data',
+            'refrecs': 'property:refereed'
+        }
+        if doctype:
+            facet_queries = {k: '{0} AND doctype:(article OR inproceedings)'.format(v) for k, v in facet_queries.items()}
+        nrecs, counts = _get_query_counts(conf, query, facet_queries)
+        counts['nrecs'] = nrecs
+        return counts
+
+    def _count_recent_citations(self, conf, query, year):
+        """
+        Get the number of citations in a given (the current) year, via facet query on publication year
+
+        param: conf: dictionary with configuration values
+        param: query: citations query restricted to the given year
+        param: year: the year to count citations for
+        """
+        results = _get_facet_data(conf, query, 'year')
+        return results.get(year, 0)
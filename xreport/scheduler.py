@@ -0,0 +1,189 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# =============================== STAGES ========================================== #
+class Stage(object):
+    """
+    A unit of work in a stage graph: a function (without arguments) that can only
+    run when all of its input stages have completed successfully
+    """
+    def __init__(self, name, func, inputs=()):
+        """
+        Initializes the stage
+
+        param: name: unique name of the stage
+        param: func: function (without arguments) doing the work
+        param: inputs: names of the stages that need to complete first
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        # One of 'pending', 'done', 'failed' or 'skipped' (when an input failed)
+        self.state = 'pending'
+        self.result = None
+        self.error = None
+        # Start and finish time, in seconds since the start of the graph run
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        """
+        Number of seconds the stage took to run (0 if it did not run)
+        """
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+class StageGraph(object):
+    """
+    Directed acyclic graph of stages. A stage shared by several others is added
+    (and run) only once, and stages that do not depend on each other run in parallel
+    """
+    def __init__(self):
+        # Stages, keyed on name (in the order in which they were added)
+        self.stages = {}
+
+    def add(self, name, func, inputs=()):
+        """
+        Add a stage to the graph and return its name. If a stage with this name was
+        added already, the existing stage is kept: that is how stages are shared
+
+        param: name: unique name of the stage
+        param: func: function (without arguments) doing the work
+        param: inputs: names of the stages that need to complete first
+        """
+        if name not in self.stages:
+            self.stages[name] = Stage(name, func, inputs)
+        return name
+
+    def _check(self):
+        """
+        Check that all inputs are stages in the graph and that there are no cycles
+        """
+        for stage in self.stages.values():
+            for name in stage.inputs:
+                if name not in self.stages:
+                    raise ValueError('Stage {0} has unknown input: {1}'.format(stage.name, name))
+        # Remove stages without (remaining) inputs until none are left
+        remaining = {name: set(stage.inputs) for name, stage in self.stages.items()}
+        while remaining:
+            ready = [name for name, inputs in remaining.items() if not inputs]
+            if not ready:
+                raise ValueError('Stage graph has a cycle through: {0}'.format(', '.join(sorted(remaining))))
+            for name in ready:
+                del remaining[name]
+            for inputs in remaining.values():
+                inputs.difference_update(ready)
+
+    def run(self, workers=1):
+        """
+        Run all stages, each as soon as its inputs have completed, with a pool of worker threads.
+        A failed stage does not stop other stages, but the stages depending on it are skipped.
+        Returns the failed and skipped stages as a list of (stage name, error message) pairs
+
+        param: workers: number of worker threads
+        """
+        self._check()
+        dependents = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for name in stage.inputs:
+                dependents[name].append(stage.name)
+        waiting = {name: set(stage.inputs) for name, stage in self.stages.items()}
+        started = time.monotonic()
+        failures = []
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='xreport-stage') as executor:
+            running = {}
+            def submit(name):
+                del waiting[name]
+                future = executor.submit(self._run_stage, self.stages[name], started)
+                running[future] = name
+            def skip(name, error):
+                # Stages depending on a failed stage cannot run, nor can their dependents
+                del waiting[name]
+                stage = self.stages[name]
+                stage.state = 'skipped'
+                stage.error = error
+                failures.append((name, error))
+                for dependent in dependents[name]:
+                    if dependent in waiting:
+                        skip(dependent, 'input {0} failed'.format(name))
+            for name in [name for name, inputs in waiting.items() if not inputs]:
+                submit(name)
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    if stage.state == 'failed':
+                        failures.append((name, stage.error))
+                        for dependent in dependents[name]:
+                            if dependent in waiting:
+                                skip(dependent, 'input {0} failed'.format(name))
+                        continue
+                    for dependent in dependents[name]:
+                        if dependent in waiting:
+                            waiting[dependent].discard(name)
+                            if not waiting[dependent]:
+                                submit(dependent)
+        return failures
+
+    def _run_stage(self, stage, started):
+        """
+        Run a single stage, recording its result (or error) and timing
+
+        param: stage: the stage to run
+        param: started: start time (monotonic clock) of the graph run
+        """
+        stage.started = time.monotonic() - started
+        try:
+            stage.result = stage.func()
+            stage.state = 'done'
+        except Exception as err:
+            logger.error('Stage {0} failed: {1}'.format(stage.name, err))
+            stage.state = 'failed'
+            stage.error = str(err)
+        stage.finished = time.monotonic() - started
+
+    def critical_path(self):
+        """
+        Return the chain of stages that determined the total run time: starting from the
+        stage that finished last, each time the input that finished last
+        """
+        finished = [stage for stage in self.stages.values() if stage.finished is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda s: s.finished)]
+        while True:
+            inputs = [self.stages[name] for name in path[-1].inputs if self.stages[name].finished is not None]
+            if not inputs:
+                break
+            path.append(max(inputs, key=lambda s: s.finished))
+        return list(reversed(path))
+
+    def summary(self):
+        """
+        Return a printable overview of the stage run, with the critical path
+        """
+        stages = list(self.stages.values())
+        path = self.critical_path()
+        total = path[-1].finished if path else 0.0
+        lines = ['Stages: {0} ({1} done, {2} failed, {3} skipped), total time {4:.1f}s'.format(
+            len(stages), len([s for s in stages if s.state == 'done']), len([s for s in stages if s.state == 'failed']),
+            len([s for s in stages if s.state == 'skipped']), total)]
+        lines.append('Critical path:')
+        lines.append('start\tduration\tstage')
+        for stage in path:
+            lines.append('{0:.1f}s\t{1:.1f}s\t{2}'.format(stage.started, stage.duration, stage.name))
+        return '\n'.join(lines)
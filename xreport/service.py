@@ -0,0 +1,214 @@
+import os
+import time
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+from xreport import tasks
+from xreport.context import get_context
+from xreport.stats import stats_store
+from xreport.utils import _get_fulltext_counts
+from xreport.utils import _get_usage_table
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# Exception definitions
+class ReportRequestException(Exception):
+    pass
+# =============================== REPORT SERVICE ================================== #
+class ReportService(object):
+    """
+    Long-running report service: the input data (bibstems, publishers, completeness data,
+    statistics and the aggregates of the Classic index files) are loaded once and stay in
+    memory, so that a report request only needs to filter data and query the API. Data are
+    reloaded automatically when input files change
+    """
+    def __init__(self, conf):
+        """
+        Initializes the service
+
+        param: conf: dictionary with configuration values
+        """
+        self.conf = conf
+        self.context = get_context(conf)
+        self.started = time.time()
+        # Number of report requests handled
+        self.requests = 0
+        self._lock = threading.Lock()
+        # Locks per report (collection, subject, format and start year): requests for the same
+        # report write the same files, so they are handled one at a time
+        self._report_locks = {}
+
+    def warm(self):
+        """
+        Load all input data. Data that cannot be loaded (e.g. because the file is missing)
+        are skipped here, so that reports not depending on them can still be created
+        """
+        include = set(element for sublist in self.conf.get("JOURNALS").values() for element in sublist)
+        loaders = [
+            ('bibstems', self.context.get_bibstems),
+            ('publishers', self.context.get_publishers),
+            ('completeness data', self.context.get_completeness),
+            ('statistics by year', lambda: stats_store.get_frame(self.conf, 'year')),
+            ('statistics by volume', lambda: stats_store.get_frame(self.conf, 'volume')),
+            ('reads', lambda: _get_usage_table(self.conf, udata='reads')),
+            ('downloads', lambda: _get_usage_table(self.conf, udata='downloads')),
+            ('full text index by volume', lambda: _get_fulltext_counts(self.conf, include)),
+            ('full text index by year', lambda: _get_fulltext_counts(self.conf, include, use_year=True)),
+        ]
+        for name, loader in loaders:
+            try:
+                loader()
+            except Exception as err:
+                logger.warning('Unable to load {0}: {1}'.format(name, err))
+
+    def create_report(self, params):
+        """
+        Create the report(s) for a request and return the files written
+
+        param: params: dictionary with the request parameters: collection, subject, format
+                       (default: general), year (start year; report by volume if absent)
+                       no_drive (skip Google Drive upload) and force (create the report even if
+                       its inputs did not change; otherwise the files created before are returned)
+        """
+        collection = params.get('collection')
+        subject = params.get('subject')
+        report_format = params.get('format', 'general')
+        if collection not in self.conf.get('COLLECTIONS'):
+            raise ReportRequestException('Please specify one of the following values for the collection parameter: {}'.format(self.conf.get('COLLECTIONS')))
+        if subject not in self.conf.get('SUBJECTS'):
+            raise ReportRequestException('Please specify one of the following values for the subject parameter: {}'.format(self.conf.get('SUBJECTS')))
+        if report_format not in self.conf.get('FORMATS'):
+            raise ReportRequestException('Please specify one of the following values for the format parameter: {}'.format(self.conf.get('FORMATS')))
+        if report_format.lower() == 'curators' and subject.lower() != 'fulltext':
+            raise ReportRequestException('The "curators" format only supports the "fulltext" report')
+        try:
+            use_year = int(params['year']) if params.get('year') else False
+        except ValueError:
+            raise ReportRequestException('The year parameter must be a year: {}'.format(params['year']))
+        no_drive = str(params.get('no_drive', '')).lower() in ['1', 'true', 'yes']
+        force = str(params.get('force', '')).lower() in ['1', 'true', 'yes']
+        with self._lock:
+            self.requests += 1
+            report_lock = self._report_locks.setdefault((collection, subject, report_format.lower(), use_year), threading.Lock())
+        with report_lock:
+            reports = tasks.create_report(collection=collection, format=report_format, subject=subject,
+                                          use_year=use_year, no_drive=no_drive, force=force, context=self.context)
+        return [output_file for report in reports or [] for output_file in report.output_files]
+
+    def status(self):
+        """
+        Return the status of the service
+        """
+        return {'status': 'ok', 'uptime': round(time.time() - self.started, 1), 'requests': self.requests}
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the report service. Endpoints:
+        GET /status: status of the service
+        POST /report: create a report, with the parameters (as for ReportService.create_report)
+                      as JSON body. Creating a report writes (and uploads) files, so it is not
+                      available with GET
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/status':
+            self._respond(200, self.server.service.status())
+        elif url.path == '/report':
+            self._respond(405, {'error': 'Reports are created with a POST request'}, headers={'Allow': 'POST'})
+        else:
+            self._respond(404, {'error': 'Unknown endpoint: {0}'.format(url.path)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/report':
+            self._respond(404, {'error': 'Unknown endpoint: {0}'.format(url.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as err:
+            self._respond(400, {'error': 'Invalid JSON body: {0}'.format(err)})
+            return
+        if not isinstance(params, dict):
+            self._respond(400, {'error': 'The JSON body must be an object with the request parameters'})
+            return
+        self._create_report(params)
+
+    def _create_report(self, params):
+        """
+        Create the report(s) for a request and respond with the files written
+
+        param: params: dictionary with the request parameters
+        """
+        started = time.time()
+        try:
+            output_files = self.server.service.create_report(params)
+        except ReportRequestException as err:
+            self._respond(400, {'error': str(err)})
+            return
+        except Exception as err:
+            logger.error('Creating report for request {0} failed: {1}'.format(params, err))
+            self._respond(500, {'error': str(err)})
+            return
+        self._respond(200, {'reports': output_files, 'seconds': round(time.time() - started, 3)})
+
+    def _respond(self, status, data, headers=None):
+        """
+        Send a JSON response
+
+        param: status: HTTP status code
+        param: data: the data to send
+        param: headers: dictionary with additional response headers
+        """
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info('{0} - {1}'.format(self.address_string(), format % args))
+
+def make_server(conf, host=None, port=None):
+    """
+    Create the HTTP server for the report service (requests are handled in threads)
+
+    param: conf: dictionary with configuration values
+    param: host: address to listen on (default: SERVICE_HOST)
+    param: port: port to listen on (default: SERVICE_PORT)
+    """
+    host = host or conf.get('SERVICE_HOST', '127.0.0.1')
+    port = conf.get('SERVICE_PORT', 8765) if port is None else port
+    server = ThreadingHTTPServer((host, port), ReportRequestHandler)
+    server.service = ReportService(conf)
+    return server
+
+def serve(conf, host=None, port=None):
+    """
+    Load all input data and serve report requests until interrupted
+
+    param: conf: dictionary with configuration values
+    param: host: address to listen on (default: SERVICE_HOST)
+    param: port: port to listen on (default: SERVICE_PORT)
+    """
+    server = make_server(conf, host=host, port=port)
+    logger.info('Loading input data')
+    server.service.warm()
+    logger.info('Serving reports on http://{0}:{1}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,253 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from xreport.utils import _file_signature
+from xreport.utils import _cache_file
+from xreport.utils import _load_pickle
+from xreport.utils import _save_pickle
+# ============================= INITIALIZATION ==================================== #
+
+from xreport.compat import setup_logging, load_config
+
+proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
+config = load_config(proj_home=proj_home)
+logger = setup_logging(__name__, proj_home=proj_home,
+                        level=config.get('LOGGING_LEVEL', 'INFO'),
+                        attach_stdout=config.get('LOG_STDOUT', False))
+# Config variables holding the file names of the ADS statistics files
+STATS_FILES = {
+    'year': 'ADS_RECORD_STATS_YEAR',
+    'volume': 'ADS_RECORD_STATS_VOLUME'
+}
+# The statistics (columns in the statistics files) stored in a statistics cube
+CUBE_METRICS = ['record_count', 'records_with_fulltext', 'records_with_references',
+                'reference_count', 'matched_reference_count']
+# =============================== STATS STORE ===================================== #
+class StatsStore(object):
+    """
+    Process-wide store for the ADS statistics files (records aggregated by
+    year and by volume). Each file is parsed at most once per process and
+    only re-read when its modification time or size changes.
+    """
+    def __init__(self):
+        # Cached data frames, keyed on full path of the statistics file
+        self._frames = {}
+        # File signature (mtime, size) associated with each cached data frame
+        self._signatures = {}
+        # Statistics cubes (least recently used first), keyed on full path of the statistics file and set of journals
+        self._cubes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_frame(self, conf, field):
+        """
+        Return the normalized statistics data frame aggregated by year or volume.
+        The frame is shared between all callers and must not be modified in place.
+
+        param: conf: dictionary with configuration values
+        param: field: aggregation of the statistics ('year' or 'volume')
+        """
+        data_file = _stats_file(conf, field)
+        signature = _file_signature(data_file)
+        with self._lock:
+            if self._signatures.get(data_file) != signature:
+                self._frames[data_file] = _load_stats(conf, data_file, field, signature)
+                self._signatures[data_file] = signature
+                # Cubes built from the previous version of the file are no longer valid
+                for key in [key for key in self._cubes if key[0] == data_file]:
+                    del self._cubes[key]
+            return self._frames[data_file]
+
+    def select(self, conf, field, journals):
+        """
+        Return the statistics for a set of journals, aggregated by year or volume
+
+        param: conf: dictionary with configuration values
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        df = self.get_frame(conf, field)
+        return df[df['bibstem'].isin(journals)].copy()
+
+    def checksum(self, conf, field, journals):
+        """
+        Return a checksum of the statistics for a set of journals, aggregated by year or volume,
+        used to detect whether the statistics for these journals have changed
+
+        param: conf: dictionary with configuration values
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        df = self.select(conf, field, journals)
+        df['bibstem'] = df['bibstem'].astype(str)
+        df = df.sort_values(list(df.columns)).reset_index(drop=True)
+        return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+    def get_cube(self, conf, field, journals):
+        """
+        Return the statistics cube for a set of journals, aggregated by year or volume.
+        A cube is built once and shared by all reports for the same set of journals. Only the
+        most recently used cubes are kept (the number is set by STATS_CUBE_CACHE_SIZE)
+
+        param: conf: dictionary with configuration values
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        df = self.get_frame(conf, field)
+        key = (_stats_file(conf, field), frozenset(journals))
+        with self._lock:
+            cube = self._cubes.get(key)
+            if cube is not None and cube.frame is df:
+                self._cubes.move_to_end(key)
+                return cube
+        cube = StatsCube(df, field, journals)
+        with self._lock:
+            self._cubes[key] = cube
+            self._cubes.move_to_end(key)
+            while len(self._cubes) > max(conf.get('STATS_CUBE_CACHE_SIZE', 32), 1):
+                self._cubes.popitem(last=False)
+        return cube
+
+    def clear(self):
+        """
+        Remove all cached statistics data
+        """
+        with self._lock:
+            self._frames = {}
+            self._signatures = {}
+            self._cubes = OrderedDict()
+
+class StatsCube(object):
+    """
+    Dense journal x key (year or volume) x metric array of statistics data.
+    The coverage data for full text, references and reference matching are
+    all vectorized slices of the same cube.
+    """
+    def __init__(self, df, field, journals):
+        """
+        Build the cube for a set of journals
+
+        param: df: statistics data frame
+        param: field: aggregation of the statistics ('year' or 'volume')
+        param: journals: list of bibstems (without periods)
+        """
+        self.frame = df
+        self.field = field
+        self.journals = sorted(set(journals))
+        df = df[df['bibstem'].isin(self.journals)]
+        self.keys = np.sort(df[field].unique())
+        self.metrics = [m for m in CUBE_METRICS if m in df.columns]
+        jrnl_idx = pd.Categorical(df['bibstem'].astype(str), categories=self.journals).codes
+        key_idx = np.searchsorted(self.keys, df[field].to_numpy())
+        self.data = np.zeros((len(self.journals), len(self.keys), len(self.metrics)), dtype=np.int64)
+        self.data[jrnl_idx, key_idx, :] = df[self.metrics].to_numpy(dtype=np.int64)
+        # Which journal/key combinations are present in the statistics data
+        self.present = np.zeros((len(self.journals), len(self.keys)), dtype=bool)
+        self.present[jrnl_idx, key_idx] = True
+
+    def ranges(self):
+        """
+        Get the first and last year or volume for all journals with data
+        """
+        results = {}
+        for i, journal in enumerate(self.journals):
+            keys = self.keys[self.present[i]]
+            if len(keys):
+                results[journal] = (keys[0], keys[-1])
+        return results
+
+    def values(self, metric):
+        """
+        Get the values of a metric, keyed on year or volume, for all journals with data
+
+        param: metric: the metric to return
+        """
+        values = self.data[:, :, self.metrics.index(metric)]
+        return self._to_dict(values, self.present, self.keys)
+
+    def coverage(self, numerator, denominator='record_count', skip_empty=False):
+        """
+        Get coverage fractions (numerator over denominator), keyed on year or volume
+        (formatted as strings), for all journals with data
+
+        param: numerator: the metric with the number of records covered
+        param: denominator: the metric with the total number of records
+        param: skip_empty: skip all entries with a zero denominator if true
+        """
+        num = self.data[:, :, self.metrics.index(numerator)].astype(float)
+        den = self.data[:, :, self.metrics.index(denominator)].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = num / den
+        # Just in case there were cases with zero records, replace the "inf" entries by 0
+        fractions[np.isinf(fractions)] = 0
+        mask = self.present
+        if skip_empty:
+            mask = mask & (den > 0)
+        return self._to_dict(fractions, mask, self.keys.astype(str))
+
+    def _to_dict(self, values, mask, keys):
+        """
+        Turn a journal x key array into a dictionary of dictionaries, skipping masked entries
+
+        param: values: journal x key array
+        param: mask: journal x key array of booleans (entries to include)
+        param: keys: the keys (year or volume) of the second dimension
+        """
+        results = {}
+        for i, journal in enumerate(self.journals):
+            idx = np.nonzero(mask[i])[0]
+            if len(idx):
+                results[journal] = dict(zip(keys[idx].tolist(), values[i, idx].tolist()))
+        return results
+
+# The store shared by all reports in this process
+stats_store = StatsStore()
+# =============================== HELPER FUNCTIONS ================================ #
+def _stats_file(conf, field):
+    """
+    Return the full path of the statistics file for a given aggregation
+
+    param: conf: dictionary with configuration values
+    param: field: aggregation of the statistics ('year' or 'volume')
+    """
+    return "{0}/{1}".format(conf['ADS_STATS_DATA'], conf[STATS_FILES[field]])
+
+def _load_stats(conf, data_file, field, signature):
+    """
+    Load the statistics data from the binary sidecar file if it is up to date
+    with the statistics file. Otherwise parse the statistics file and (re)build
+    the sidecar file
+
+    param: conf: dictionary with configuration values
+    param: data_file: full path of the statistics file
+    param: field: aggregation of the statistics ('year' or 'volume')
+    param: signature: modification time and size of the statistics file
+    """
+    sidecar_file = _cache_file(conf, 'ADS_STATS_CACHE', data_file, 'pkl')
+    sidecar = _load_pickle(sidecar_file)
+    if sidecar and sidecar['signature'] == signature:
+        logger.info('Loading statistics data from {0}'.format(sidecar_file))
+        return sidecar['data']
+    logger.info('Loading statistics data from {0}'.format(data_file))
+    df = _read_stats(data_file, field)
+    _save_pickle({'signature': signature, 'data': df}, sidecar_file)
+    return df
+
+def _read_stats(data_file, field):
+    """
+    Read a statistics file into a data frame with normalized bibstems
+    (periods removed, stored as categorical) and integer volumes or years
+
+    param: data_file: full path of the statistics file
+    param: field: aggregation of the statistics ('year' or 'volume')
+    """
+    df = pd.read_csv(data_file, sep='\t', dtype={'bibstem': str, field: str})
+    # Remove periods from bibstems
+    df['bibstem'] = df['bibstem'].str.replace('.', '', regex=False).astype('category')
+    # Remove periods from volume entries and skip volumes that are not numerical
+    df[field] = pd.to_numeric(df[field].str.replace('.', '', regex=False), errors='coerce')
+    df = df[df[field].notna()].copy()
+    df[field] = df[field].astype(int)
+    return df.reset_index(drop=True)
@@ -1,10 +1,20 @@
 import os
 import sys
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from xreport.reports import FullTextReport
 from xreport.reports import ReferenceMatchingReport
 from xreport.reports import ReferenceCoverageReport
 from xreport.reports import MetaDataReport
 from xreport.reports import SummaryReport
+from xreport.client import set_rate_share
+from xreport.ledger import query_ledger
+from xreport.context import get_context
+from xreport.stats import stats_store
+from xreport.scheduler import StageGraph
+from xreport.utils import _get_fulltext_counts
+from xreport.utils import _get_usage_table
 from xreport.compat import setup_logging, load_config
 # ============================= INITIALIZATION ==================================== #
 
@@ -13,6 +23,9 @@ config = load_config(proj_home=proj_home)
 logger = setup_logging(__name__, proj_home=proj_home,
                        level=config.get('LOGGING_LEVEL', 'INFO'),
                        attach_stdout=config.get('LOG_STDOUT', False))
+# Exception definitions
+class ReportException(Exception):
+    pass
 # ============================= FUNCTIONS ========================================= #
 def create_report(**args):
     # What is the report format
@@ -25,92 +38,296 @@ def create_report(**args):
     use_year = args['use_year']
     # Skip Google Drive upload?
     no_drive = args.get('no_drive', False)
+    # The input data shared by the reports (by default, the context shared by all reports in this process)
+    context = args.get('context')
+    # Ignore cached API responses (and cache new ones), or skip the API response cache altogether?
+    refresh = args.get('refresh', False)
+    no_cache = args.get('no_cache', False)
+    # Create the reports even if their inputs did not change?
+    force = args.get('force', False)
+    # The reports created (so that the caller can e.g. upload them)
+    reports = []
+    # The errors encountered: a failing report does not stop the others, but fails the job
+    # (and a report that could not be made is not saved)
+    errors = []
     #
     if subject in ['FULLTEXT', 'ALL']:
         # Initialize the class for full text reporting
-        ftreport = FullTextReport()
+        ftreport = FullTextReport(context=context)
+        reports.append(ftreport)
         ftreport.config['NO_DRIVE'] = no_drive
+        ftreport.config['REFRESH_CACHE'] = refresh
+        ftreport.config['NO_CACHE'] = no_cache
         # Set the reporting type
         ftreport.use_year = use_year
-        # The first step consists of retrieving and preparing the data to generate the report
-        ftreport.make_report(collection, report_format)
-        try:
-            ftreport.make_report(collection, report_format)
-        except Exception as err:
-            msg = "Error making full text report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
-        # Write the report to file
-        try:
-            if report_format == 'MISSING':
-                ftreport.save_missing(collection, report_format, subject)
+        if not force and ftreport.is_unchanged(collection, report_format, subject):
+            logger.info("Skipping full text report for collection '{0}' in format '{1}': inputs unchanged".format(collection, report_format))
+            # Upload the report files, if that did not happen before
+            if not no_drive:
+                ftreport.upload_reports()
+        else:
+            # The first step consists of retrieving and preparing the data to generate the report
+            try:
+                ftreport.make_report(collection, report_format)
+            except Exception as err:
+                msg = "Error making full text report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                logger.error(msg)
+                errors.append(msg)
             else:
-                ftreport.save_report(collection, report_format, subject)
-        except Exception as err:
-            msg = "Error saving full text report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
+                # Write the report to file
+                try:
+                    if report_format.lower() == 'missing':
+                        ftreport.save_missing(collection, report_format, subject)
+                    else:
+                        ftreport.save_report(collection, report_format, subject)
+                except Exception as err:
+                    msg = "Error saving full text report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                    logger.error(msg)
+                    errors.append(msg)
     if subject in ['REFERENCES', 'ALL']:
         # Initialize the class for reference matching reporting
-        rmreport = ReferenceMatchingReport()
+        rmreport = ReferenceMatchingReport(context=context)
+        reports.append(rmreport)
         # Set the reporting type
         rmreport.use_year = use_year
         rmreport.config['NO_DRIVE'] = no_drive
-        try:
-            rmreport.make_report(collection, 'general')
-        except Exception as err:
-            msg = "Error making reference matching report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
-        # Write the report to file
-        try:
-            rmreport.save_report(collection, 'general', subject)
-        except Exception as err:
-            msg = "Error saving reference matching report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
+        rmreport.config['REFRESH_CACHE'] = refresh
+        rmreport.config['NO_CACHE'] = no_cache
+        if not force and rmreport.is_unchanged(collection, 'general', subject):
+            logger.info("Skipping reference matching report for collection '{0}' in format '{1}': inputs unchanged".format(collection, report_format))
+            # Upload the report files, if that did not happen before
+            if not no_drive:
+                rmreport.upload_reports()
+        else:
+            try:
+                rmreport.make_report(collection, 'general')
+            except Exception as err:
+                msg = "Error making reference matching report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                logger.error(msg)
+                errors.append(msg)
+            else:
+                # Write the report to file
+                try:
+                    rmreport.save_report(collection, 'general', subject)
+                except Exception as err:
+                    msg = "Error saving reference matching report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                    logger.error(msg)
+                    errors.append(msg)
     if subject in ['METADATA', 'ALL']:
         # Initialize the class for metadata reporting
-        mreport = MetaDataReport()
+        mreport = MetaDataReport(context=context)
+        reports.append(mreport)
         # Set the reporing type
         mreport.use_year = use_year
         mreport.config['NO_DRIVE'] = no_drive
-        try:
-            mreport.make_report(collection, 'general')
-        except Exception as err:
-            msg = "Error making metadata report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
-        # Write the report to file
-        try:
-            mreport.save_report(collection, report_format, subject)
-        except Exception as err:
-            msg = "Error saving metadata report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
+        mreport.config['REFRESH_CACHE'] = refresh
+        mreport.config['NO_CACHE'] = no_cache
+        if not force and mreport.is_unchanged(collection, report_format, subject):
+            logger.info("Skipping metadata report for collection '{0}' in format '{1}': inputs unchanged".format(collection, report_format))
+            # Upload the report files, if that did not happen before
+            if not no_drive:
+                mreport.upload_reports()
+        else:
+            try:
+                mreport.make_report(collection, 'general')
+            except Exception as err:
+                msg = "Error making metadata report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                logger.error(msg)
+                errors.append(msg)
+            else:
+                # Write the report to file
+                try:
+                    mreport.save_report(collection, report_format, subject)
+                except Exception as err:
+                    msg = "Error saving metadata report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                    logger.error(msg)
+                    errors.append(msg)
     if subject in ['REFCOVERAGE', 'ALL']:
-        rcreport = ReferenceCoverageReport()
+        rcreport = ReferenceCoverageReport(context=context)
+        reports.append(rcreport)
         rcreport.use_year = use_year
         rcreport.config['NO_DRIVE'] = no_drive
-        try:
-            rcreport.make_report(collection, 'general')
-        except Exception as err:
-            msg = "Error making reference coverage report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
-        try:
-            rcreport.save_report(collection, 'general', subject)
-        except Exception as err:
-            msg = "Error saving reference coverage report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
+        rcreport.config['REFRESH_CACHE'] = refresh
+        rcreport.config['NO_CACHE'] = no_cache
+        if not force and rcreport.is_unchanged(collection, 'general', subject):
+            logger.info("Skipping reference coverage report for collection '{0}' in format '{1}': inputs unchanged".format(collection, report_format))
+            # Upload the report files, if that did not happen before
+            if not no_drive:
+                rcreport.upload_reports()
+        else:
+            try:
+                rcreport.make_report(collection, 'general')
+            except Exception as err:
+                msg = "Error making reference coverage report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                logger.error(msg)
+                errors.append(msg)
+            else:
+                try:
+                    rcreport.save_report(collection, 'general', subject)
+                except Exception as err:
+                    msg = "Error saving reference coverage report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                    logger.error(msg)
+                    errors.append(msg)
     if subject == 'SUMMARY':
         # Create a summarizing report
-        summary = SummaryReport()
+        summary = SummaryReport(context=context)
+        reports.append(summary)
         # Set the reporting type
         summary.use_year = use_year
         summary.config['NO_DRIVE'] = no_drive
+        summary.config['REFRESH_CACHE'] = refresh
+        summary.config['NO_CACHE'] = no_cache
         try:
             summary.make_report(collection, report_format)
         except Exception as err:
             msg = "Error making summary report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
             logger.error(msg)
-        try:
-            summary.save_report(collection, report_format, subject)
-        except Exception as err:
-            msg = "Error saving summary report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
-            logger.error(msg)
-        
-        
+            errors.append(msg)
+        else:
+            try:
+                summary.save_report(collection, report_format, subject)
+            except Exception as err:
+                msg = "Error saving summary report for collection '{0}' in format '{1}': {2}".format(collection, report_format, err)
+                logger.error(msg)
+                errors.append(msg)
+    if errors:
+        raise ReportException('; '.join(errors))
+    return reports
+
+def create_reports(jobs, processes=1):
+    """
+    Create the reports for a list of jobs, each a dictionary with the arguments for
+    create_report. With more than one process, the jobs are distributed over a pool
+    of worker processes. Failures do not stop other jobs: they are collected and
+    returned as a list of (job, error message) pairs
+
+    param: jobs: list of dictionaries with report arguments
+    param: processes: number of worker processes
+    """
+    failures = []
+    if processes <= 1:
+        for job in jobs:
+            try:
+                create_report(**job)
+            except Exception as err:
+                failures.append((job, str(err)))
+        return failures
+    # The workers are forked from this process, so they start with all modules (pandas,
+    # openpyxl, reports) and the config already imported
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_worker, initargs=(processes,)) as executor:
+        futures = [executor.submit(_run_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                error, ledger_entries = future.result()
+            except Exception as err:
+                # The worker process died
+                error, ledger_entries = str(err), []
+            query_ledger.extend(ledger_entries)
+            if error:
+                failures.append((job, error))
+    return failures
+
+def _init_worker(processes):
+    """
+    Initialize a worker process: the workers share the API rate limit
+
+    param: processes: number of worker processes
+    """
+    set_rate_share(processes)
+
+def _run_job(job):
+    """
+    Create the report(s) for one job in a worker process. Returns the error message
+    (None if successful) and the API calls recorded for this job
+
+    param: job: dictionary with report arguments
+    """
+    offset = len(query_ledger.entries)
+    error = None
+    try:
+        create_report(**job)
+    except Exception as err:
+        logger.error('Creating report for job {0} failed: {1}'.format(job, err))
+        error = str(err)
+    return error, query_ledger.entries[offset:]
+
+def sweep_reports(jobs, workers=1):
+    """
+    Create the reports for a list of jobs (as for create_reports) as a graph of stages:
+    loading the input files, building the statistics aggregates, the full text index and
+    usage aggregates, the statistics cubes per collection, creating each report and uploading
+    it. Stages shared by several reports run only once, and independent stages run in
+    parallel. Returns the failures, as a list of (job, error message) pairs, and the stage
+    graph (with the timing of all stages, and the critical path)
+
+    param: jobs: list of dictionaries with report arguments
+    param: workers: number of worker threads
+    """
+    graph = StageGraph()
+    context = get_context(config)
+    inputs = [graph.add('load bibstems', context.get_bibstems),
+              graph.add('load publishers', context.get_publishers),
+              graph.add('load completeness data', context.get_completeness)]
+    # The journals of all collections, for which the Classic full text index is aggregated
+    include = set(element for sublist in config.get("JOURNALS").values() for element in sublist)
+    # The reports use the statistics by year as well as by volume
+    stats = [graph.add('stats aggregate ({0})'.format(field), partial(stats_store.get_frame, config, field))
+             for field in ['year', 'volume']]
+    job_stages = []
+    for job in jobs:
+        field = 'year' if job['use_year'] else 'volume'
+        cube = graph.add('cube {0}'.format(job['collection']),
+                         partial(_get_collection_cubes, context, job['collection']), stats + ['load bibstems'])
+        report_inputs = inputs + [cube]
+        if job['subject'] in ['FULLTEXT', 'ALL'] and job['format'] == 'curators':
+            report_inputs.append(graph.add('full text index aggregate ({0})'.format(field),
+                                           partial(_get_fulltext_counts, config, include, use_year=job['use_year'])))
+        if job['subject'] == 'SUMMARY':
+            report_inputs.append(graph.add('usage aggregate', partial(_get_usage_tables, config)))
+        # Reports are uploaded in a stage of their own, which is skipped if (one of) the reports failed
+        report = graph.add('report {0} {1} {2} ({3})'.format(job['subject'], job['format'], job['collection'], field),
+                           partial(create_report, **dict(job, context=context, no_drive=True)), report_inputs)
+        stages = [report]
+        if not job.get('no_drive', False):
+            stages.append(graph.add('upload {0} {1} {2} ({3})'.format(job['subject'], job['format'], job['collection'], field),
+                                    partial(_upload_reports, graph.stages[report]), [report]))
+        job_stages.append((job, stages))
+    errors = dict(graph.run(workers=workers))
+    failures = []
+    for job, stages in job_stages:
+        error = next((errors[stage] for stage in stages if stage in errors), None)
+        if error:
+            failures.append((job, error))
+    return failures, graph
+
+def _get_collection_cubes(context, collection):
+    """
+    Build the statistics cubes (by year and by volume) for the journals of a collection
+    (that are in the bibstems list)
+
+    param: context: the input data shared by the reports
+    param: collection: the collection to build the cubes for
+    """
+    bibstems = context.get_bibstems()
+    journals = [j for j in config['JOURNALS'].get(collection, []) if j in bibstems]
+    if journals:
+        return {field: context.get_cube(field, journals) for field in ['year', 'volume']}
+
+def _get_usage_tables(conf):
+    """
+    Compile the usage tables (per bibstem) for reads and downloads
+
+    param: conf: dictionary with configuration values
+    """
+    return {udata: _get_usage_table(conf, udata=udata) for udata in ['reads', 'downloads']}
+
+def _upload_reports(stage):
+    """
+    Upload the reports created in a report stage to Google Drive
+
+    param: stage: the stage that created the reports
+    """
+    for report in stage.result or []:
+        report.upload_reports()
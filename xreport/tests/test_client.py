@@ -0,0 +1,170 @@
+import os
+import sys
+import unittest
+import httpretty
+import json
+import mock
+import threading
+from xreport.client import APIClient
+from xreport.client import get_client
+from xreport.client import set_rate_share
+from xreport.client import RateLimiter
+from xreport.client import QueryMemo
+from xreport.client import query_memo
+from xreport.client import _retry_after
+from xreport.client import _rate_limit
+from xreport.utils import _get_facet_data
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        from xreport.compat import load_config
+        self.proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../../'))
+        self.config = load_config(proj_home=self.proj_home)
+
+    def test_get_client(self):
+        '''Test that the API client is shared within a process'''
+        client = get_client(self.config)
+        self.assertIsInstance(client, APIClient)
+        self.assertIs(get_client(self.config), client)
+        self.assertEqual(client.timeout, (self.config['ADS_API_CONNECT_TIMEOUT'], self.config['ADS_API_READ_TIMEOUT']))
+        self.assertEqual(client.session.headers['Authorization'], 'Bearer {0}'.format(self.config['ADS_API_TOKEN']))
+        # Different API settings result in a different client
+        conf = dict(self.config)
+        conf['ADS_API_READ_TIMEOUT'] = 1
+        self.assertIsNot(get_client(conf), client)
+
+    def test_rate_share(self):
+        '''Test that worker processes share the API rate limit'''
+        conf = dict(self.config, ADS_API_RATE=8, ADS_API_BURST=10)
+        try:
+            set_rate_share(4)
+            client = get_client(conf)
+            self.assertEqual(client.limiter.rate, 2.0)
+            self.assertEqual(client.limiter.capacity, 2)
+        finally:
+            set_rate_share(1)
+        self.assertEqual(get_client(conf).limiter.rate, 8.0)
+
+    @httpretty.activate
+    def test_client_query(self):
+        '''Test that queries are sent through the shared API client'''
+        datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+        with open(datafile) as mdata:
+            mockdata = json.load(mdata)
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        httpretty.register_uri(
+                    httpretty.GET,
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=json.dumps(mockdata))
+        expected = {2012: 3118, 2015: 3055, 2016: 3038, 2017: 3104, 2019: 3190, 2020: 3079}
+        for i in range(3):
+            self.assertEqual(_get_facet_data(self.config, 'star', 'year'), expected)
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+        self.assertEqual(httpretty.last_request().headers['Authorization'], 'Bearer {0}'.format(self.config['ADS_API_TOKEN']))
+
+    def test_rate_limiter(self):
+        '''Test that the token bucket limits the request rate after a burst'''
+        limiter = RateLimiter(2, burst=3)
+        clock = [100.0]
+        def sleep(seconds):
+            clock[0] += seconds
+        with mock.patch('xreport.client.time.monotonic', side_effect=lambda: clock[0]), \
+             mock.patch('xreport.client.time.sleep', side_effect=sleep) as mock_sleep:
+            limiter.updated = clock[0]
+            # A burst of requests does not have to wait
+            for i in range(3):
+                limiter.acquire()
+            self.assertFalse(mock_sleep.called)
+            # After that, requests are sent at the specified rate
+            for i in range(4):
+                limiter.acquire()
+            self.assertAlmostEqual(clock[0], 102.0)
+        # Without a rate, there is no limit
+        RateLimiter(None).acquire()
+
+    def test_rate_limit_headers(self):
+        '''Test that rate limit headers from the API slow down all requests'''
+        self.assertEqual(_retry_after({'Retry-After': '12'}), 12.0)
+        self.assertIsNone(_retry_after({}))
+        with mock.patch('xreport.client.time.time', return_value=1000.0):
+            self.assertEqual(_rate_limit({'X-RateLimit-Remaining': '3', 'X-RateLimit-Reset': '1060'}), (3, 60.0))
+            self.assertIsNone(_rate_limit({'X-RateLimit-Remaining': '3'}))
+        limiter = RateLimiter(5, burst=10)
+        clock = [100.0]
+        def sleep(seconds):
+            clock[0] += seconds
+        with mock.patch('xreport.client.time.monotonic', side_effect=lambda: clock[0]), \
+             mock.patch('xreport.client.time.sleep', side_effect=sleep):
+            limiter.updated = clock[0]
+            limiter.paused_until = 0.0
+            # Plenty of quota left: no change in rate
+            limiter.set_quota(1000, 3600)
+            self.assertIsNone(limiter.quota_rate)
+            # Almost out of quota: the remaining requests are spread until the reset
+            limiter.set_quota(4, 40)
+            self.assertAlmostEqual(limiter.quota_rate, 0.1)
+            # Out of quota (or asked to back off): all requests wait
+            limiter.set_quota(0, 30)
+            limiter.acquire()
+            self.assertGreaterEqual(clock[0], 130.0)
+
+    def test_query_memo(self):
+        '''Test that identical queries are sent only once during a run'''
+        memo = QueryMemo()
+        memo.start()
+        release = threading.Event()
+        calls = []
+        def send():
+            calls.append(1)
+            release.wait(5)
+            return {'numFound': 1}
+        # Identical queries in flight at the same time wait for the first one
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(memo.get('q', send))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'numFound': 1}]*5)
+        # Later queries are served from memory
+        self.assertEqual(memo.get('q', send), {'numFound': 1})
+        self.assertEqual(len(calls), 1)
+        # Failed queries are not remembered
+        def fail():
+            raise Exception('failed')
+        with self.assertRaises(Exception):
+            memo.get('r', fail)
+        self.assertEqual(memo.get('r', send), {'numFound': 1})
+        memo.stop()
+        self.assertEqual(memo.get('q', send), {'numFound': 1})
+        self.assertEqual(len(calls), 3)
+
+    @httpretty.activate
+    def test_memo_queries(self):
+        '''Test that API queries use the memo during a run'''
+        datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+        with open(datafile) as mdata:
+            mockdata = json.load(mdata)
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        httpretty.register_uri(
+                    httpretty.GET,
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=json.dumps(mockdata))
+        query_memo.start()
+        try:
+            for i in range(3):
+                _get_facet_data(self.config, 'star', 'year')
+        finally:
+            query_memo.stop()
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
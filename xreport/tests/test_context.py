@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import mock
+from xreport import context
+from xreport.context import ReportContext
+from xreport.context import get_context
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {
+            'ADS_BIBSTEMS': os.path.join(self.tmpdir, 'bibstems.dat'),
+            'ADS_PUBLISHER_DATA': os.path.join(self.tmpdir, 'publishers.dat'),
+            'ADS_COMPLETENESS_DATA': os.path.join(self.tmpdir, 'completeness.json'),
+        }
+        with open(self.config['ADS_BIBSTEMS'], 'w') as fh:
+            fh.write('ApJ..\tJ\tThe Astrophysical Journal\nA&A..\tR\tAstronomy and Astrophysics\nIAUS.\tC\tIAU Symposium\n')
+        with open(self.config['ADS_PUBLISHER_DATA'], 'w') as fh:
+            fh.write('ApJ..\tIOP\nA&A..\tEDP\nno publisher\n')
+        self.completeness = [{'bibstem': 'ApJ', 'completeness_details': [{'year': '2020'}]},
+                             {'bibstem': 'ApJ', 'completeness_details': []},
+                             {'bibstem': 'A&A', 'completeness_details': []}]
+        with open(self.config['ADS_COMPLETENESS_DATA'], 'w') as fh:
+            json.dump(self.completeness, fh)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_context_data(self):
+        '''Test the data loaded by the report context'''
+        ctx = ReportContext(self.config)
+        self.assertEqual(ctx.get_bibstems(), {'ApJ', 'A&A', 'ApJL'})
+        self.assertEqual(ctx.get_publishers(), {'ApJ': 'IOP', 'A&A': 'EDP'})
+        completeness = ctx.get_completeness()
+        self.assertEqual(sorted(completeness.keys()), ['A&A', 'ApJ'])
+        self.assertEqual(completeness['ApJ'], self.completeness[0])
+
+    def test_context_reload(self):
+        '''Test that input files are loaded once, and reloaded when they change'''
+        ctx = ReportContext(self.config)
+        with mock.patch('xreport.context._read_bibstems', wraps=context._read_bibstems) as read_bibstems:
+            ctx.get_bibstems()
+            ctx.get_bibstems()
+            self.assertEqual(read_bibstems.call_count, 1)
+            with open(self.config['ADS_BIBSTEMS'], 'a') as fh:
+                fh.write('MNRAS\tJ\tMonthly Notices of the Royal Astronomical Society\n')
+            self.assertIn('MNRAS', ctx.get_bibstems())
+            self.assertEqual(read_bibstems.call_count, 2)
+            ctx.clear()
+            ctx.get_bibstems()
+            self.assertEqual(read_bibstems.call_count, 3)
+
+    def test_get_context(self):
+        '''Test that reports with the same input files share a context'''
+        ctx = get_context(self.config)
+        self.assertIs(get_context(dict(self.config)), ctx)
+        other = dict(self.config, ADS_BIBSTEMS=os.path.join(self.tmpdir, 'other.dat'))
+        self.assertIsNot(get_context(other), ctx)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+import httpretty
+import mock
+from xreport.ledger import QueryLedger
+from xreport.ledger import query_ledger
+from xreport.client import query_memo
+from xreport.utils import _get_facet_data
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        from xreport.compat import load_config
+        self.proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../../'))
+        self.config = load_config(proj_home=self.proj_home)
+
+    @httpretty.activate
+    def test_query_ledger(self):
+        '''Test that all API calls are recorded in the ledger'''
+        datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+        with open(datafile) as mdata:
+            mockdata = mdata.read()
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        responses = [httpretty.Response(body='{}', status=503),
+                     httpretty.Response(body=mockdata, status=200)]
+        httpretty.register_uri(httpretty.GET, query_url, responses=responses)
+        self.config['LEDGER_REPORT'] = 'SummaryReport'
+        self.config['LEDGER_COLLECTION'] = 'AST'
+        query_ledger.start()
+        query_memo.start()
+        try:
+            with mock.patch('xreport.utils.time.sleep'):
+                _get_facet_data(self.config, 'star', 'year')
+                _get_facet_data(self.config, 'star', 'year')
+        finally:
+            query_memo.stop()
+            query_ledger.stop()
+        self.assertEqual(len(query_ledger.entries), 2)
+        entry = query_ledger.entries[0]
+        self.assertEqual(entry['endpoint'], 'search/query')
+        self.assertEqual(entry['query'], 'star')
+        self.assertEqual(entry['source'], 'api')
+        self.assertEqual(entry['qtime'], json.loads(mockdata)['responseHeader']['QTime'])
+        self.assertEqual(entry['num_found'], json.loads(mockdata)['response']['numFound'])
+        self.assertEqual(entry['bytes'], len(mockdata))
+        self.assertEqual(entry['retries'], 1)
+        self.assertEqual((entry['report'], entry['collection']), ('SummaryReport', 'AST'))
+        # The repeated query was answered from the memo
+        self.assertEqual(query_ledger.entries[1]['source'], 'memo')
+        self.assertEqual(query_ledger.entries[1]['fingerprint'], entry['fingerprint'])
+
+    def test_ledger_output(self):
+        '''Test writing and summarizing the ledger'''
+        ledger = QueryLedger()
+        ledger.record({'query': 'star', 'source': 'api', 'latency': 0.5})
+        self.assertEqual(ledger.entries, [])
+        ledger.start()
+        ledger.record({'query': 'star', 'source': 'api', 'latency': 0.5})
+        ledger.record({'query': 'planet', 'source': 'api', 'latency': 2.5})
+        ledger.record({'query': 'star', 'source': 'memo', 'latency': 0.0})
+        self.assertEqual([e['query'] for e in ledger.slowest(2)], ['planet', 'star'])
+        summary = ledger.summary(1)
+        self.assertIn('API calls: 3 (2 sent, 0 from cache, 1 from memo), total latency 3.0s', summary)
+        self.assertIn('planet', summary.split('\n')[-1])
+        outdir = tempfile.mkdtemp()
+        try:
+            json_file, csv_file = ledger.save(outdir, 'api_calls')
+            with open(json_file) as fh:
+                self.assertEqual(json.load(fh), ledger.entries)
+            with open(csv_file) as fh:
+                self.assertEqual([r['query'] for r in csv.DictReader(fh)], ['star', 'planet', 'star'])
+        finally:
+            shutil.rmtree(outdir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import os
 import sys
 import glob
+import shutil
+import tempfile
 import unittest
 import mock
 from datetime import datetime
@@ -14,6 +16,7 @@ from xreport.reports import FullTextReport
 from xreport.reports import ReferenceMatchingReport
 from xreport.reports import ReferenceCoverageReport
 from xreport.reports import SummaryReport
+from xreport.context import ReportContext
 
 class TestMethods(unittest.TestCase):
 
@@ -30,7 +33,16 @@ class TestMethods(unittest.TestCase):
         # parameters in the header), we need a callback function to determine the appropriate data
         def request_callback(request, uri, response_headers):
             content_type = request.headers.get('Content-Type')
-            if uri.find('facet.field=volume') > -1:
+            if 'facet.query' in request.querystring:
+                # The query was for record counts via facet queries: the counts for queries with
+                # an additional document type restriction are the same as those without it
+                datafile = '{0}/xreport/tests/data/FacetQueryCount.json'.format(self.proj_home)
+                with open(datafile) as mdata:
+                    mockdata = json.load(mdata)
+                counts = mockdata['facet_counts']['facet_queries']
+                mockdata['facet_counts']['facet_queries'] = {fq: counts[fq.split(' AND ')[0]] for fq in request.querystring['facet.query']}
+                return [200, response_headers, json.dumps(mockdata)]
+            elif uri.find('facet.field=volume') > -1:
                 # The query was for a facet query by volume
                 datafile = '{0}/xreport/tests/data/FacetDataVolumeCount.json'.format(self.proj_home)
             elif uri.find('facet.field=year') > -1:
@@ -135,13 +147,9 @@ class TestMethods(unittest.TestCase):
 
         # Now instantiate the Fulltext Report
         ftr = FullTextReport(config=config)
-        try:
-            data = ftr.ft_index.query("bibstem=='ApJ..' and source=='arxiv'")
-        except:
-            data = []
-        # There are two entries that match the above criteria in the mock data
-        self.assertEqual(len(data), 2)
-        # Test make_report using this index
+        # The full text count index is tested in test_fulltext_index
+        # Test make_report using the full text index
+        ftr.use_year = False
         ftr.config['JOURNALS']['AST'] = ['ApJ..']
         try:
             ftr.make_report("AST", "CURATORS")
@@ -209,10 +217,211 @@ class TestMethods(unittest.TestCase):
         }
         # Generate the summary report
         sr.make_report("AST", "NASA")
-        expected_summary = {'AST': {'nrecs': 18584, 'ftrecs': 18584, 'refrecs': 18584, 'oarecs': 18584, 
-                                    'dlrecs': 18584, 'citnum': 14338828, 'recent_citnum': 0, 'reads': 681, 
+        expected_summary = {'AST': {'nrecs': 18584, 'ftrecs': 17912, 'refrecs': 18460, 'oarecs': 12037, 
+                                    'dlrecs': 4410, 'citnum': 14338828, 'recent_citnum': 0, 'reads': 681, 
                                     'recent_reads': 271, 'downloads': 322, 'recent_downloads': 149}, 
-                            'AST recent sample': {'nrecs': 18584, 'ftrecs': 18584, 'refrecs': 18584, 'oarecs': 18584, 
-                                    'dlrecs': 18584, 'citnum': 14338828, 'recent_citnum': 0, 'reads': 'NA', 
+                            'AST recent sample': {'nrecs': 18584, 'ftrecs': 17912, 'refrecs': 18460, 'oarecs': 12037, 
+                                    'dlrecs': 4410, 'citnum': 14338828, 'recent_citnum': 0, 'reads': 'NA', 
                                     'recent_reads': 'NA', 'downloads': 'NA', 'recent_downloads': 'NA'}}
         self.assertDictEqual(sr.summarydata, expected_summary)
+
+    def _manifest_config(self):
+        # Configuration with temporary input files and a manifest directory
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for fname in ['records_agg_year.tsv', 'records_agg_volume.tsv']:
+            shutil.copy('{0}/xreport/tests/data/{1}'.format(self.proj_home, fname), tmpdir)
+        with open('{0}/bibstems.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tJ\tThe Astrophysical Journal\nMNRAS\tJ\tMonthly Notices of the Royal Astronomical Society\n')
+        with open('{0}/publishers.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tIOP\nMNRAS\tOUP\n')
+        with open('{0}/completeness.json'.format(tmpdir), 'w') as fh:
+            json.dump([], fh)
+        config = {
+            'ADS_STATS_DATA': tmpdir,
+            'ADS_RECORD_STATS_YEAR': 'records_agg_year.tsv',
+            'ADS_RECORD_STATS_VOLUME': 'records_agg_volume.tsv',
+            'ADS_STATS_CACHE': tmpdir,
+            'ADS_BIBSTEMS': '{0}/bibstems.dat'.format(tmpdir),
+            'ADS_PUBLISHER_DATA': '{0}/publishers.dat'.format(tmpdir),
+            'ADS_COMPLETENESS_DATA': '{0}/completeness.json'.format(tmpdir),
+            'OUTPUT_DIRECTORY': '{0}/reports'.format(tmpdir),
+            'MANIFEST_DIRECTORY': '{0}/manifests'.format(tmpdir),
+            'NO_DRIVE': True
+        }
+        return tmpdir, config
+
+    def test_report_manifest(self):
+        '''Test that reports are not created again when their inputs did not change'''
+        tmpdir, config = self._manifest_config()
+        context = ReportContext(config)
+        def make_report():
+            report = FullTextReport(config=dict(config, JOURNALS={'AST': ['ApJ', 'MNRAS']}), context=context)
+            report.use_year = False
+            return report
+        # No manifest yet
+        report = make_report()
+        self.assertFalse(report.is_unchanged('AST', 'general', 'FULLTEXT'))
+        report.make_report('AST', 'general')
+        report.save_report('AST', 'general', 'FULLTEXT')
+        self.assertEqual(len(report.output_files), 1)
+        # The same inputs: the files created before are used, and still need to be uploaded
+        report = make_report()
+        self.assertTrue(report.is_unchanged('AST', 'general', 'FULLTEXT'))
+        self.assertTrue(os.path.exists(report.output_files[0]))
+        self.assertEqual([u[2] for u in report.uploads], report.output_files)
+        with mock.patch('xreport.reports._upload_to_teamdrive') as upload:
+            report.upload_reports()
+            self.assertEqual(upload.call_count, 1)
+        manifest_file, manifest = report.manifest
+        with open(manifest_file) as fh:
+            self.assertEqual(json.load(fh)['uploads'], [])
+        # Other report types, and reports based on API queries, are not skipped
+        self.assertFalse(make_report().is_unchanged('AST', 'curators', 'FULLTEXT'))
+        self.assertFalse(make_report().is_unchanged('AST', 'missing', 'FULLTEXT'))
+        self.assertFalse(SummaryReport(config=config, context=context).is_unchanged('AST', 'NASA', 'SUMMARY'))
+        # Changed config values determining the contents of the report: the report is created again
+        report = make_report()
+        report.config['SOURCES'] = dict(report.config['SOURCES'], FULLTEXT=['arxiv'])
+        self.assertFalse(report.is_unchanged('AST', 'general', 'FULLTEXT'))
+        # Without a manifest directory, the inputs of the report are not fingerprinted
+        report = make_report()
+        report.config['MANIFEST_DIRECTORY'] = ''
+        with mock.patch.object(report, '_fingerprint_inputs') as fingerprint_inputs:
+            report.make_report('AST', 'general')
+            self.assertFalse(report.is_unchanged('AST', 'general', 'FULLTEXT'))
+        self.assertFalse(fingerprint_inputs.called)
+        self.assertIsNone(report.fingerprint)
+        # Changed statistics for a journal in the collection: the report is created again
+        with open('{0}/records_agg_volume.tsv'.format(tmpdir), 'a') as fh:
+            fh.write('MNRAS\t600.\t100\t90\t80\t1000\t900\n')
+        self.assertFalse(make_report().is_unchanged('AST', 'general', 'FULLTEXT'))
+
+    def test_report_manifest_failure(self):
+        '''Test that a report that failed to be made does not get a manifest'''
+        tmpdir, config = self._manifest_config()
+        report = FullTextReport(config=dict(config, JOURNALS={'AST': ['ApJ', 'MNRAS']}), context=ReportContext(config))
+        report.use_year = False
+        with mock.patch.object(FullTextReport, '_get_fulltext_data_general', side_effect=Exception('no full text data')):
+            with self.assertRaises(Exception):
+                report.make_report('AST', 'general')
+        self.assertIsNone(report.fingerprint)
+        # Even if the (incomplete) report is saved, there is no manifest, so it is created again next time
+        report.save_report('AST', 'general', 'FULLTEXT')
+        self.assertEqual(len(report.output_files), 1)
+        self.assertFalse(os.path.exists(config['MANIFEST_DIRECTORY']))
+        self.assertFalse(report.is_unchanged('AST', 'general', 'FULLTEXT'))
+
+    def test_report_journals(self):
+        '''Test that the journals of a collection in the config are not changed by making a report'''
+        tmpdir, config = self._manifest_config()
+        with open(config['ADS_BIBSTEMS'], 'a') as fh:
+            fh.write('AJ...\tJ\tThe Astronomical Journal\n')
+        journals = ['ApJ', 'XYZ', 'ABC', 'AJ', 'MNRAS']
+        config = dict(config, JOURNALS={'AST': journals}, MANIFEST_DIRECTORY='')
+        context = ReportContext(config)
+        report = FullTextReport(config=config, context=context)
+        report.use_year = False
+        with mock.patch.object(context, 'get_cube', wraps=context.get_cube) as get_cube:
+            report.make_report('AST', 'general')
+        # Journals not in the bibstems list and journals without records are left out of the report
+        self.assertEqual(report.journals, ['ApJ', 'MNRAS'])
+        self.assertEqual(journals, ['ApJ', 'XYZ', 'ABC', 'AJ', 'MNRAS'])
+        # All statistics cubes are requested for the same journals (so that they are shared)
+        self.assertEqual(set(frozenset(c[0][1]) for c in get_cube.call_args_list), {frozenset(['ApJ', 'AJ', 'MNRAS'])})
+        self.assertEqual(sorted(report.statsdata.keys()), ['AJ', 'ApJ', 'MNRAS'])
+
+    def test_fulltext_index(self):
+        '''Test the full text count index used for the curators reports'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        config = {
+            'CLASSIC_FULLTEXT_INDEX': '{0}/xreport/tests/data/fulltext.links'.format(self.proj_home),
+            'CLASSIC_INDEX_CACHE': tmpdir,
+            'JOURNALS': {'AST': ['ApJ..']}
+        }
+        ftr = FullTextReport(config=config)
+        ftr.use_year = False
+        ftr._get_fulltext_index()
+        data = [n for (bibstem, volume, source), n in ftr.ft_index.items() if bibstem == 'ApJ..' and source == 'arxiv']
+        # There are two entries that match the above criteria in the mock data
+        self.assertEqual(sum(data), 2)
+        # Journals outside of the collections are not in the index
+        self.assertEqual([key for key in ftr.ft_index.keys() if key[0] == 'MNRAS'], [])
+        # The aggregate was persisted in the cache directory
+        self.assertEqual(len(glob.glob('{0}/*.pkl'.format(tmpdir))), 1)
+
+    @httpretty.activate
+    def test_summary_facet_queries(self):
+        '''Test the record counts for the summary report, with and without facet queries'''
+        requests = []
+        def request_callback(request, uri, response_headers):
+            requests.append(request.querystring)
+            if 'facet.query' in request.querystring:
+                # The counts for queries with an additional document type restriction are
+                # the same as those without it
+                datafile = '{0}/xreport/tests/data/FacetQueryCount.json'.format(self.proj_home)
+                with open(datafile) as mdata:
+                    mockdata = json.load(mdata)
+                counts = mockdata['facet_counts']['facet_queries']
+                mockdata['facet_counts']['facet_queries'] = {fq: counts[fq.split(' AND ')[0]] for fq in request.querystring['facet.query']}
+                return [200, response_headers, json.dumps(mockdata)]
+            elif uri.find('facet.field=year') > -1:
+                datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+            else:
+                datafile = '{0}/xreport/tests/data/PivotDataYearCitCount.json'.format(self.proj_home)
+            with open(datafile) as mdata:
+                mockdata = json.load(mdata)
+            return [200, response_headers, json.dumps(mockdata)]
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        httpretty.register_uri(
+                    httpretty.GET,
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=request_callback)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for fname in ['records_agg_year.tsv', 'records_agg_volume.tsv']:
+            shutil.copy('{0}/xreport/tests/data/{1}'.format(self.proj_home, fname), tmpdir)
+        with open('{0}/bibstems.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tJ\tThe Astrophysical Journal\n')
+        with open('{0}/publishers.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tIOP\n')
+        with open('{0}/completeness.json'.format(tmpdir), 'w') as fh:
+            json.dump([], fh)
+        config = {
+            'ADS_STATS_DATA': tmpdir,
+            'ADS_RECORD_STATS_YEAR': 'records_agg_year.tsv',
+            'ADS_RECORD_STATS_VOLUME': 'records_agg_volume.tsv',
+            'ADS_STATS_CACHE': tmpdir,
+            'ADS_BIBSTEMS': '{0}/bibstems.dat'.format(tmpdir),
+            'ADS_PUBLISHER_DATA': '{0}/publishers.dat'.format(tmpdir),
+            'ADS_COMPLETENESS_DATA': '{0}/completeness.json'.format(tmpdir),
+            'COLLECTIONS': ['AST'],
+            'JOURNALS': {'AST': ['ApJ']},
+            'COLLECTION_FILTERS': {},
+            'CONTENT_QUERIES': {'AST': '{0} entdate:[NOW-365DAYS TO *]'},
+            'SKIP_USAGE': ['AST'],
+            'SUMMARY_FACET_QUERIES': True
+        }
+        # All record counts come from a single facet query per collection
+        sr = SummaryReport(config=config)
+        sr.use_year = False
+        sr.make_report('AST', 'NASA')
+        expected_counts = {'nrecs': 18584, 'ftrecs': 17912, 'refrecs': 18460, 'oarecs': 12037, 'dlrecs': 4410}
+        for label in ['AST', 'AST recent sample']:
+            self.assertDictEqual({k: sr.summarydata[label][k] for k in expected_counts}, expected_counts)
+        facet_requests = [r for r in requests if 'facet.query' in r]
+        self.assertEqual(len(facet_requests), 2)
+        # For the content queries, the property counts are restricted to articles and proceedings papers
+        doctypes = ['doctype:(article OR inproceedings)' in fq for r in facet_requests for fq in r['facet.query']]
+        self.assertEqual(doctypes.count(True), 4)
+        # With one facet query per count, every count is the total from the facet data by year
+        del requests[:]
+        sr = SummaryReport(config=dict(config, SUMMARY_FACET_QUERIES=False))
+        sr.use_year = False
+        sr.make_report('AST', 'NASA')
+        for label in ['AST', 'AST recent sample']:
+            self.assertDictEqual({k: sr.summarydata[label][k] for k in expected_counts}, {k: 18584 for k in expected_counts})
+        self.assertEqual([r for r in requests if 'facet.query' in r], [])
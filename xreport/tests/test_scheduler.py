@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from xreport.scheduler import StageGraph
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _stage(self, name, seconds=0.0, fail=False):
+        # Stage function recording that it ran
+        def func():
+            time.sleep(seconds)
+            with self.lock:
+                self.calls.append(name)
+            if fail:
+                raise Exception('{0} failed'.format(name))
+            return name
+        return func
+
+    def test_run_order(self):
+        '''Test that stages run after their inputs, and shared stages only once'''
+        graph = StageGraph()
+        graph.add('load', self._stage('load'))
+        graph.add('cube A', self._stage('cube A'), ['load'])
+        graph.add('cube B', self._stage('cube B'), ['load'])
+        # Adding a stage with the same name again keeps the existing stage
+        graph.add('load', self._stage('load again'))
+        graph.add('report', self._stage('report'), ['cube A', 'cube B'])
+        self.assertEqual(graph.run(workers=2), [])
+        self.assertEqual(self.calls[0], 'load')
+        self.assertEqual(self.calls[-1], 'report')
+        self.assertEqual(sorted(self.calls), ['cube A', 'cube B', 'load', 'report'])
+        self.assertEqual(graph.stages['report'].result, 'report')
+
+    def test_parallel_stages(self):
+        '''Test that independent stages run in parallel and the critical path'''
+        graph = StageGraph()
+        graph.add('load', self._stage('load', 0.05))
+        graph.add('fast', self._stage('fast', 0.05), ['load'])
+        graph.add('slow', self._stage('slow', 0.3), ['load'])
+        graph.add('other', self._stage('other', 0.3))
+        graph.add('write', self._stage('write', 0.05), ['fast', 'slow'])
+        graph.run(workers=3)
+        # The 'slow' and 'other' stages ran at the same time
+        self.assertLess(graph.stages['other'].started, graph.stages['slow'].finished)
+        self.assertLess(graph.stages['slow'].started, graph.stages['other'].finished)
+        self.assertEqual([s.name for s in graph.critical_path()], ['load', 'slow', 'write'])
+        summary = graph.summary()
+        self.assertIn('Stages: 5 (5 done, 0 failed, 0 skipped)', summary)
+        self.assertEqual(summary.split('\n')[-1].split('\t')[-1], 'write')
+
+    def test_failed_stage(self):
+        '''Test that stages depending on a failed stage are skipped'''
+        graph = StageGraph()
+        graph.add('load', self._stage('load', fail=True))
+        graph.add('cube', self._stage('cube'), ['load'])
+        graph.add('report', self._stage('report'), ['cube'])
+        graph.add('other', self._stage('other'))
+        failures = graph.run()
+        self.assertEqual(failures, [('load', 'load failed'), ('cube', 'input load failed'), ('report', 'input cube failed')])
+        self.assertEqual(sorted(self.calls), ['load', 'other'])
+        self.assertEqual(graph.stages['report'].state, 'skipped')
+
+    def test_invalid_graph(self):
+        '''Test that unknown inputs and cycles are detected'''
+        graph = StageGraph()
+        graph.add('report', self._stage('report'), ['cube'])
+        self.assertRaises(ValueError, graph.run)
+        graph.add('cube', self._stage('cube'), ['report'])
+        self.assertRaises(ValueError, graph.run)
+        self.assertEqual(self.calls, [])
+
+if __name__ == '__main__':
+    unittest.main()
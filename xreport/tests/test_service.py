@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+import urllib.request
+import urllib.error
+import mock
+from xreport.service import make_server
+from xreport.service import ReportService
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        from xreport.compat import load_config
+        self.proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../../'))
+        self.config = load_config(proj_home=self.proj_home)
+        # Run the service on a free port
+        self.server = make_server(self.config, host='127.0.0.1', port=0)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def _request(self, path, data=None):
+        # Send a request to the service and return the status and (JSON) response
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        try:
+            with urllib.request.urlopen(self.url + path, data=body) as r:
+                return r.status, json.loads(r.read())
+        except urllib.error.HTTPError as err:
+            return err.code, json.loads(err.read())
+
+    def test_report_request(self):
+        '''Test creating a report via the service'''
+        report = mock.Mock(output_files=['/tmp/reports/general/AST/FULLTEXT/fulltext_AST.year.xlsx'])
+        with mock.patch('xreport.tasks.create_report', return_value=[report]) as create_report:
+            status, data = self._request('/report', {'collection': 'AST', 'subject': 'FULLTEXT', 'year': 2000})
+            self.assertEqual(status, 200)
+            self.assertEqual(data['reports'], report.output_files)
+            create_report.assert_called_once_with(collection='AST', format='general', subject='FULLTEXT',
+                use_year=2000, no_drive=False, force=False, context=self.server.service.context)
+            status, data = self._request('/report', {'collection': 'PS', 'subject': 'METADATA', 'no_drive': True})
+            self.assertEqual(status, 200)
+            self.assertEqual(create_report.call_args.kwargs['use_year'], False)
+            self.assertEqual(create_report.call_args.kwargs['no_drive'], True)
+        status, data = self._request('/status')
+        self.assertEqual((status, data['requests']), (200, 2))
+
+    def test_concurrent_requests(self):
+        '''Test that requests for the same report are handled one at a time'''
+        active = []
+        overlaps = []
+        lock = threading.Lock()
+        def create_report(**args):
+            with lock:
+                active.append(args['collection'])
+                overlaps.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.remove(args['collection'])
+            return []
+        with mock.patch('xreport.tasks.create_report', side_effect=create_report):
+            threads = [threading.Thread(target=self._request, args=('/report', {'collection': 'AST', 'subject': 'FULLTEXT'}))
+                       for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(overlaps, [1, 1, 1])
+
+    def test_report_journals(self):
+        '''Test that the journals of a collection are the same for every request'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for fname in ['records_agg_year.tsv', 'records_agg_volume.tsv']:
+            shutil.copy('{0}/xreport/tests/data/{1}'.format(self.proj_home, fname), tmpdir)
+        with open('{0}/bibstems.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tJ\tThe Astrophysical Journal\nAJ...\tJ\tThe Astronomical Journal\n')
+        with open('{0}/publishers.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tIOP\n')
+        with open('{0}/completeness.json'.format(tmpdir), 'w') as fh:
+            json.dump([], fh)
+        # AJ has no records, and XYZ is not in the bibstems list
+        journals = ['ApJ', 'XYZ', 'AJ']
+        overrides = {
+            'ADS_STATS_DATA': tmpdir,
+            'ADS_RECORD_STATS_YEAR': 'records_agg_year.tsv',
+            'ADS_RECORD_STATS_VOLUME': 'records_agg_volume.tsv',
+            'ADS_STATS_CACHE': tmpdir,
+            'ADS_BIBSTEMS': '{0}/bibstems.dat'.format(tmpdir),
+            'ADS_PUBLISHER_DATA': '{0}/publishers.dat'.format(tmpdir),
+            'ADS_COMPLETENESS_DATA': '{0}/completeness.json'.format(tmpdir),
+            'OUTPUT_DIRECTORY': '{0}/reports'.format(tmpdir),
+            'MANIFEST_DIRECTORY': '',
+            'JOURNALS': dict(self.config['JOURNALS'], AST=journals)
+        }
+        conf = dict(self.config, **overrides)
+        self.server.service = ReportService(conf)
+        with mock.patch('xreport.compat.load_config', side_effect=lambda proj_home=None: dict(conf)):
+            status, data = self._request('/report', {'collection': 'AST', 'subject': 'FULLTEXT', 'no_drive': True})
+            self.assertEqual((status, len(data['reports'])), (200, 1))
+            self.assertEqual(journals, ['ApJ', 'XYZ', 'AJ'])
+            status, data = self._request('/report', {'collection': 'AST', 'subject': 'FULLTEXT', 'year': 2000, 'no_drive': True})
+            self.assertEqual((status, len(data['reports'])), (200, 1))
+            self.assertEqual(journals, ['ApJ', 'XYZ', 'AJ'])
+
+    def test_invalid_request(self):
+        '''Test that invalid requests are rejected'''
+        with mock.patch('xreport.tasks.create_report') as create_report:
+            # Reports are not created with a GET request
+            status, data = self._request('/report?collection=AST&subject=FULLTEXT')
+            self.assertEqual(status, 405)
+            status, data = self._request('/report', {'collection': 'XYZ', 'subject': 'FULLTEXT'})
+            self.assertEqual(status, 400)
+            self.assertIn('collection parameter', data['error'])
+            status, data = self._request('/report', {'collection': 'AST', 'subject': 'METADATA', 'format': 'curators'})
+            self.assertEqual(status, 400)
+            status, data = self._request('/report', ['AST'])
+            self.assertEqual(status, 400)
+            status, data = self._request('/unknown')
+            self.assertEqual(status, 404)
+            self.assertFalse(create_report.called)
+            create_report.side_effect = Exception('API unavailable')
+            status, data = self._request('/report', {'collection': 'AST', 'subject': 'FULLTEXT'})
+            self.assertEqual((status, data['error']), (500, 'API unavailable'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import mock
+from xreport.stats import StatsStore
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        from xreport.compat import load_config
+        self.proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../../'))
+        self.config = load_config(proj_home=self.proj_home)
+        self.config['ADS_STATS_DATA'] = '{0}/xreport/tests/data'.format(self.proj_home)
+        self.config['ADS_RECORD_STATS_YEAR'] = 'records_agg_year.tsv'
+        self.config['ADS_RECORD_STATS_VOLUME'] = 'records_agg_volume.tsv'
+        self.cache_dir = tempfile.mkdtemp()
+        self.config['ADS_STATS_CACHE'] = self.cache_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_stats_store(self):
+        '''Test loading and normalization of statistics data'''
+        store = StatsStore()
+        vol_df = store.get_frame(self.config, 'volume')
+        # Periods have been removed from bibstems and volumes, non-numerical volumes are skipped
+        self.assertListEqual(sorted(set(vol_df['bibstem'])), ['ApJ', 'MNRAS'])
+        self.assertListEqual(list(vol_df['volume']), [889, 900, 905, 500])
+        # The data frame is parsed just once
+        self.assertIs(store.get_frame(self.config, 'volume'), vol_df)
+        # Selection by journals
+        year_df = store.select(self.config, 'year', ['ApJ'])
+        self.assertListEqual(list(year_df['year']), [2012, 2015, 2020])
+        self.assertListEqual(list(year_df['record_count']), [189, 186, 196])
+
+    def test_stats_sidecar(self):
+        '''Test that statistics data are loaded from the binary sidecar file'''
+        vol_df = StatsStore().get_frame(self.config, 'volume')
+        self.assertTrue(os.path.exists('{0}/records_agg_volume.tsv.pkl'.format(self.cache_dir)))
+        self.assertEqual(str(vol_df['bibstem'].dtype), 'category')
+        # A new store (e.g. in a new process) does not parse the statistics file again
+        with mock.patch('xreport.stats._read_stats') as read_stats:
+            sidecar_df = StatsStore().get_frame(self.config, 'volume')
+            self.assertFalse(read_stats.called)
+        self.assertListEqual(list(sidecar_df['volume']), list(vol_df['volume']))
+
+    def test_stats_store_invalidation(self):
+        '''Test that the statistics data are reloaded when the file changes'''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = '{0}/records_agg_year.tsv'.format(self.config['ADS_STATS_DATA'])
+            shutil.copy(src, tmpdir)
+            self.config['ADS_STATS_DATA'] = tmpdir
+            store = StatsStore()
+            year_df = store.get_frame(self.config, 'year')
+            self.assertEqual(len(year_df), 5)
+            with open('{0}/records_agg_year.tsv'.format(tmpdir), 'a') as fh:
+                fh.write('MNRAS\t2021\t100\t90\t80\t1000\t900\n')
+            self.assertEqual(len(store.get_frame(self.config, 'year')), 6)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stats_cube(self):
+        '''Test getting journal data for all journals from the statistics cube'''
+        store = StatsStore()
+        cube = store.get_cube(self.config, 'volume', ['ApJ', 'MNRAS'])
+        self.assertEqual(cube.ranges(), {'ApJ': (889, 905), 'MNRAS': (500, 500)})
+        expected = {'ApJ': {889: 189, 900: 196, 905: 129}, 'MNRAS': {500: 196}}
+        self.assertEqual(cube.values('record_count'), expected)
+        coverage = cube.coverage('records_with_fulltext')
+        self.assertListEqual(sorted(coverage['ApJ'].keys()), ['889', '900', '905'])
+        self.assertAlmostEqual(coverage['ApJ']['900'], 190/196)
+        self.assertAlmostEqual(coverage['MNRAS']['500'], 150/196)
+        # The cube is shared for the same set of journals, but not for a subset of them
+        self.assertIs(store.get_cube(self.config, 'volume', ['MNRAS', 'ApJ']), cube)
+        self.assertEqual(store.get_cube(self.config, 'volume', ['ApJ']).journals, ['ApJ'])
+        # Entries without references can be skipped
+        cube = store.get_cube(self.config, 'year', ['A&A'])
+        self.assertEqual(cube.coverage('matched_reference_count', 'reference_count', skip_empty=True), {})
+
+    def test_stats_cube_cache(self):
+        '''Test that only the most recently used statistics cubes are kept'''
+        self.config['STATS_CUBE_CACHE_SIZE'] = 2
+        store = StatsStore()
+        apj = store.get_cube(self.config, 'volume', ['ApJ'])
+        mnras = store.get_cube(self.config, 'volume', ['MNRAS'])
+        self.assertIs(store.get_cube(self.config, 'volume', ['ApJ']), apj)
+        # A third cube pushes out the least recently used one
+        store.get_cube(self.config, 'volume', ['ApJ', 'MNRAS'])
+        self.assertEqual(len(store._cubes), 2)
+        self.assertIs(store.get_cube(self.config, 'volume', ['ApJ']), apj)
+        self.assertIsNot(store.get_cube(self.config, 'volume', ['MNRAS']), mnras)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import mock
+import openpyxl
+from xreport import tasks
+from xreport.compat import load_config
+from xreport.ledger import query_ledger
+
+class TestMethods(unittest.TestCase):
+
+    '''Check if methods return expected results'''
+    def setUp(self):
+        self.jobs = [{'collection': coll, 'format': 'general', 'subject': 'FULLTEXT', 'use_year': False}
+                     for coll in ['AST', 'PS', 'HP']]
+
+    def _create_report(self, **args):
+        # Mock for creating a report: one collection fails, and all record an API call
+        query_ledger.record({'query': args['collection'], 'source': 'api', 'latency': 0.1})
+        if args['collection'] == 'PS':
+            raise Exception('no data for PS')
+
+    def test_create_reports(self):
+        '''Test that all reports are created and failures are collected'''
+        query_ledger.start()
+        try:
+            with mock.patch('xreport.tasks.create_report', side_effect=self._create_report) as create_report:
+                failures = tasks.create_reports(self.jobs)
+            self.assertEqual(create_report.call_count, 3)
+        finally:
+            query_ledger.stop()
+        self.assertEqual(failures, [(self.jobs[1], 'no data for PS')])
+        self.assertEqual([e['query'] for e in query_ledger.entries], ['AST', 'PS', 'HP'])
+
+    def test_create_reports_parallel(self):
+        '''Test creating reports with a pool of worker processes'''
+        query_ledger.start()
+        try:
+            with mock.patch('xreport.tasks.create_report', side_effect=self._create_report):
+                failures = tasks.create_reports(self.jobs, processes=2)
+        finally:
+            query_ledger.stop()
+        self.assertEqual(failures, [(self.jobs[1], 'no data for PS')])
+        # The API calls made in the worker processes end up in the ledger of this process
+        self.assertEqual(sorted(e['query'] for e in query_ledger.entries), ['AST', 'HP', 'PS'])
+
+    def _report_config(self, stats=True):
+        # Configuration with temporary input files (without the statistics files, if so requested)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        if stats:
+            proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../../'))
+            for fname in ['records_agg_year.tsv', 'records_agg_volume.tsv']:
+                shutil.copy('{0}/xreport/tests/data/{1}'.format(proj_home, fname), tmpdir)
+        with open('{0}/bibstems.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tJ\tThe Astrophysical Journal\n')
+        with open('{0}/publishers.dat'.format(tmpdir), 'w') as fh:
+            fh.write('ApJ..\tIOP\n')
+        with open('{0}/completeness.json'.format(tmpdir), 'w') as fh:
+            json.dump([], fh)
+        overrides = {
+            'ADS_STATS_DATA': tmpdir,
+            'ADS_RECORD_STATS_YEAR': 'records_agg_year.tsv',
+            'ADS_RECORD_STATS_VOLUME': 'records_agg_volume.tsv',
+            'ADS_STATS_CACHE': tmpdir,
+            'ADS_BIBSTEMS': '{0}/bibstems.dat'.format(tmpdir),
+            'ADS_PUBLISHER_DATA': '{0}/publishers.dat'.format(tmpdir),
+            'ADS_COMPLETENESS_DATA': '{0}/completeness.json'.format(tmpdir),
+            'OUTPUT_DIRECTORY': '{0}/reports'.format(tmpdir),
+            'MANIFEST_DIRECTORY': ''
+        }
+        return lambda proj_home=None: dict(load_config(proj_home=proj_home), **overrides)
+
+    def test_create_report_failure(self):
+        '''Test that a report that cannot be created fails the job'''
+        jobs = [dict(job, no_drive=True) for job in self.jobs[:2]]
+        with mock.patch('xreport.compat.load_config', side_effect=self._report_config(stats=False)):
+            with self.assertRaises(tasks.ReportException) as cm:
+                tasks.create_report(**jobs[0])
+            self.assertIn("Error making full text report for collection 'AST'", str(cm.exception))
+            failures = tasks.create_reports(jobs)
+            self.assertEqual([job for job, error in failures], jobs)
+            # The same in worker processes (which are forked, so the configuration is the same)
+            failures = tasks.create_reports(jobs, processes=2)
+            self.assertEqual([job for job, error in failures], jobs)
+            self.assertTrue(all('Error making full text report' in error for job, error in failures))
+
+    def test_create_report_not_saved(self):
+        '''Test that a report that failed to be made is not saved'''
+        job = dict(self.jobs[0], no_drive=True)
+        with mock.patch('xreport.compat.load_config', side_effect=self._report_config(stats=False)), \
+             mock.patch('xreport.tasks.FullTextReport.save_report') as save_report:
+            with self.assertRaises(tasks.ReportException):
+                tasks.create_report(**job)
+        self.assertFalse(save_report.called)
+
+    def test_create_missing_report(self):
+        '''Test that the publications without full text are written as they are retrieved'''
+        records = [{'bibcode': '2022ApJ...924...{0}A'.format(n), 'title': ['Paper {0}'.format(n)]} for n in range(3)]
+        retrieved = []
+        def get_records(*args, **kwargs):
+            # The records are retrieved lazily
+            for record in records:
+                retrieved.append(record['bibcode'])
+                yield record
+        job = dict(self.jobs[0], format='missing', no_drive=True)
+        with mock.patch('xreport.compat.load_config', side_effect=self._report_config()), \
+             mock.patch('xreport.reports._get_records', side_effect=get_records), \
+             mock.patch('xreport.tasks.FullTextReport.save_report') as save_report:
+            reports = tasks.create_report(**job)
+        self.assertFalse(save_report.called)
+        self.assertEqual(retrieved, [record['bibcode'] for record in records])
+        output_files = reports[0].output_files
+        self.assertEqual([os.path.basename(f).split('_')[:2] for f in output_files], [['fulltext', 'ApJ']])
+        wb = openpyxl.load_workbook(output_files[0])
+        self.assertEqual([row[0] for row in wb.active.iter_rows(values_only=True)], ['bibcode'] + retrieved)
+
+    def test_sweep_reports(self):
+        '''Test creating reports as a graph of shared stages'''
+        jobs = [dict(job, use_year=2000, no_drive=(job['collection'] == 'HP')) for job in self.jobs]
+        report = mock.Mock()
+        with mock.patch('xreport.tasks.create_report', return_value=[report]) as create_report, \
+             mock.patch('xreport.tasks.get_context') as get_context, \
+             mock.patch('xreport.tasks.stats_store') as stats_store:
+            failures, graph = tasks.sweep_reports(jobs, workers=2)
+        self.assertEqual(failures, [])
+        # The statistics are aggregated once, and reports are created without uploading them
+        self.assertEqual(sorted(c[0][1] for c in stats_store.get_frame.call_args_list), ['volume', 'year'])
+        get_context.return_value.get_bibstems.assert_called()
+        # The cubes of a collection are built by year and by volume
+        self.assertEqual(graph.stages['cube AST'].inputs, ['stats aggregate (year)', 'stats aggregate (volume)', 'load bibstems'])
+        self.assertEqual(create_report.call_count, 3)
+        self.assertTrue(all(call.kwargs['no_drive'] for call in create_report.call_args_list))
+        # The reports are uploaded in separate stages (except when upload is skipped)
+        self.assertEqual(report.upload_reports.call_count, 2)
+        self.assertIn('upload FULLTEXT general AST (year)', graph.stages)
+        self.assertNotIn('upload FULLTEXT general HP (year)', graph.stages)
+        path = graph.critical_path()
+        self.assertEqual(path[0].inputs, [])
+        self.assertIn(path[-1].name.split(' ')[0], ['report', 'upload'])
+
+    def test_sweep_reports_report_failure(self):
+        '''Test that a failed report is not uploaded and fails the job'''
+        report = mock.Mock()
+        def create_report(**args):
+            if args['collection'] == 'PS':
+                raise tasks.ReportException("Error making full text report for collection 'PS'")
+            return [report]
+        with mock.patch('xreport.tasks.create_report', side_effect=create_report), \
+             mock.patch('xreport.tasks.get_context'), \
+             mock.patch('xreport.tasks.stats_store'):
+            failures, graph = tasks.sweep_reports(self.jobs, workers=2)
+        self.assertEqual(failures, [(self.jobs[1], "Error making full text report for collection 'PS'")])
+        self.assertEqual(graph.stages['upload FULLTEXT general PS (volume)'].state, 'skipped')
+        self.assertEqual(report.upload_reports.call_count, 2)
+
+    def test_sweep_reports_failure(self):
+        '''Test that a failed shared stage fails the reports depending on it'''
+        jobs = [dict(job, no_drive=True) for job in self.jobs]
+        with mock.patch('xreport.tasks.create_report') as create_report, \
+             mock.patch('xreport.tasks.get_context'), \
+             mock.patch('xreport.tasks.stats_store') as stats_store:
+            stats_store.get_frame.side_effect = Exception('no stats file')
+            failures, graph = tasks.sweep_reports(jobs)
+        self.assertFalse(create_report.called)
+        self.assertEqual([job['collection'] for job, error in failures], ['AST', 'PS', 'HP'])
+        self.assertTrue(all(error.startswith('input cube') for job, error in failures))
+
+if __name__ == '__main__':
+    unittest.main()
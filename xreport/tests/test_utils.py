@@ -1,15 +1,33 @@
 import os
 import sys
+import shutil
+import tempfile
 import unittest
+import mock
 import httpretty
+import requests
 import json
+import asyncio
+import time
 import urllib.request, urllib.parse, urllib.error
 from xreport.utils import _group
 from xreport.utils import _make_dict
 from xreport.utils import _get_citations
 from xreport.utils import _get_usage
+from xreport.utils import _get_usage_totals
+from xreport.utils import _sum_usage
 from xreport.utils import _get_facet_data
+from xreport.utils import _get_query_counts
+from xreport.utils import _do_query
+from xreport.utils import _response_cache_file
 from xreport.utils import _get_records
+from xreport.utils import _get_records_async
+from xreport.utils import _get_facet_data_async
+from xreport.utils import _get_fulltext_counts
+from xreport.utils import _count_fulltext_line
+from xreport.utils import _scan_index
+from xreport.utils import _resident
+from xreport.utils import _parse_usage_lines
 
 class TestMethods(unittest.TestCase):
 
@@ -74,6 +92,57 @@ class TestMethods(unittest.TestCase):
         except Exception as err:
             self.assertEqual(str(err), expected)
 
+    @httpretty.activate
+    def test_query_retries(self):
+        '''Test that only failures that may be temporary are retried'''
+        # Use an API client without rate limit, so that the only waits are those between retries
+        self.config['ADS_API_RATE'] = None
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # A malformed query is not retried
+        httpretty.register_uri(httpretty.GET, query_url, status=400, body='{}')
+        with mock.patch('xreport.utils.time.sleep') as mock_sleep:
+            with self.assertRaises(Exception):
+                _do_query(self.config, {'q': 'star('})
+            self.assertFalse(mock_sleep.called)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        # When rate limited, the wait time requested by the API is used
+        responses = [httpretty.Response(body='{}', status=429, adding_headers={'Retry-After': '7'}),
+                     httpretty.Response(body=json.dumps({'response': {'docs': []}}), status=200)]
+        httpretty.reset()
+        httpretty.register_uri(httpretty.GET, query_url, responses=responses)
+        with mock.patch('xreport.utils.time.sleep') as mock_sleep, \
+             mock.patch('xreport.client.RateLimiter.pause') as mock_pause:
+            self.assertEqual(_do_query(self.config, {'q': 'star'}), {'response': {'docs': []}})
+            mock_sleep.assert_called_once_with(7.0)
+            # All other requests are put on hold as well
+            mock_pause.assert_called_once_with(7.0)
+        # The wait time requested by the API is capped by the maximum wait time between retries
+        responses = [httpretty.Response(body='{}', status=429, adding_headers={'Retry-After': '3600'}),
+                     httpretty.Response(body=json.dumps({'response': {'docs': []}}), status=200)]
+        httpretty.reset()
+        httpretty.register_uri(httpretty.GET, query_url, responses=responses)
+        with mock.patch('xreport.utils.time.sleep') as mock_sleep, \
+             mock.patch('xreport.client.RateLimiter.pause') as mock_pause:
+            self.assertEqual(_do_query(self.config, {'q': 'planet'}), {'response': {'docs': []}})
+            mock_sleep.assert_called_once_with(60)
+        # Requests that cannot be sent are not retried
+        with mock.patch('xreport.utils.time.sleep') as mock_sleep:
+            for url in ['', 'api.adsabs.harvard.edu/v1', 'http://']:
+                with self.assertRaises(requests.exceptions.RequestException):
+                    _do_query(dict(self.config, ADS_API_URL=url), {'q': 'star'})
+            self.assertFalse(mock_sleep.called)
+        # Server errors are retried with exponentially increasing wait times
+        httpretty.reset()
+        httpretty.register_uri(httpretty.GET, query_url, status=503, body='{}')
+        with mock.patch('xreport.utils.time.sleep') as mock_sleep:
+            with self.assertRaises(Exception):
+                _do_query(self.config, {'q': 'star'})
+            waits = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(waits), 4)
+        for i, wait in enumerate(waits):
+            self.assertTrue(2**i / 2 <= wait <= 2**i)
+
     @httpretty.activate
     def test_get_citations_invalid_JSON_response(self):
         # The URL to mock
@@ -93,6 +162,96 @@ class TestMethods(unittest.TestCase):
         except Exception as err:
             self.assertEqual(str(err), expected)
 
+    @httpretty.activate
+    def test_response_cache(self):
+        '''Test caching of API responses on disk'''
+        datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+        with open(datafile) as mdata:
+            mockdata = json.load(mdata)
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # Register the URL and mock data
+        httpretty.register_uri(
+                    httpretty.GET, 
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=json.dumps(mockdata))
+        cache_dir = tempfile.mkdtemp()
+        self.config['ADS_API_CACHE'] = cache_dir
+        try:
+            params = {'q': 'star', 'facet.field': 'year', 'rows': 1}
+            self.assertEqual(_do_query(self.config, params), mockdata)
+            # The same query (with parameters in a different order) is served from the cache
+            self.assertEqual(_do_query(self.config, {'rows': 1, 'facet.field': 'year', 'q': 'star'}), mockdata)
+            self.assertEqual(len(httpretty.latest_requests()), 1)
+            # A different query is not
+            _do_query(self.config, {'q': 'planet', 'facet.field': 'year', 'rows': 1})
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+            # Ignore the cache when refreshing or when the cache is disabled
+            self.config['REFRESH_CACHE'] = True
+            _do_query(self.config, params)
+            self.assertEqual(len(httpretty.latest_requests()), 3)
+            self.config['REFRESH_CACHE'] = False
+            self.config['NO_CACHE'] = True
+            _do_query(self.config, params)
+            self.assertEqual(len(httpretty.latest_requests()), 4)
+            self.config['NO_CACHE'] = False
+            # Expired responses are retrieved again
+            self.config['ADS_API_CACHE_TTL'] = 0
+            with mock.patch('xreport.utils.time.time', return_value=time.time() + 1):
+                _do_query(self.config, params)
+            self.assertEqual(len(httpretty.latest_requests()), 5)
+            # The least recently used responses are removed when the cache exceeds its maximum size
+            self.config['ADS_API_CACHE_TTL'] = 86400
+            star_file = _response_cache_file(self.config, params, 'search/query')
+            planet_file = _response_cache_file(self.config, {'q': 'planet', 'facet.field': 'year', 'rows': 1}, 'search/query')
+            self.assertEqual(sorted(os.listdir(cache_dir)), sorted([os.path.basename(star_file), os.path.basename(planet_file)]))
+            # Responses are stored as JSON
+            with open(star_file) as fh:
+                self.assertEqual(json.load(fh)['response'], mockdata)
+            # The cache directory is not scanned when the cache is below its maximum size
+            with mock.patch('xreport.utils.os.scandir', wraps=os.scandir) as scandir:
+                _do_query(self.config, {'q': 'sun', 'facet.field': 'year', 'rows': 1})
+                self.assertFalse(scandir.called)
+            os.remove(_response_cache_file(self.config, {'q': 'sun', 'facet.field': 'year', 'rows': 1}, 'search/query'))
+            os.utime(star_file, (1000, 1000))
+            os.utime(planet_file, (2000, 2000))
+            # Using a cached response marks it as recently used
+            _do_query(self.config, params)
+            self.config['ADS_API_CACHE_SIZE'] = 2.5 * os.path.getsize(star_file) / (1024 * 1024)
+            _do_query(self.config, {'q': 'moon', 'facet.field': 'year', 'rows': 1})
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            self.assertTrue(os.path.exists(star_file))
+            self.assertFalse(os.path.exists(planet_file))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    @httpretty.activate
+    def test_get_query_counts(self):
+        # Get the mock data for testing facet query counts
+        datafile = '{0}/xreport/tests/data/FacetQueryCount.json'.format(self.proj_home)
+        with open(datafile) as mdata:
+            mockdata = json.load(mdata)
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # Register the URL and mock data
+        httpretty.register_uri(
+                    httpretty.GET, 
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=json.dumps(mockdata))
+        # Do the query
+        q = "bibstem:(ApJ) doctype:(article OR inproceedings)"
+        facet_queries = {'oarecs': 'property:openaccess', 'refrecs': 'property:refereed', 'other': 'property:other'}
+        nrecs, counts = _get_query_counts(self.config, q, facet_queries)
+        self.assertEqual(nrecs, 18584)
+        self.assertEqual(counts, {'oarecs': 12037, 'refrecs': 18460, 'other': 0})
+        # All counts were requested in a single query
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(httpretty.last_request().querystring['facet.query'], list(facet_queries.values()))
+
     @httpretty.activate
     def test_get_facet_data(self):
         # Get the mock data for testing year counts
@@ -149,7 +308,89 @@ class TestMethods(unittest.TestCase):
         q = "star"
         expected = {'author_norm': ['Kobayashi, C', 'Karakas, A', 'Lugaro, M'], 'bibcode': '2020ApJ...900..179K', 
                     'citation_count': 152, 'title': ['The Origin of Elements from Carbon to Uranium']}
-        self.assertEqual(_get_records(self.config, q, 'bibcode')[0], expected)
+        records = _get_records(self.config, q, 'bibcode')
+        self.assertEqual(next(records), expected)
+        # Without a next cursor, only one page is retrieved
+        self.assertEqual(len(list(records)), 9)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+    @httpretty.activate
+    def test_get_records_cursor(self):
+        # Mock data for three pages of results, linked by cursor marks
+        pages = {
+            '*': {'response': {'numFound': 5, 'docs': [{'bibcode': 'a'}, {'bibcode': 'b'}]}, 'nextCursorMark': 'c1'},
+            'c1': {'response': {'numFound': 5, 'docs': [{'bibcode': 'c'}, {'bibcode': 'd'}]}, 'nextCursorMark': 'c2'},
+            'c2': {'response': {'numFound': 5, 'docs': [{'bibcode': 'e'}]}, 'nextCursorMark': 'c3'},
+            'c3': {'response': {'numFound': 5, 'docs': []}, 'nextCursorMark': 'c3'}
+        }
+        def request_callback(request, uri, response_headers):
+            return [200, response_headers, json.dumps(pages[request.querystring['cursorMark'][0]])]
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # Register the URL and mock data
+        httpretty.register_uri(
+                    httpretty.GET, 
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=request_callback)
+        records = _get_records(self.config, 'star', 'bibcode', rows=2)
+        # Records are retrieved page by page, as they are consumed
+        self.assertEqual(next(records), {'bibcode': 'a'})
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual([r['bibcode'] for r in records], ['b', 'c', 'd', 'e'])
+        self.assertEqual(len(httpretty.latest_requests()), 4)
+        self.assertEqual(httpretty.last_request().querystring['sort'], ['id asc'])
+
+    @httpretty.activate
+    def test_get_records_parallel(self):
+        # Mock data: 25 records, returned in pages of 3 records
+        def request_callback(request, uri, response_headers):
+            start = int(request.querystring['start'][0])
+            docs = [{'bibcode': str(i)} for i in range(start, min(start + 3, 25))]
+            return [200, response_headers, json.dumps({'response': {'numFound': 25, 'docs': docs}})]
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # Register the URL and mock data
+        httpretty.register_uri(
+                    httpretty.GET, 
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=request_callback)
+        records = _get_records(self.config, 'star', 'bibcode', rows=3, workers=4)
+        # All pages are retrieved and the records are returned in order
+        self.assertEqual([r['bibcode'] for r in records], [str(i) for i in range(25)])
+        self.assertEqual(len(httpretty.latest_requests()), 9)
+
+    @httpretty.activate
+    def test_async_queries(self):
+        '''Test the async variants of the data retrieval functions'''
+        def request_callback(request, uri, response_headers):
+            if 'facet.field' in request.querystring:
+                datafile = '{0}/xreport/tests/data/FacetDataYearCount.json'.format(self.proj_home)
+                with open(datafile) as mdata:
+                    return [200, response_headers, mdata.read()]
+            start = int(request.querystring['start'][0])
+            docs = [{'bibcode': str(i)} for i in range(start, min(start + 3, 7))]
+            return [200, response_headers, json.dumps({'response': {'numFound': 7, 'docs': docs}})]
+        # The URL to mock
+        query_url = "{}/search/query".format(self.config['ADS_API_URL'])
+        # Register the URL and mock data
+        httpretty.register_uri(
+                    httpretty.GET, 
+                    query_url,
+                    content_type='application/json',
+                    status=200,
+                    body=request_callback)
+        async def run_queries():
+            facets = await asyncio.gather(*[_get_facet_data_async(self.config, q, 'year') for q in ['star', 'planet']])
+            records = [r['bibcode'] async for r in _get_records_async(self.config, 'star', 'bibcode', rows=3, workers=2)]
+            return facets, records
+        facets, records = asyncio.run(run_queries())
+        expected = {2012: 3118, 2015: 3055, 2016: 3038, 2017: 3104, 2019: 3190, 2020: 3079}
+        self.assertEqual(facets, [expected, expected])
+        self.assertEqual(records, [str(i) for i in range(7)])
 
     def test_get_usage(self):
         '''Test getting usage data'''
@@ -157,6 +398,8 @@ class TestMethods(unittest.TestCase):
             'reads':'{0}/xreport/tests/data/reads.links'.format(self.proj_home),
             'downloads':'{0}/xreport/tests/data/downloads.links'.format(self.proj_home)
         }
+        self.config['CLASSIC_INDEX_CACHE'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['CLASSIC_INDEX_CACHE'])
         # Expected reads and downloads data for a set of bibcodes
         bibcodes = ['2022ApJ...924...44A','2022A&A...660A..44K','2022MNRAS.509...44W']
         expected_bibcodes_reads = (449, 288)
@@ -170,6 +413,151 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(_get_usage(self.config, bibcodes=bibcodes, udata='downloads'), expected_bibcodes_downloads)
         self.assertEqual(_get_usage(self.config, jrnls=journals), expected_journals_reads)
         self.assertEqual(_get_usage(self.config, jrnls=journals, udata='downloads'), expected_journals_downloads)
+        # Usage data for journals from the usage totals per bibstem
+        totals = _get_usage_totals(self.config)
+        self.assertEqual(_sum_usage(totals, journals), expected_journals_reads)
+        totals = _get_usage_totals(self.config, udata='downloads')
+        self.assertEqual(_sum_usage(totals, journals), expected_journals_downloads)
+        # The usage table is stored in a sidecar file and not compiled again
+        self.assertTrue(os.path.exists('{0}/reads.links.usage.pkl'.format(self.config['CLASSIC_INDEX_CACHE'])))
+        with mock.patch('xreport.utils._scan_index') as scan_index, \
+             mock.patch('xreport.utils._load_pickle') as load_pickle:
+            self.assertEqual(_get_usage(self.config, jrnls=journals), expected_journals_reads)
+            self.assertFalse(scan_index.called)
+            # The usage table is kept in memory
+            self.assertFalse(load_pickle.called)
+
+    def test_get_fulltext_counts(self):
+        '''Test aggregating the Classic full text index'''
+        self.config['CLASSIC_FULLTEXT_INDEX'] = '{0}/xreport/tests/data/fulltext.links'.format(self.proj_home)
+        self.config['CLASSIC_INDEX_CACHE'] = tempfile.mkdtemp()
+        try:
+            # Aggregate by volume
+            counts = _get_fulltext_counts(self.config, {'MNRAS'})
+            self.assertEqual(counts[('MNRAS', 501, 'arxiv')], 8)
+            self.assertEqual(counts[('MNRAS', 501, 'publisher')], 3)
+            # Only the requested journals are included
+            self.assertEqual(set(k[0] for k in counts.keys()), {'MNRAS'})
+            # Aggregate by year
+            counts = _get_fulltext_counts(self.config, {'MNRAS'}, use_year=True)
+            self.assertEqual(counts[('MNRAS', 2022, 'arxiv')], 9)
+            # The aggregate is kept in memory for as long as the index file does not change
+            with mock.patch('xreport.utils._load_pickle') as load_pickle:
+                counts = _get_fulltext_counts(self.config, {'MNRAS'}, use_year=True)
+                self.assertFalse(load_pickle.called)
+            self.assertEqual(counts[('MNRAS', 2022, 'arxiv')], 9)
+        finally:
+            shutil.rmtree(self.config['CLASSIC_INDEX_CACHE'])
+
+    def test_get_fulltext_counts_incremental(self):
+        '''Test that only lines appended to the Classic full text index are processed'''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            index_file = '{0}/all.links'.format(tmpdir)
+            shutil.copy('{0}/xreport/tests/data/fulltext.links'.format(self.proj_home), index_file)
+            self.config['CLASSIC_FULLTEXT_INDEX'] = index_file
+            self.config['CLASSIC_INDEX_CACHE'] = tmpdir
+            counts = _get_fulltext_counts(self.config, {'MNRAS'})
+            self.assertEqual(counts[('MNRAS', 501, 'arxiv')], 8)
+            # Append lines to the index: only these lines are processed
+            with open(index_file, 'a') as fh:
+                fh.write('2021MNRAS.501..999X\t/some/file.pdf\tarXiv\n')
+                fh.write('2021MNRAS.501.1000X\t/some/file.pdf\tOUP\n')
+            with mock.patch('xreport.utils._count_fulltext_line', wraps=_count_fulltext_line) as count_line:
+                counts = _get_fulltext_counts(self.config, {'MNRAS'})
+                self.assertEqual(count_line.call_count, 2)
+            self.assertEqual(counts[('MNRAS', 501, 'arxiv')], 9)
+            self.assertEqual(counts[('MNRAS', 501, 'publisher')], 4)
+            # Rewrite the index: the aggregate is rebuilt from scratch
+            with open(index_file, 'w') as fh:
+                fh.write('2021MNRAS.501..999X\t/some/file.pdf\tarXiv\n')
+            counts = _get_fulltext_counts(self.config, {'MNRAS'})
+            self.assertEqual(dict(counts), {('MNRAS', 501, 'arxiv'): 1})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_get_fulltext_counts_modified(self):
+        '''Test that the aggregate is rebuilt when the processed part of the full text index changed'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        index_file = '{0}/all.links'.format(tmpdir)
+        with open('{0}/xreport/tests/data/fulltext.links'.format(self.proj_home), 'rb') as fh:
+            data = fh.read()
+        # The MNRAS records are in the middle of a large index
+        filler = b'2020ApJ...900....1A\t/some/file.pdf\tIOP\n' * 50000
+        with open(index_file, 'wb') as fh:
+            fh.write(filler + data + filler)
+        self.config['CLASSIC_FULLTEXT_INDEX'] = index_file
+        self.config['CLASSIC_INDEX_CACHE'] = tmpdir
+        counts = _get_fulltext_counts(self.config, {'MNRAS'})
+        self.assertEqual((counts[('MNRAS', 501, 'arxiv')], counts[('MNRAS', 501, 'publisher')]), (8, 3))
+        # An edit in the middle of the index that keeps its size
+        edited = data.replace(b'13490.pdf\tarXiv', b'13490.pdf\tWiley')
+        self.assertNotEqual(edited, data)
+        with open(index_file, 'wb') as fh:
+            fh.write(filler + edited + filler)
+        st = os.stat(index_file)
+        os.utime(index_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        _resident.clear()
+        counts = _get_fulltext_counts(self.config, {'MNRAS'})
+        self.assertEqual((counts[('MNRAS', 501, 'arxiv')], counts[('MNRAS', 501, 'publisher')]), (7, 4))
+        # An edit in the middle of the index, together with appended lines
+        with open(index_file, 'wb') as fh:
+            fh.write(filler + data + filler + b'2021MNRAS.501..999X\t/some/file.pdf\tarXiv\n')
+        _resident.clear()
+        counts = _get_fulltext_counts(self.config, {'MNRAS'})
+        self.assertEqual((counts[('MNRAS', 501, 'arxiv')], counts[('MNRAS', 501, 'publisher')]), (9, 3))
+
+    def test_scan_index(self):
+        '''Test scanning Classic index files'''
+        index_file = '{0}/xreport/tests/data/reads.links'.format(self.proj_home)
+        with open(index_file, 'rb') as fh:
+            expected = fh.read().split(b'\n')[:-1]
+        # The lines are the same, regardless of the block size used for scanning
+        for blocksize in [1, 100, 16777216]:
+            lines = [l for block, offset in _scan_index(index_file, blocksize=blocksize) for l in block]
+            self.assertEqual(lines, expected)
+        # Filter on bibstem
+        lines = [l for block, offset in _scan_index(index_file, include={b'MNRAS'}) for l in block]
+        self.assertEqual(lines, [l for l in expected if l[4:9] == b'MNRAS'])
+        # Parse usage data
+        bibstems, usage = _parse_usage_lines(expected[:2])
+        self.assertEqual(bibstems.tolist(), [b'A&A..', b'A&A..'])
+        self.assertEqual(usage.sum(axis=1).tolist(), [45, 122])
+        self.assertEqual(usage[:, -1].tolist(), [30, 96])
+        # Lines with fewer columns are aligned on the last column
+        bibstems, usage = _parse_usage_lines([b'2022ApJ...924...44A\t1\t2\t3', b'2022ApJ...924...45A\t4'])
+        self.assertEqual(usage.tolist(), [[1, 2, 3], [0, 0, 4]])
+        # Non-numerical usage data are rejected
+        with self.assertRaises(ValueError):
+            _parse_usage_lines([b'2022ApJ...924...44A\t1\tx\t3'])
+
+    def test_scan_index_no_final_newline(self):
+        '''Test scanning Classic index files of which the last line has no newline'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open('{0}/xreport/tests/data/reads.links'.format(self.proj_home), 'rb') as fh:
+            expected = fh.read().split(b'\n')[:-1]
+        index_file = '{0}/reads.links'.format(tmpdir)
+        with open(index_file, 'wb') as fh:
+            fh.write(b'\n'.join(expected))
+        # The last line is included, regardless of the block size used for scanning
+        for blocksize in [1, 100, 16777216]:
+            lines = [l for block, offset in _scan_index(index_file, blocksize=blocksize) for l in block]
+            self.assertEqual(lines, expected)
+        # When resuming from the offset returned, the last line is left for the next scan
+        blocks = list(_scan_index(index_file, resume=True))
+        self.assertEqual([l for block, offset in blocks for l in block], expected[:-1])
+        self.assertEqual(blocks[-1][1], os.path.getsize(index_file) - len(expected[-1]))
+        # The usage of the last record is counted
+        self.config['CLASSIC_USAGE_INDEX'] = {'reads': index_file}
+        self.config['CLASSIC_INDEX_CACHE'] = tmpdir
+        bibcode = expected[-1].partition(b'\t')[0].decode('utf-8')
+        bibstems, usage = _parse_usage_lines(expected[-1:])
+        self.assertEqual(_get_usage(self.config, bibcodes=[bibcode]), (int(usage.sum()), int(usage[0, -1])))
+        bibstems, usage = _parse_usage_lines(expected)
+        totals = _get_usage_totals(self.config)
+        self.assertEqual(sum(t for t, r in totals.values()), int(usage.sum()))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -2,10 +2,22 @@ import re
 import os
 import sys
 import time
+import random
 import urllib.request, urllib.parse, urllib.error
-import requests
 import math
 import functools
+import itertools
+import asyncio
+import pickle
+import hashlib
+import mmap
+import json
+import threading
+import numpy as np
+import requests
+from collections import Counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from adsgcon.gmanager import GoogleManager
 import openpyxl
@@ -14,12 +26,26 @@ from urllib.parse import urlencode, urlunparse
 # ============================= INITIALIZATION ==================================== #
 
 from xreport.compat import setup_logging, load_config
+from xreport.client import get_client
+from xreport.client import get_executor
+from xreport.client import query_memo
+from xreport.ledger import query_ledger
+from xreport.client import _retry_after
 
 proj_home = os.path.realpath(os.path.join(os.path.dirname(__file__), '../'))
 config = load_config(proj_home=proj_home)
 logger = setup_logging(__name__, proj_home=proj_home,
                         level=config.get('LOGGING_LEVEL', 'INFO'),
                         attach_stdout=config.get('LOG_STDOUT', False))
+# Aggregates of the Classic index files (usage tables and full text counts) kept in memory for as
+# long as the process runs, keyed on the full path of their cache file. Every entry records the
+# signature (modification time and size) of the index file it was compiled from: an entry is only
+# used while the index file has the same signature (and, for full text counts, the same set of
+# journals), and it is replaced when the aggregate is compiled again
+_resident = {}
+# Total size (in bytes) of the response cache directories, keyed on directory
+_response_cache_size = {}
+_response_cache_lock = threading.Lock()
 # Exception definitions
 class GoogleUploadException(Exception):
     pass
@@ -29,13 +55,23 @@ class GoogleManagerException(Exception):
 
 class FolderIdNotFound(Exception):
     pass
+
+class APIRequestException(Exception):
+    """Failed ADS API request, with the HTTP status code and requested wait time (if any)"""
+    def __init__(self, msg, status_code=None, retry_after=None):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.retry_after = retry_after
 # =============================== HELPER FUNCTIONS ================================ #
-def retry(tries=4, delay=3, backoff=1):
+def retry(tries=4, delay=3, backoff=1, max_delay=60, jitter=True):
     """A so-called decorator function implementing a retry-on-exception functionality"""
     # tries: the number of attempts to retry
     # delay: the number of seconds to wait between retries
     # backoff: a multiplier option (larger than 1 means that wait times increase by this factor)
-    # logger: file handle of log file (None means that messages are written to stdout)
+    # max_delay: the maximum number of seconds to wait between retries
+    # jitter: randomize wait times (between half and the full wait time), so that concurrent callers spread out
+    # Permanent failures (see _is_retryable) are raised right away, and if the server told us how long
+    # to wait (Retry-After header), that wait time is used instead (but never more than max_delay)
     def deco_retry(func):
         @functools.wraps(func)
         def f_retry(*args, **kwargs):
@@ -45,9 +81,18 @@ def retry(tries=4, delay=3, backoff=1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    msg = f"Exception '{e}' while querying API, retrying in {m_delay} seconds..."
+                    if not _is_retryable(e):
+                        raise
+                    wait = getattr(e, 'retry_after', None)
+                    if wait is None:
+                        wait = min(m_delay, max_delay)
+                        if jitter:
+                            wait = random.uniform(wait / 2, wait)
+                    else:
+                        wait = min(wait, max_delay)
+                    msg = f"Exception '{e}' while querying API, retrying in {wait:.1f} seconds..."
                     logger.warning(msg)
-                    time.sleep(m_delay)
+                    time.sleep(wait)
                     m_tries -= 1
                     m_delay *= backoff
 
@@ -56,6 +101,24 @@ def retry(tries=4, delay=3, backoff=1):
         return f_retry
     return deco_retry
 
+def _is_retryable(err):
+    """
+    Determine whether a failed request may succeed when retried. Client errors (4xx, except
+    for timeouts and rate limiting) and requests that cannot be sent (e.g. an invalid URL)
+    are permanent; server errors, rate limiting, timeouts, connection errors and invalid
+    responses are not
+
+    param: err: the exception raised by the failed request
+    """
+    if isinstance(err, (requests.exceptions.URLRequired, requests.exceptions.MissingSchema,
+                        requests.exceptions.InvalidSchema, requests.exceptions.InvalidURL,
+                        requests.exceptions.InvalidHeader)):
+        return False
+    status_code = getattr(err, 'status_code', None)
+    if status_code is None:
+        return True
+    return status_code in (408, 429) or status_code >= 500
+
 def _group(lst, n):
     """
     Transform a list of values into a list of tuples of length n
@@ -98,31 +161,194 @@ def _make_dict(tup, key_is_int=True):
         newtup = [(int(re.sub("[^0-9]", "", e[0])), e[1]) for e in tup]        
     return dict(newtup)
 
-@retry(tries=5)
+def _file_signature(data_file):
+    """
+    Return the modification time and size of a file, used to detect changes
+
+    param: data_file: full path of the file
+    """
+    st = os.stat(data_file)
+    return (st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=None)
+def _code_version():
+    """
+    Return a checksum of the source code of the xreport package, identifying the code version
+    """
+    checksum = hashlib.sha1()
+    package_dir = os.path.dirname(os.path.realpath(__file__))
+    for fname in sorted(os.listdir(package_dir)):
+        if fname.endswith('.py'):
+            with open(os.path.join(package_dir, fname), 'rb') as fh:
+                checksum.update(fname.encode('utf-8'))
+                checksum.update(fh.read())
+    return checksum.hexdigest()
+
+def _cache_file(conf, config_key, data_file, suffix):
+    """
+    Return the full path of a cache file (e.g. a sidecar or aggregate) for a data file.
+    Cache files are stored in the directory specified by a config variable, or next to
+    the data file if no cache directory was specified
+
+    param: conf: dictionary with configuration values
+    param: config_key: config variable holding the cache directory
+    param: data_file: full path of the data file
+    param: suffix: suffix identifying the type of cache file
+    """
+    cache_dir = conf.get(config_key) or os.path.dirname(data_file)
+    return "{0}/{1}.{2}".format(cache_dir, os.path.basename(data_file), suffix)
+
+def _load_pickle(cache_file):
+    """
+    Load data from a cache file. Returns None if the cache file does not exist or is unreadable
+
+    param: cache_file: full path of the cache file
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as fh:
+            return pickle.load(fh)
+    except Exception as err:
+        logger.warning('Unable to read cache file {0}: {1}'.format(cache_file, err))
+        return None
+
+def _save_pickle(data, cache_file):
+    """
+    Save data to a cache file. The data is written to a temporary file first, so that
+    concurrent processes never see a partially written cache file
+
+    param: data: the data to save
+    param: cache_file: full path of the cache file
+    """
+    tmp_file = "{0}.{1}.{2}.tmp".format(cache_file, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'wb') as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except Exception as err:
+        logger.warning('Unable to write cache file {0}: {1}'.format(cache_file, err))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
 def _do_query(conf, params, endpoint='search/query'):
+    """
+    Do a query on the ADS API (essentially, any API defined by config values). During
+    a run, identical queries are sent only once (see QueryMemo) and all queries are
+    recorded in the query ledger (see QueryLedger)
+    
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    """
+    # Details on how the query was answered, filled in by _cached_query and _send_query
+    # (if neither of them is called, the response came from the memo)
+    call = {'source': 'memo', 'attempts': 0}
+    started = time.time()
+    r_json = None
+    error = None
+    try:
+        # Pages of records are not kept in memory
+        paged = isinstance(params, dict) and ('start' in params or 'cursorMark' in params)
+        if query_memo.enabled and not paged:
+            r_json = query_memo.get(_query_key(conf, params, endpoint), functools.partial(_cached_query, conf, params, endpoint, call))
+        else:
+            r_json = _cached_query(conf, params, endpoint, call)
+        return r_json
+    except Exception as err:
+        error = str(err)
+        raise
+    finally:
+        if query_ledger.enabled:
+            _record_query(conf, params, endpoint, call, r_json, error, started, time.time() - started)
+
+def _cached_query(conf, params, endpoint='search/query', call=None):
+    """
+    Do a query on the ADS API. If a cache directory has been configured, responses are
+    cached on disk, so that identical queries (within the time-to-live of the cache)
+    do not need to be sent again
+    
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    param: call: dictionary for details on how the query was answered
+    """
+    call = call if call is not None else {}
+    use_cache = conf.get('ADS_API_CACHE') and not conf.get('NO_CACHE', False)
+    if use_cache:
+        cache_file = _response_cache_file(conf, params, endpoint)
+        # With a cache refresh, cached responses are ignored (but replaced by new ones)
+        if not conf.get('REFRESH_CACHE', False):
+            r_json = _load_cached_response(conf, cache_file)
+            if r_json is not None:
+                call['source'] = 'cache'
+                return r_json
+    call['source'] = 'api'
+    r_json = _send_query(conf, params, endpoint, call)
+    if use_cache:
+        _save_cached_response(conf, r_json, cache_file)
+    return r_json
+
+def _record_query(conf, params, endpoint, call, response, error, started, latency):
+    """
+    Record an API query in the query ledger
+
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    param: call: dictionary with details on how the query was answered
+    param: response: the API response (None if the query failed)
+    param: error: the error message (None if the query succeeded)
+    param: started: time (epoch seconds) the query was started
+    param: latency: wall time (in seconds) of the query
+    """
+    key = _query_key(conf, params, endpoint)
+    response = response if isinstance(response, dict) else {}
+    query_ledger.record({
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'endpoint': endpoint,
+        'fingerprint': hashlib.sha1(key.encode('utf-8')).hexdigest()[:12],
+        'query': params.get('q') if isinstance(params, dict) else params,
+        'source': call['source'],
+        'latency': round(latency, 4),
+        'qtime': response.get('responseHeader', {}).get('QTime'),
+        'num_found': response.get('response', {}).get('numFound'),
+        'bytes': call.get('bytes'),
+        'retries': max(call['attempts'] - 1, 0),
+        'report': conf.get('LEDGER_REPORT'),
+        'collection': conf.get('LEDGER_COLLECTION'),
+        'error': error
+    })
+
+@retry(tries=5, delay=1, backoff=2)
+def _send_query(conf, params, endpoint='search/query', call=None):
     """
     Send of a query to the ADS API (essentially, any API defined by config values)
     
     param: conf: dictionary with configuration values
     param: params: idctionary with query parameters
+    param: endpoint: the API endpoint
+    param: call: dictionary for details on how the query was answered
     """
-    headers = {}
-    headers["Authorization"] = "Bearer {}".format(conf['ADS_API_TOKEN'])
-    headers["Accept"] = "application/json"
+    if call is not None:
+        call['attempts'] = call.get('attempts', 0) + 1
     if isinstance(params, str):
         url = "{}/{}/{}".format(conf['ADS_API_URL'], endpoint, params)
     else:
-        url = "{}/{}?{}".format(conf['ADS_API_URL'], endpoint, urllib.parse.urlencode(params))
+        url = "{}/{}?{}".format(conf['ADS_API_URL'], endpoint, urllib.parse.urlencode(params, doseq=True))
     r_json = {}
     try:
-        r = requests.get(url, headers=headers)
+        r = get_client(conf).get(url)
     except Exception as err:
         logger.error("Search API request failed: {}: {}".format(err, url))
         raise
+    if call is not None:
+        call['bytes'] = len(r.content)
     if not r.ok:
         msg = "Search API request with error code '{}': {}".format(r.status_code, url)
         logger.error(msg)
-        raise Exception(msg)
+        raise APIRequestException(msg, status_code=r.status_code, retry_after=_retry_after(r.headers))
     else:
         try:
             r_json = r.json()
@@ -134,6 +360,114 @@ def _do_query(conf, params, endpoint='search/query'):
             return r_json
     return r_json
 
+def _query_key(conf, params, endpoint):
+    """
+    Return a string identifying an API query: the API URL, endpoint and
+    query parameters (in canonical order)
+
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    """
+    if not isinstance(params, str):
+        params = sorted((k, v) for k, v in params.items())
+    return json.dumps([conf['ADS_API_URL'], endpoint, params], default=str)
+
+def _response_cache_file(conf, params, endpoint):
+    """
+    Return the full path of the cache file for an API query. The file name is
+    a hash of the string identifying the query
+
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    """
+    key = _query_key(conf, params, endpoint)
+    return "{0}/{1}.json".format(conf['ADS_API_CACHE'], hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+def _load_cached_response(conf, cache_file):
+    """
+    Load a cached API response. Returns None if there is no cached response or if
+    it is older than the time-to-live of the cache
+
+    param: conf: dictionary with configuration values
+    param: cache_file: full path of the cache file
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file) as fh:
+            cached = json.load(fh)
+    except Exception as err:
+        logger.warning('Unable to read cache file {0}: {1}'.format(cache_file, err))
+        return None
+    if not isinstance(cached, dict) or time.time() - cached.get('time', 0) > conf.get('ADS_API_CACHE_TTL', 86400):
+        return None
+    # Mark the cache file as recently used
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+    return cached['response']
+
+def _save_cached_response(conf, response, cache_file):
+    """
+    Save an API response to the cache (as JSON) and, if the cache has become too large,
+    remove the least recently used responses. The size of the cache is kept as a running
+    total, so that the cache directory is only scanned when responses need to be removed
+
+    param: conf: dictionary with configuration values
+    param: response: the API response (decoded JSON)
+    param: cache_file: full path of the cache file
+    """
+    cache_dir = conf['ADS_API_CACHE']
+    tmp_file = "{0}.{1}.{2}.tmp".format(cache_file, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_file, 'w') as fh:
+            json.dump({'time': time.time(), 'response': response}, fh)
+        size = os.path.getsize(tmp_file)
+        replaced = os.path.getsize(cache_file) if os.path.exists(cache_file) else 0
+        os.replace(tmp_file, cache_file)
+    except Exception as err:
+        logger.warning('Unable to write cache file {0}: {1}'.format(cache_file, err))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return
+    max_size = conf.get('ADS_API_CACHE_SIZE', 500) * 1024 * 1024
+    with _response_cache_lock:
+        if cache_dir not in _response_cache_size:
+            _response_cache_size[cache_dir] = _evict_cached_responses(cache_dir, max_size)
+        else:
+            _response_cache_size[cache_dir] += size - replaced
+            if _response_cache_size[cache_dir] > max_size:
+                # Remove responses until the cache is well below its maximum size, so that
+                # the next writes do not each need a scan of the cache directory
+                _response_cache_size[cache_dir] = _evict_cached_responses(cache_dir, 0.9 * max_size)
+
+def _evict_cached_responses(cache_dir, max_size):
+    """
+    Remove the least recently used responses from the cache until its size is at most
+    max_size (in bytes) and return the size of the cache
+
+    param: cache_dir: the cache directory
+    param: max_size: the maximum size of the cache (in bytes)
+    """
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(cache_dir) if e.name.endswith('.json')]
+    except OSError:
+        return 0
+    total_size = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+    return total_size
+
 # =============================== DATA RETRIEVAL FUNCTIONS ==================== #
 
 def _get_citations(conf, query_string):
@@ -194,40 +528,165 @@ def _get_facet_data(conf, query_string, facet):
     else:
         return res_dict
 
-def _get_records(conf, query_string, return_fields):
+def _get_query_counts(conf, query_string, facet_queries):
+    """
+    Get the number of records for a query, together with the number of records
+    within that set matching each of a number of additional queries, via a single
+    ADS API facet query (one "facet.query" per additional query)
+    
+    param: conf: dictionary with configuration values
+    param: query_string: the query string for the set of records
+    param: facet_queries: dictionary of (label, additional query) pairs
+    """
+    params = {
+        'q':query_string,
+        'fl': 'id',
+        'rows': 0,
+        'facet':'on',
+        'facet.query': list(facet_queries.values())
+    }
+    data = _do_query(conf, params)
+    try:
+        num_found = int(data['response']['numFound'])
+        counts = data['facet_counts']['facet_queries']
+    except:
+        raise Exception('Solr returned unexpected data!')
+    # Return the total number of records and the counts per label
+    return num_found, {label: counts.get(fq, 0) for label, fq in facet_queries.items()}
+
+def _get_records(conf, query_string, return_fields, sort='id asc', rows=1000, workers=None):
     """
-    Do a general ADS API query
+    Do a general ADS API query, returning a generator of records. Results are
+    retrieved page by page (using Solr cursors, or in parallel using start offsets)
+    and yielded in order as they arrive
     
     param: conf: dictionary with configuration values
     param: query_string: the query string to execute pivot query on
     param: return_fields: which Solr fields to return
+    param: sort: sort order of the records (must end with the unique key 'id' for cursors)
+    param: rows: number of records per page
+    param: workers: number of pages retrieved in parallel (default from config, cursors if 1)
     """
-    start = 0
-    rows = 1000
-    results = []
+    if workers is None:
+        workers = conf.get('ADS_API_PAGE_WORKERS', 1)
     params = {
         'q':query_string,
         'fl': return_fields,
         'rows': rows,
-        'start': start
+        'sort': sort
     }
-    data = _do_query(conf, params)
+    if workers > 1:
+        for docs in _get_records_parallel(conf, params, workers):
+            for doc in docs:
+                yield doc
+        return
+    params['cursorMark'] = '*'
+    while True:
+        data = _do_query(conf, params)
+        docs = _get_docs(data)
+        for doc in docs:
+            yield doc
+        # The last page has been reached when the cursor does not change anymore
+        next_cursor = data.get('nextCursorMark')
+        if not docs or not next_cursor or next_cursor == params['cursorMark']:
+            break
+        params['cursorMark'] = next_cursor
+
+def _get_records_parallel(conf, params, workers):
+    """
+    Retrieve all pages of a query with a pool of workers. Once the first page
+    is in, the number of pages is known and the remaining pages are requested
+    (by start offset) in parallel. Pages are yielded in order, with only a
+    limited number of pages requested ahead of the page being consumed
+
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters (without start offset)
+    param: workers: number of pages retrieved in parallel
+    """
+    rows = params['rows']
+    data = _do_query(conf, dict(params, start=0))
+    yield _get_docs(data)
+    num_documents = int(data['response']['numFound'])
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(rows, num_documents, rows):
+            pending.append(executor.submit(_do_query, conf, dict(params, start=start)))
+            if len(pending) >= 2*workers:
+                yield _get_docs(pending.popleft().result())
+        while pending:
+            yield _get_docs(pending.popleft().result())
+
+def _get_docs(data):
+    """
+    Get the records from the results of a Solr query
+
+    param: data: results of a Solr query
+    """
     try:
-        results = data['response']['docs']
+        return data['response']['docs']
     except:
         raise Exception('Solr returned unexpected data!')
-    num_documents = int(data['response']['numFound'])
-    num_paginates = int(math.ceil((num_documents) / (1.0*rows))) - 1
-    start += rows
-    for i in range(num_paginates):
-        params['start'] = start
-        data = _do_query(conf, params)
-        try:
-            results += data['response']['docs']
-        except:
-            raise Exception('Solr returned unexpected data!')
-        start += rows
-    return results
+
+# =============================== ASYNC DATA RETRIEVAL ======================== #
+
+async def _run_async(conf, func, *args, **kwargs):
+    """
+    Run a blocking API function in the thread pool for async API calls, so that one
+    event loop can keep many queries in flight. The calls share the pooled API client
+    (and its rate limiter) with all other queries in this process
+    
+    param: conf: dictionary with configuration values
+    param: func: the function to run
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(conf), functools.partial(func, *args, **kwargs))
+
+async def _do_query_async(conf, params, endpoint='search/query'):
+    """
+    Async variant of _do_query
+    
+    param: conf: dictionary with configuration values
+    param: params: dictionary with query parameters
+    param: endpoint: the API endpoint
+    """
+    return await _run_async(conf, _do_query, conf, params, endpoint)
+
+async def _get_citations_async(conf, query_string):
+    """
+    Async variant of _get_citations
+    
+    param: conf: dictionary with configuration values
+    param: query_string: the query string to execute pivot query on
+    """
+    return await _run_async(conf, _get_citations, conf, query_string)
+
+async def _get_facet_data_async(conf, query_string, facet):
+    """
+    Async variant of _get_facet_data
+    
+    param: conf: dictionary with configuration values
+    param: query_string: the query string to execute pivot query on
+    param: facet: the facet to return
+    """
+    return await _run_async(conf, _get_facet_data, conf, query_string, facet)
+
+async def _get_records_async(conf, query_string, return_fields, **kwargs):
+    """
+    Async variant of _get_records: an async generator of records. The records are
+    taken from the blocking generator a page at a time
+    
+    param: conf: dictionary with configuration values
+    param: query_string: the query string to execute pivot query on
+    param: return_fields: which Solr fields to return
+    """
+    records = _get_records(conf, query_string, return_fields, **kwargs)
+    rows = kwargs.get('rows', 1000)
+    while True:
+        docs = await _run_async(conf, list, itertools.islice(records, rows))
+        if not docs:
+            break
+        for doc in docs:
+            yield doc
 
 def _get_usage(config, jrnls=[], bibcodes=[], udata='reads'):
     """
@@ -238,21 +697,288 @@ def _get_usage(config, jrnls=[], bibcodes=[], udata='reads'):
     param: bibcodes: a list of bibcodes, if specified
     param: udata: what type of usage data to return
     """
+    if jrnls and not bibcodes:
+        # Usage data for journals can be compiled from the usage totals per bibstem
+        return _sum_usage(_get_usage_totals(config, udata=udata), jrnls)
     total = 0
     recent = 0
     index_file = config.get('CLASSIC_USAGE_INDEX')[udata]
+    include = set([j.encode('utf-8') for j in jrnls]) or None
+    bibcodes = set([b.encode('utf-8') for b in bibcodes])
     # Cycle through index file and get usage data for either specific journals or bibcodes
-    with open(index_file) as fh:
-        for line in fh:
-           data = line.strip().split('\t')
-           if jrnls and data[0][4:9] not in jrnls:
-               continue
-           elif bibcodes and data[0] not in bibcodes:
-               continue
-           total += sum([int(d) for d in data[1:]])
-           recent += int(data[-1])
+    for lines, offset in _scan_index(index_file, include=include):
+        if bibcodes:
+            lines = [l for l in lines if l.partition(b'\t')[0] in bibcodes]
+        bibstems, usage = _parse_usage_lines(lines)
+        total += int(usage.sum())
+        recent += int(usage[:, -1].sum())
     return total, recent
 
+def _get_usage_totals(config, udata='reads'):
+    """
+    Return usage totals and recent usage per bibstem (as in bibcodes)
+
+    param: conf: dictionary with configuration values
+    param: udata: what type of usage data to return
+    """
+    table = _get_usage_table(config, udata=udata)
+    totals = table['usage'].sum(axis=1).tolist()
+    recents = table['usage'][:, -1].tolist()
+    return dict(zip(table['bibstems'], zip(totals, recents)))
+
+def _get_usage_table(config, udata='reads'):
+    """
+    Return a table with usage per bibstem (as in bibcodes) and per column of a Classic
+    usage index file (where the last column is the recent usage). The table is compiled
+    in a single pass through the index file and stored in a sidecar file, which is
+    used for as long as the index file does not change
+
+    param: conf: dictionary with configuration values
+    param: udata: what type of usage data to return
+    """
+    index_file = config.get('CLASSIC_USAGE_INDEX')[udata]
+    signature = _file_signature(index_file)
+    cache_file = _cache_file(config, 'CLASSIC_INDEX_CACHE', index_file, 'usage.pkl')
+    table = _resident.get(cache_file)
+    if table and table['signature'] == signature:
+        return table
+    table = _load_pickle(cache_file)
+    if table and table['signature'] == signature:
+        _resident[cache_file] = table
+        return table
+    logger.info('Compiling usage table from {0}'.format(index_file))
+    stem_usage = {}
+    for lines, offset in _scan_index(index_file):
+        bibstems, usage = _parse_usage_lines(lines)
+        if not len(bibstems):
+            continue
+        # Aggregate the usage numbers per bibstem
+        stems, idx = np.unique(bibstems, return_inverse=True)
+        sums = np.zeros((len(stems), usage.shape[1]), dtype=np.int64)
+        np.add.at(sums, idx, usage)
+        for bibstem, row in zip(stems.tolist(), sums):
+            bibstem = bibstem.decode('utf-8', 'replace')
+            prev = stem_usage.get(bibstem, np.zeros(0, dtype=np.int64))
+            width = max(len(prev), len(row))
+            stem_usage[bibstem] = _pad_left(prev, width) + _pad_left(row, width)
+    bibstems = sorted(stem_usage.keys())
+    width = max([len(u) for u in stem_usage.values()] + [1])
+    usage = np.zeros((len(bibstems), width), dtype=np.int64)
+    for i, bibstem in enumerate(bibstems):
+        usage[i] = _pad_left(stem_usage[bibstem], width)
+    table = {'signature': signature, 'bibstems': bibstems, 'usage': usage}
+    _save_pickle(table, cache_file)
+    _resident[cache_file] = table
+    return table
+
+def _pad_left(values, width):
+    """
+    Pad an array of usage numbers with zeros on the left (so that the last
+    column, with recent usage, stays aligned)
+
+    param: values: the array to pad
+    param: width: the length of the padded array
+    """
+    return np.concatenate([np.zeros(width - len(values), dtype=np.int64), values])
+
+def _sum_usage(totals, jrnls):
+    """
+    Return the total and recent usage for a set of journals from the usage totals per bibstem
+
+    param: totals: dictionary with usage totals and recent usage per bibstem
+    param: jrnls: a list of bibstems (as in bibcodes)
+    """
+    usage = [totals.get(j, (0, 0)) for j in set(jrnls)]
+    return sum([u[0] for u in usage]), sum([u[1] for u in usage])
+
+def _get_fulltext_counts(conf, include, use_year=False):
+    """
+    Aggregate the Classic full text index into the number of records with full text
+    per journal, volume (or year) and source class ('arxiv' or 'publisher').
+    The aggregate is persisted, together with the byte offset and checksum of the part
+    of the index processed, and the modification time and size of the index. Subsequent
+    calls only process lines appended to the index, unless the processed part of the index
+    has changed (or the index was modified without growing).
+
+    param: conf: dictionary with configuration values
+    param: include: the bibstems (as in bibcodes) to aggregate the index for
+    param: use_year: aggregate by year instead of volume if true
+    """
+    include = set(include)
+    index_file = conf.get('CLASSIC_FULLTEXT_INDEX')
+    aggregation = 'year' if use_year else 'volume'
+    cache_file = _cache_file(conf, 'CLASSIC_INDEX_CACHE', index_file, '{0}.pkl'.format(aggregation))
+    signature = hashlib.sha1("\t".join(sorted(include)).encode('utf-8')).hexdigest()
+    # Use the aggregate in memory if the index file has not changed since it was made
+    index_signature = _file_signature(index_file)
+    resident = _resident.get(cache_file)
+    if resident and resident['include'] == signature and resident['index'] == index_signature:
+        return resident['counts']
+    aggregate = _load_pickle(cache_file)
+    with open(index_file, 'rb') as fh:
+        st = os.fstat(fh.fileno())
+        checksum = hashlib.sha1()
+        # Can we continue from a previously stored aggregate? Not if the index was modified
+        # without growing (i.e. it was rewritten), nor if any byte of the processed part changed
+        resume = False
+        if aggregate and aggregate['include'] == signature and aggregate['offset'] <= st.st_size and \
+                not (st.st_size == aggregate.get('size') and st.st_mtime_ns != aggregate.get('mtime_ns')):
+            resume = _update_checksum(checksum, fh, 0, aggregate['offset']).hexdigest() == aggregate['checksum']
+        if resume:
+            counts = aggregate['counts']
+            offset = aggregate['offset']
+        else:
+            checksum = hashlib.sha1()
+            counts = Counter()
+            offset = 0
+        # Only complete lines are processed: an incomplete last line will be picked up by the next run
+        start = offset
+        include_bytes = set([i.encode('utf-8') for i in include])
+        for lines, offset in _scan_index(index_file, include=include_bytes, offset=offset, resume=True):
+            for line in lines:
+                _count_fulltext_line(conf, line.decode('utf-8', 'replace'), include, use_year, counts)
+        _update_checksum(checksum, fh, start, offset)
+    # Store the aggregate, with the information needed to process appended lines only
+    aggregate = {'include': signature, 'offset': offset, 'checksum': checksum.hexdigest(),
+                 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'counts': counts}
+    _save_pickle(aggregate, cache_file)
+    _resident[cache_file] = {'include': signature, 'index': index_signature, 'counts': counts}
+    return counts
+
+def _count_fulltext_line(conf, line, include, use_year, counts):
+    """
+    Update the full text counts with a line from the Classic full text index
+
+    param: conf: dictionary with configuration values
+    param: line: line from the Classic full text index
+    param: include: set of bibstems (as in bibcodes) to aggregate the index for
+    param: use_year: aggregate by year instead of volume if true
+    param: counts: the counts to update
+    """
+    try:
+        bibcode, ftfile, source = line.strip().split('\t')
+    except ValueError:
+        return
+    bibstem = bibcode[4:9]
+    if bibstem not in include:
+        return
+    # If we report per journal volume, we do not want tmp bibcodes
+    if bibcode[9:13].replace('.','') == 'tmp' and not use_year:
+        return
+    # Whether we report by year or volume, we use the same variable
+    try:
+        if use_year:
+            data_key = int(bibcode[0:4])
+        else:
+            data_key = int(bibcode[9:13].replace('.',''))
+    except:
+        logger.info("Processing Classic fulltext index. Cannot get year or volume for: {0}. Skipping...".format(bibcode))
+        return
+    if bibstem in conf.get('YEAR_IS_VOL', {}) and not use_year:
+        data_key = int(bibcode[0:4])
+    if bibstem == 'ApJ..' and bibcode[13] == 'L':
+        bibstem = 'ApJL'
+    if source.lower() == 'arxiv':
+        counts[(bibstem, data_key, 'arxiv')] += 1
+    else:
+        counts[(bibstem, data_key, 'publisher')] += 1
+
+def _update_checksum(checksum, fh, start, end, blocksize=16777216):
+    """
+    Add a part of a file (from one byte offset up to another) to a checksum. The checksum of the
+    processed part of an index file is built up this way, so that it covers every byte of that part
+    and can be extended with the lines appended later without reading the file twice
+
+    param: checksum: the checksum (a hashlib object) to update
+    param: fh: file handle of file opened in binary mode
+    param: start: the byte offset of the start of the part
+    param: end: the byte offset of the end of the part
+    param: blocksize: the number of bytes read at a time
+    """
+    fh.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = fh.read(min(blocksize, remaining))
+        if not block:
+            break
+        checksum.update(block)
+        remaining -= len(block)
+    return checksum
+
+def _scan_index(index_file, include=None, offset=0, blocksize=16777216, resume=False):
+    """
+    Scan a Classic index file (memory-mapped) in blocks and yield, for each block, the
+    lines (as bytes) for which the bibstem part of the bibcode is in include, together
+    with the byte offset of the end of the block. Lines are filtered on bibstem before
+    anything is decoded.
+
+    param: index_file: full path of the Classic index file
+    param: include: set of bibstems (as bytes, like in bibcodes) or None for all lines
+    param: offset: byte offset to start scanning from
+    param: blocksize: the (approximate) number of bytes processed per block
+    param: resume: if true, a last line without a newline is left for the next scan, which
+                   continues from the offset returned (the line may still be being written);
+                   otherwise it is yielded as well
+    """
+    with open(index_file, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = offset
+            while pos < size:
+                # Every block ends at the end of a line
+                end = mm.rfind(b'\n', pos, min(pos + blocksize, size))
+                if end < 0:
+                    end = mm.find(b'\n', pos + blocksize)
+                if end < 0:
+                    # The remainder of the file is a line without a newline
+                    if resume:
+                        break
+                    end = size
+                else:
+                    end += 1
+                lines = mm[pos:end].split(b'\n')
+                if not lines[-1]:
+                    lines.pop()
+                if include is not None:
+                    lines = [l for l in lines if l[4:9] in include]
+                yield lines, end
+                pos = end
+
+def _parse_usage_lines(lines):
+    """
+    Parse lines from a Classic usage index file in bulk. Return the bibstems (as bytes)
+    and a matrix with the usage numbers for each line. Lines with fewer columns are
+    padded on the left, so that the last column always holds the recent usage.
+
+    param: lines: list of lines (as bytes) from a Classic usage index file
+    """
+    bibcodes = []
+    numbers = []
+    for line in lines:
+        bibcode, sep, nums = line.strip().partition(b'\t')
+        if nums:
+            bibcodes.append(bibcode)
+            numbers.append(nums)
+    if not numbers:
+        return np.array([], dtype='S5'), np.zeros((0, 1), dtype=np.int64)
+    # Parse all numerical columns at once
+    ncols = np.array([n.count(b'\t') + 1 for n in numbers])
+    try:
+        values = np.array(b'\t'.join(numbers).split(b'\t'), dtype='S').astype(np.int64)
+    except ValueError:
+        raise ValueError('Found non-numerical usage data in Classic usage index') from None
+    ends = np.cumsum(ncols)
+    # Position of every value in the (right aligned) usage matrix
+    width = ncols.max()
+    rows = np.repeat(np.arange(len(numbers)), ncols)
+    cols = np.arange(len(values)) - np.repeat(ends, ncols) + width
+    usage = np.zeros((len(numbers), width), dtype=np.int64)
+    usage[rows, cols] = values
+    bibstems = np.array([b[4:9] for b in bibcodes], dtype='S5')
+    return bibstems, usage
+
 def _get_journal_coverage(conf, jrnl):
     """
     Get metadata completeness statistics from Journals Database for a given journal